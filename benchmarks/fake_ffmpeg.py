@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Stand-in for the ffmpeg binary in load tests (FFMPEG_BIN=benchmarks/fake_ffmpeg.py).
+
+Understands the arguments StreamManager passes: `-progress pipe:N`, relay
+input on stdin (`-i pipe:0`), relay output on stdout (`pipe:1`) and
+`-stats_enc_post pipe:N` for transcoded outputs (one "{fidx} {n} {t}" line
+per frame, at FAKE_FFMPEG_ENCODE_SPEED times realtime).
+Behaviour is set through the environment:
+
+  FAKE_FFMPEG_MODE        run (default), hang (no output, ignores SIGTERM) or exit (exit 0 at once)
+  FAKE_FFMPEG_INTERVAL    seconds between progress blocks (default 1.0)
+  FAKE_FFMPEG_BITRATE     reported and relayed kbit/s (default 2500)
+  FAKE_FFMPEG_FAIL_AFTER  seconds until a simulated connection failure (default: never)
+  FAKE_FFMPEG_FAIL_RATIO  fraction of processes that fail (default 1.0)
+  FAKE_FFMPEG_ENCODE_SPEED  media seconds encoded per second by each transcoded output (default 1.0)
+  FAKE_FFMPEG_STARTUP     seconds of input probing and connecting before the first output (default 0)
+  FAKE_FFMPEG_STALL_AFTER seconds until the output silently stops growing while progress
+                          blocks and log lines go on, like a stalled destination (default: never)
+
+out_time_us carries the wall-clock time the block was written, so a client
+can measure status latency end to end.
+"""
+import os
+import random
+import signal
+import sys
+import threading
+import time
+
+TS_PACKET = b'\x47' + b'\x00' * 187
+PAT_PACKET = b'\x47\x40\x00' + b'\x00' * 185
+
+
+def write(fd, data):
+    try:
+        os.write(fd, data)
+        return True
+    except OSError:
+        return False  # Like ffmpeg, keep going when a log or progress reader went away
+
+
+def drain_stdin(done):
+    while True:
+        try:
+            if not os.read(0, 65536):
+                break
+        except OSError:
+            break
+    done.set()
+
+
+def encoded_outputs(args):
+    """(output index, stats fd) of every output with -stats_enc_post."""
+    outputs, index, stats_fd = [], 0, None
+    for i, arg in enumerate(args):
+        if arg.startswith('-stats_enc_post') and not arg.startswith('-stats_enc_post_fmt'):
+            stats_fd = int(args[i + 1].split(':')[1])
+        elif arg == '-f' and i + 2 < len(args) and not args[i + 2].startswith('-'):
+            # '-f <format> <url>' ends an output; '-f mpegts -i pipe:0' is the relay input
+            if stats_fd is not None:
+                outputs.append((index, stats_fd))
+            index += 1
+            stats_fd = None
+    return outputs
+
+
+def main(args):
+    mode = os.environ.get('FAKE_FFMPEG_MODE', 'run')
+    interval = float(os.environ.get('FAKE_FFMPEG_INTERVAL', 1.0))
+    bitrate = float(os.environ.get('FAKE_FFMPEG_BITRATE', 2500))
+    fail_after = os.environ.get('FAKE_FFMPEG_FAIL_AFTER')
+    fail_ratio = float(os.environ.get('FAKE_FFMPEG_FAIL_RATIO', 1.0))
+    encode_speed = float(os.environ.get('FAKE_FFMPEG_ENCODE_SPEED', 1.0))
+    startup = float(os.environ.get('FAKE_FFMPEG_STARTUP', 0))
+    stall_after = os.environ.get('FAKE_FFMPEG_STALL_AFTER')
+    stall_at = time.monotonic() + startup + float(stall_after) if stall_after is not None else None
+    encoders = encoded_outputs(args)
+    progress_fd = int(args[args.index('-progress') + 1].split(':')[1]) if '-progress' in args else 1
+    input_source = args[args.index('-i') + 1] if '-i' in args else ''
+    reads_stdin = input_source == 'pipe:0'
+    writes_stdout = args[-1] == 'pipe:1'
+
+    if mode == 'exit':
+        return 0
+    if mode == 'hang':
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        write(2, b'Input #0, flv, from stand-in (hanging)\n')
+        while True:
+            time.sleep(3600)
+
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(255))
+    input_done = threading.Event()
+    if reads_stdin:
+        threading.Thread(target=drain_stdin, args=(input_done,), daemon=True).start()
+    fail_at = None
+    if fail_after is not None and random.random() < fail_ratio:
+        fail_at = time.monotonic() + float(fail_after)
+
+    time.sleep(startup)
+    write(2, f'Input #0, flv, from {input_source!r}\n'.encode())
+    frame = total_size = 0
+    packets_per_block = max(1, int(bitrate * 1000 / 8 * interval / len(TS_PACKET)))
+    while not input_done.is_set():
+        if fail_at is not None and time.monotonic() >= fail_at:
+            write(2, f'{input_source}: Connection refused\n'.encode())
+            return 1
+        if writes_stdout:
+            if not write(1, PAT_PACKET + TS_PACKET * (packets_per_block - 1)):
+                return 1
+        for index, stats_fd in encoders:
+            first = round(frame * encode_speed)
+            lines = ''.join(f'{index} {n} {n / 30:.6f}\n' for n in range(first, first + int(30 * interval * encode_speed)))
+            write(stats_fd, lines.encode())
+        if stall_at is not None and time.monotonic() >= stall_at:
+            write(2, b'frame= stalled, still logging\n')
+        else:
+            frame += int(30 * interval)
+            total_size += packets_per_block * len(TS_PACKET)
+        block = (
+            f'frame={frame}\nfps=30.00\nbitrate={bitrate:.1f}kbits/s\n'
+            f'total_size={total_size}\nout_time_us={time.time_ns() // 1000}\n'
+            f'dup_frames=0\ndrop_frames=0\nspeed=1.00x\nprogress=continue\n'
+        )
+        write(progress_fd, block.encode())
+        time.sleep(interval)
+    write(progress_fd, b'progress=end\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Stand-in HLS origin for testing the preview relay (HLS_ORIGIN=http://127.0.0.1:8900).
+
+Any *.m3u8 path is a live media playlist with a window of rolling segments,
+any *.ts path a synthetic segment. GET /stats returns the request counts, so
+a test can check how often the relay went to the origin.
+
+    python benchmarks/fake_hls_origin.py --port 8900 --segment-seconds 2
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAT_PACKET = b'\x47\x40\x00' + b'\x00' * 185
+TS_PACKET = b'\x47' + b'\x00' * 187
+
+
+def make_handler(args, counts, lock):
+    segment = PAT_PACKET + TS_PACKET * (args.segment_kb * 1024 // len(TS_PACKET))
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def reply(self, body, content_type, status=200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            with lock:
+                counts[path] = counts.get(path, 0) + 1
+            if path == '/stats':
+                with lock:
+                    body = json.dumps({'requests': sum(counts.values()) - counts['/stats'], 'paths': counts})
+                self.reply(body.encode(), 'application/json')
+            elif path.endswith('.m3u8'):
+                stem = path.rsplit('/', 1)[1][:-len('.m3u8')]
+                newest = int(time.time() // args.segment_seconds)
+                lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{args.segment_seconds}',
+                         f'#EXT-X-MEDIA-SEQUENCE:{newest - args.window + 1}']
+                for sequence in range(newest - args.window + 1, newest + 1):
+                    lines += [f'#EXTINF:{args.segment_seconds:.3f},', f'{stem}-{sequence}.ts']
+                self.reply(('\n'.join(lines) + '\n').encode(), 'application/vnd.apple.mpegurl')
+            elif path.endswith('.ts'):
+                time.sleep(args.latency)
+                self.reply(segment, 'video/mp2t')
+            else:
+                self.reply(b'not found', 'text/plain', status=404)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--segment-seconds', type=int, default=2)
+    parser.add_argument('--window', type=int, default=5, help='segments listed per playlist')
+    parser.add_argument('--segment-kb', type=int, default=256)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds before a segment is served')
+    args = parser.parse_args()
+    counts = {'/stats': 0}
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, counts, threading.Lock()))
+    print(f'Fake HLS origin on http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
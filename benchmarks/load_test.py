@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Load test for StreamManager and its Socket.IO status broadcasts.
+
+Runs N simulated streams on the ffmpeg stand-in (fake_ffmpeg.py) behind a
+real Socket.IO server with M connected clients, then reports supervisor CPU
+per stream, emit throughput, end-to-end status latency, restart recovery
+time, memory growth and how long bulk start and stop take.
+
+    pip install "python-socketio[client]"   # client side of the harness
+    python benchmarks/load_test.py --streams 200 --clients 20 --duration 60
+    python benchmarks/load_test.py --streams 200 --fail-after 20 --baseline benchmarks/results/<earlier>.json
+
+Results are saved as JSON under benchmarks/results/ so runs of different
+versions can be compared with --baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+try:
+    import socketio as socketio_client
+    socketio_client.Client  # Needs the client extras (requests, websocket-client)
+except (ImportError, AttributeError):
+    sys.exit('The load test needs the Socket.IO client: pip install "python-socketio[client]"')
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+import stream_state
+from stream_manager import StreamManager, ADMIN_ROOM, user_room
+from resource_monitor import HostBudget
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--streams', type=int, default=50, help='simulated streams')
+    parser.add_argument('--clients', type=int, default=5, help='connected Socket.IO clients')
+    parser.add_argument('--owners', type=int, default=0,
+                        help='spread streams over this many users, each client following one of them (default: admin clients)')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds before measuring')
+    parser.add_argument('--fan-out', type=int, default=0, metavar='K',
+                        help='run streams as fan-out legs, K legs per shared ingest')
+    parser.add_argument('--progress-interval', type=float, default=1.0, help='stand-in seconds per progress block')
+    parser.add_argument('--fail-after', type=float, help='stand-in fails with a network error after this many seconds')
+    parser.add_argument('--fail-ratio', type=float, default=1.0, help='fraction of processes that fail')
+    parser.add_argument('--mode', choices=('run', 'hang', 'exit'), default='run', help='stand-in behaviour')
+    parser.add_argument('--ffmpeg', default=os.path.join(BENCH_DIR, 'fake_ffmpeg.py'), help='binary to run instead of ffmpeg')
+    parser.add_argument('--port', type=int, default=0, help='server port (default: any free port)')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results'), help='directory for result files')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    return parser.parse_args()
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': values[-1],
+            'mean': statistics.fmean(values), 'samples': len(values)}
+
+
+def thread_cpu_seconds(name):
+    """CPU time of the named thread of this process, from /proc."""
+    thread = next((t for t in threading.enumerate() if t.name == name), None)
+    if thread is None or thread.native_id is None:
+        return None
+    with open(f'/proc/self/task/{thread.native_id}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class StatusClient:
+    """One dashboard-like client that follows the versioned status deltas."""
+
+    def __init__(self, url, user=None):
+        self.messages = 0
+        self.latencies = []
+        self.recoveries = []
+        self.measuring = False
+        self._status = {}
+        self._written = {}
+        self._restarting_since = {}
+        self.sio = socketio_client.Client(reconnection=False)
+        self.sio.on('stream_status_update', self._on_update)
+        self.sio.connect(url, transports=['websocket'], auth={'user': user} if user else None)
+
+    def _on_update(self, update):
+        now = time.time()
+        self.messages += 1
+        for name, info in (update.get('streams') or {}).items():
+            status = info.get('status')
+            previous = self._status.get(name)
+            self._status[name] = status
+            if status == 'restarting' and previous != 'restarting':
+                self._restarting_since[name] = now
+            elif status == 'active' and name in self._restarting_since:
+                recovery = now - self._restarting_since.pop(name)
+                if self.measuring:
+                    self.recoveries.append(recovery)
+            # The stand-in writes its wall clock into out_time_us; deltas sent for
+            # other reasons (e.g. a status change) repeat the last value
+            written_us = (info.get('health') or {}).get('out_time_us') or 0
+            if written_us == self._written.get(name):
+                continue
+            self._written[name] = written_us
+            if self.measuring and written_us > 1e15:
+                self.latencies.append((now - written_us / 1e6) * 1000)
+
+
+def run(args):
+    os.environ['FAKE_FFMPEG_MODE'] = args.mode
+    os.environ['FAKE_FFMPEG_INTERVAL'] = str(args.progress_interval)
+    os.environ['FAKE_FFMPEG_FAIL_RATIO'] = str(args.fail_ratio)
+    if args.fail_after is not None:
+        os.environ['FAKE_FFMPEG_FAIL_AFTER'] = str(args.fail_after)
+    os.environ['FFMPEG_BIN'] = args.ffmpeg
+
+    app = Flask(__name__)
+    server = SocketIO(app, async_mode='threading', json=stream_state)
+    # No host budget: the harness measures the manager, not admission control
+    manager = StreamManager(server, runtime_dir=tempfile.mkdtemp(prefix='restream-bench-'), budget=HostBudget())
+    server.on_event('get_stream_status', lambda data=None: manager.get_status_snapshot())
+
+    def connect(auth=None):
+        # Like main.py: admins follow everything, users only their own streams
+        user = (auth or {}).get('user')
+        if user:
+            join_room(user_room(user))
+            manager.add_viewer(user)
+        else:
+            join_room(ADMIN_ROOM)
+    server.on_event('connect', connect)
+
+    port = args.port or free_port()
+    threading.Thread(
+        target=server.run, args=(app,),
+        kwargs={'host': '127.0.0.1', 'port': port, 'log_output': False,
+                'use_reloader': False, 'allow_unsafe_werkzeug': True},
+        name='bench-server', daemon=True
+    ).start()
+    time.sleep(1)
+    url = f'http://127.0.0.1:{port}'
+    clients = [StatusClient(url, f'user-{i % args.owners}' if args.owners else None) for i in range(args.clients)]
+
+    rss_before_streams = rss_mb()
+    started = time.monotonic()
+    names = [f'bench-{i}' for i in range(args.streams)]
+    for owner in range(max(1, args.owners)):
+        manager.start_streams([
+            {'stream_name': names[i], 'input_source': f'rtmp://bench/{i // args.fan_out if args.fan_out else i}',
+             'destination': f'rtmp://sink/{i}', 'stream_key': None, 'source_name': f'Bench {i}',
+             'fan_out': bool(args.fan_out)}
+            for i in range(args.streams) if not args.owners or i % args.owners == owner
+        ], f'user-{owner}' if args.owners else 'bench')
+    start_seconds = time.monotonic() - started
+
+    time.sleep(args.warmup)
+    for client in clients:
+        client.measuring = True
+    manager.supervisor.stats()  # Reset the loop lag maximum
+    cpu_before = thread_cpu_seconds('stream-supervisor')
+    process_before = os.times()
+    emits_before = manager.status_emits
+    messages_before = sum(c.messages for c in clients)
+    rss_before = rss_mb()
+
+    time.sleep(args.duration)
+
+    cpu_used = thread_cpu_seconds('stream-supervisor') - cpu_before
+    process_after = os.times()
+    process_used = (process_after.user + process_after.system) - (process_before.user + process_before.system)
+    supervisor = manager.supervisor.stats()
+    rss_after = rss_mb()
+    for client in clients:
+        client.measuring = False
+
+    results = {
+        'stream_start_seconds': start_seconds,
+        'supervisor_cpu_percent': 100 * cpu_used / args.duration,
+        'supervisor_cpu_ms_per_stream_second': 1000 * cpu_used / args.duration / max(1, args.streams),
+        'process_cpu_percent': 100 * process_used / args.duration,
+        'emits_per_second': (manager.status_emits - emits_before) / args.duration,
+        'client_messages_per_second': (sum(c.messages for c in clients) - messages_before) / args.duration,
+        'status_latency_ms': percentiles([l for c in clients for l in c.latencies]),
+        'restart_recovery_seconds': percentiles([r for c in clients for r in c.recoveries]),
+        'supervisor_loop_lag_max_ms': 1000 * supervisor['loop_lag_max_seconds'],
+        'ffmpeg_children': supervisor['children'],
+        'rss_mb_before_streams': rss_before_streams,
+        'rss_mb_start': rss_before,
+        'rss_mb_end': rss_after,
+        'rss_growth_mb_per_minute': (rss_after - rss_before) * 60 / args.duration,
+    }
+
+    stopped = threading.Semaphore(0)
+    started = time.monotonic()
+    accepted = manager.stop_streams(names, 'admin', 'bench', on_result=lambda *_: stopped.release())
+    for _ in accepted:
+        stopped.acquire(timeout=30)
+    results['stream_stop_seconds'] = time.monotonic() - started
+    return results
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)):
+            yield f'{prefix}{key}', value
+
+
+def compare(baseline_path, results):
+    with open(baseline_path) as f:
+        baseline = dict(flatten(json.load(f)['results']))
+    print(f'\nCompared with {baseline_path}:')
+    for key, value in flatten(results):
+        if key in baseline:
+            before = baseline[key]
+            change = f'{(value - before) / before * 100:+.1f}%' if before else 'n/a'
+            print(f'  {key:50} {before:12.3f} -> {value:12.3f}  {change}')
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+    record = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'host': {'cpus': os.cpu_count(), 'python': platform.python_version(), 'platform': platform.platform()},
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'port')},
+        'results': results
+    }
+    print(json.dumps(record, indent=2))
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.output, f'{stamp}-{record["revision"]}-{args.streams}s{args.clients}c.json')
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+    print(f'\nSaved {path}')
+    if args.baseline:
+        compare(args.baseline, results)
+    os._exit(0)  # The Socket.IO server thread has no clean shutdown
+
+
+if __name__ == '__main__':
+    main()
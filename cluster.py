@@ -0,0 +1,365 @@
+"""Controller side of multi-node operation: places streams on worker agents.
+
+Each new stream goes to the live agent with the most headroom (CPU, egress
+bandwidth and stream count against the agent's limits). Agents are polled for
+status; their stream views are merged into the controller's status feed. When
+an agent stops answering, its streams are started again on the other agents,
+and if it comes back, streams that were moved away are stopped there.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+from stream_manager import ADMIN_ROLES
+
+
+class WorkerNode:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.node_id = self.url
+        self.alive = False
+        self.last_seen = 0.0
+        self.capacity = {}
+        self.views = {}  # Controller-side name -> view, as last merged into the feed
+        self.pending = 0  # Streams placed since the last status poll
+
+
+def headroom(node):
+    """Free fraction of the node's tightest resource; 0 or less means full."""
+    capacity = node.capacity
+    streams = capacity.get('streams', 0) + node.pending
+    return min(
+        1 - streams / max(capacity.get('max_streams', 1), 1),
+        1 - capacity.get('cpu_percent', 0) / max(capacity.get('max_cpu_percent', 100), 1),
+        1 - capacity.get('egress_kbps', 0) / max(capacity.get('egress_limit_kbps', 1), 1)
+    )
+
+
+class ClusterManager:
+    def __init__(self, stream_manager, node_urls, token=None, poll_interval=1.0, dead_after=5.0, timeout=3.0):
+        """stream_manager is the controller's own StreamManager; it keeps the
+        status feed, which gets the agents' stream views."""
+        self.stream_manager = stream_manager
+        self.nodes = [WorkerNode(url) for url in node_urls]
+        self.token = token
+        self.poll_interval = poll_interval
+        self.dead_after = dead_after
+        self.timeout = timeout
+        self.placements = {}  # Stream name -> {'node', 'owner', 'spec', 'placed_at'}
+        self._fenced = {}  # Stream name -> node that must stop it once reachable
+        self._rejections = OrderedDict()  # Stream name -> (why its last start failed, queued on its worker)
+        self.settle_time = 5.0  # Seconds before a new placement must show up in its node's status
+        self.failovers = 0
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=max(4, len(self.nodes)), thread_name_prefix='cluster')
+        threading.Thread(target=self._run, name='cluster-poll', daemon=True).start()
+
+    # Stream operations, with the signatures of StreamManager's
+
+    def start_stream(self, stream_name, owner, force=False, **spec):
+        with self._lock:
+            if stream_name in self.placements or stream_name in self.stream_manager.get_active_streams():
+                print(f"Stream '{stream_name}' is already running.")
+                self._refuse(stream_name, 'Stream is already running')
+                return False
+            warning = self.stream_manager.input_warning(spec.get('input_source'))
+            if warning and not force:
+                print(f"Not starting stream '{stream_name}': {warning}")
+                self._refuse(stream_name, warning)
+                return False
+            node = self._place(spec)
+            if node is None:
+                print(f"No worker node has room for stream '{stream_name}'.")
+                self._refuse(stream_name, 'No worker node has room for the stream')
+                return False
+            node.pending += 1
+            self.placements[stream_name] = {'node': node, 'owner': owner, 'spec': dict(spec), 'placed_at': time.monotonic()}
+
+        success, queued = self._start_on(node, stream_name, owner, spec)
+        if success:
+            print(f"Stream '{stream_name}' started on worker '{node.node_id}'.")
+            return True
+        if not queued:
+            # A stream queued by the worker's admission control stays placed there
+            with self._lock:
+                node.pending = max(0, node.pending - 1)
+                self.placements.pop(stream_name, None)
+        return False
+
+    def start_streams(self, specs, owner, on_result=None):
+        results = {}
+
+        def start(spec):
+            spec = dict(spec)
+            name = spec.pop('stream_name', None)
+            success = bool(name) and self.start_stream(name, owner, **spec)
+            results[name] = success
+            if on_result:
+                on_result(name, success, 'Stream started' if success else self.admission_message(name))
+
+        list(self._pool.map(start, specs))
+        return results
+
+    def admission_message(self, stream_name):
+        """Why the last start of stream_name did not go through, as its worker
+        (or the placement) gave it."""
+        with self._lock:
+            message, _ = self._rejections.pop(stream_name, (None, False))
+        return message or 'Failed to start stream'
+
+    def is_queued(self, stream_name):
+        with self._lock:
+            return self._rejections.get(stream_name, (None, False))[1]
+
+    def stop_stream(self, stream_name, user_role, user_id, on_stopped=None):
+        with self._lock:
+            placement = self.placements.get(stream_name)
+            target = self._locate(stream_name)
+        if target is None:
+            return False, 'Stream not found'
+        node, agent_name, view = target
+        if user_role not in ADMIN_ROLES and (placement['owner'] if placement else view.get('owner')) != user_id:
+            return False, 'Permission denied'
+
+        with self._lock:
+            self.placements.pop(stream_name, None)
+        if not (node.alive and self._request(node, 'DELETE', f'/streams/{quote(agent_name, safe="")}')):
+            # Stopped as soon as the node answers again, instead of being adopted back
+            print(f"Could not reach worker '{node.node_id}'; stream '{stream_name}' is stopped when it is back.")
+            with self._lock:
+                self._fenced[agent_name] = node
+        if on_stopped:
+            on_stopped(stream_name, None)
+        return True, 'Stream stopped successfully'
+
+    def stop_streams(self, stream_names, user_role, user_id, on_result=None):
+        def stopped(name, returncode):
+            if on_result:
+                on_result(name, True, 'Stream stopped')
+
+        results = {}
+        for name in stream_names:
+            results[name] = self.stop_stream(name, user_role, user_id, on_stopped=stopped)
+            if not results[name][0] and on_result:
+                on_result(name, False, results[name][1])
+        return results
+
+    def stop_owner_streams(self, owner, user_role, user_id, on_result=None):
+        with self._lock:
+            names = [name for name, placement in self.placements.items() if placement['owner'] == owner]
+        return self.stop_streams(names, user_role, user_id, on_result)
+
+    def stop_source_streams(self, input_source, user_role, user_id, on_result=None):
+        with self._lock:
+            names = [name for name, placement in self.placements.items()
+                     if (placement['spec'] or {}).get('input_source') == input_source]
+        return self.stop_streams(names, user_role, user_id, on_result)
+
+    def get_stream_history(self, stream_name, window=900, resolution=None):
+        with self._lock:
+            target = self._locate(stream_name)
+        if target is None or not target[0].alive:
+            return None
+        node, agent_name, _ = target
+        query = {'window': window}
+        if resolution:
+            query['resolution'] = resolution
+        history = self._request(node, 'GET', f'/streams/{quote(agent_name, safe="")}/history?{urlencode(query)}')
+        if not history or 'timestamps' not in history:
+            return None
+        history['stream'] = stream_name
+        return history
+
+    def get_stream_log(self, stream_name, lines=200):
+        with self._lock:
+            target = self._locate(stream_name)
+        if target is None or not target[0].alive:
+            return None
+        node, agent_name, _ = target
+        log = self._request(node, 'GET', f'/streams/{quote(agent_name, safe="")}/log?{urlencode({"lines": lines})}')
+        if not log or 'lines' not in log:
+            return None
+        log['stream'] = stream_name
+        return log
+
+    def nodes_status(self):
+        with self._lock:
+            return [{
+                'node': node.node_id, 'url': node.url, 'alive': node.alive,
+                'headroom': round(headroom(node), 3) if node.alive else None,
+                'placed': sum(1 for p in self.placements.values() if p['node'] is node),
+                **{k: v for k, v in node.capacity.items() if k != 'node'}
+            } for node in self.nodes]
+
+    # Placement
+
+    def _place(self, spec):
+        live = [node for node in self.nodes if node.alive and headroom(node) > 0]
+        if not live:
+            return None
+        if spec.get('fan_out') or spec.get('backup_input'):
+            # Legs of one input share an ingest only on the same node
+            sharing = {p['node'] for p in self.placements.values()
+                       if p['spec'] and p['spec'].get('input_source') == spec.get('input_source')
+                       and (p['spec'].get('fan_out') or p['spec'].get('backup_input'))}
+            preferred = [node for node in live if node in sharing]
+            if preferred:
+                return max(preferred, key=headroom)
+        return max(live, key=headroom)
+
+    def _start_on(self, node, stream_name, owner, spec):
+        body = dict(spec, stream_name=stream_name, owner=owner, force=True)
+        result = self._request(node, 'POST', '/streams', body)
+        if result and result.get('success'):
+            return True, False
+        message = (result or {}).get('message') or f"Worker '{node.node_id}' did not answer"
+        queued = bool((result or {}).get('queued'))
+        self._refuse(stream_name, message, queued)
+        print(f"Worker '{node.node_id}' did not start stream '{stream_name}': {message}")
+        return False, queued
+
+    def _refuse(self, stream_name, message, queued=False):
+        with self._lock:
+            self._rejections[stream_name] = (message, queued)
+            while len(self._rejections) > 100:
+                self._rejections.popitem(last=False)
+
+    def _locate(self, stream_name):
+        """(node, agent-side name, view) of a stream in the merged feed."""
+        placement = self.placements.get(stream_name)
+        if placement is not None:
+            node = placement['node']
+            return node, stream_name, node.views.get(stream_name, {})
+        for node in self.nodes:
+            view = node.views.get(stream_name)
+            if view is not None:
+                return node, view['agent_name'], view
+        return None
+
+    # Polling and failover
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                list(self._pool.map(self._poll, self.nodes))
+            except Exception as e:
+                print(f"Cluster poll error: {e}")
+            time.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+
+    def _poll(self, node):
+        status = self._request(node, 'GET', '/status', quiet=True)
+        now = time.monotonic()
+        if status is None:
+            if node.alive and now - node.last_seen > self.dead_after:
+                self._node_down(node)
+            return
+
+        with self._lock:
+            if not node.alive:
+                print(f"Worker '{status['capacity'].get('node', node.url)}' is up.")
+            node.alive = True
+            node.last_seen = now
+            node.node_id = status['capacity'].get('node') or node.url
+            node.capacity = status['capacity']
+            node.pending = 0
+            views = {}
+            fence = []
+            reported = status['snapshot']['streams']
+            for agent_name in [n for n, fenced_on in self._fenced.items() if fenced_on is node]:
+                if agent_name in reported:
+                    fence.append(agent_name)
+                else:
+                    del self._fenced[agent_name]
+            for agent_name, view in reported.items():
+                kind = view.get('kind', 'stream')
+                if agent_name in fence:
+                    continue
+                if kind in ('stream', 'leg'):
+                    placement = self.placements.get(agent_name)
+                    if placement is None:
+                        # Running since before this controller started; its spec is unknown
+                        self.placements[agent_name] = placement = {
+                            'node': node, 'owner': view['owner'], 'spec': None, 'placed_at': now
+                        }
+                    if placement['node'] is not node:
+                        fence.append(agent_name)  # Moved away while this node was unreachable
+                        continue
+                    name = agent_name
+                else:
+                    # Ingest and standby names derive from the input, so prefix them per node
+                    name = f"{node.node_id}/{agent_name}"
+                views[name] = dict(view, node=node.node_id, agent_name=agent_name,
+                                   group=f"{node.node_id}/{view['group']}" if view.get('group') else None)
+            # Streams the agent gave up on, or legs stopped with their ingest
+            for name in [n for n, p in self.placements.items() if p['node'] is node and n not in reported
+                         and now - p['placed_at'] > self.settle_time]:
+                del self.placements[name]
+            changed = {name: view for name, view in views.items() if node.views.get(name) != view}
+            removed = [name for name in node.views if name not in views]
+            node.views = views
+
+        for name, view in changed.items():
+            self.stream_manager.update_remote(name, view)
+        for name in removed:
+            self.stream_manager.remove_remote(name)
+        for agent_name in fence:
+            print(f"Stopping stream '{agent_name}' on '{node.node_id}': it now runs on another worker.")
+            self._request(node, 'DELETE', f'/streams/{quote(agent_name, safe="")}')
+
+    def _node_down(self, node):
+        with self._lock:
+            if not node.alive:
+                return
+            node.alive = False
+            orphans = [(name, p) for name, p in self.placements.items() if p['node'] is node]
+            views, node.views = node.views, {}
+        print(f"Worker '{node.node_id}' is down; moving {len(orphans)} stream(s).")
+        for name in views:
+            self.stream_manager.remove_remote(name)
+
+        for name, placement in orphans:
+            with self._lock:
+                target = self._place(placement['spec']) if placement['spec'] else None
+                if target is None:
+                    self.placements.pop(name, None)
+                else:
+                    target.pending += 1
+                    placement['node'] = target
+                    placement['placed_at'] = time.monotonic()
+            if target is None:
+                print(f"Stream '{name}' was lost with worker '{node.node_id}' (no spec or no free worker).")
+                continue
+            success, queued = self._start_on(target, name, placement['owner'], placement['spec'])
+            if success or queued:
+                self.failovers += 1
+                print(f"Stream '{name}' moved from '{node.node_id}' to '{target.node_id}'.")
+            else:
+                with self._lock:
+                    self.placements.pop(name, None)
+                print(f"Stream '{name}' could not be restarted on '{target.node_id}'.")
+
+    def _request(self, node, method, path, body=None, quiet=False):
+        """JSON request to an agent; returns the decoded reply or None on failure."""
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(node.url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            try:
+                return json.loads(e.read() or b'null')
+            except ValueError:
+                return None
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            if not quiet:
+                print(f"Worker '{node.node_id}' request {method} {path} failed: {e}")
+            return None
@@ -0,0 +1,62 @@
+"""Parser for the key=value blocks FFmpeg writes with ``-progress pipe:1``.
+
+Each block is a run of ``key=value`` lines terminated by ``progress=continue``
+(or ``progress=end`` when FFmpeg finishes).
+"""
+
+INT_FIELDS = ('frame', 'drop_frames', 'dup_frames', 'total_size', 'out_time_us')
+
+
+def _to_float(value, suffix=''):
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # FFmpeg reports N/A until it has enough data
+
+
+class ProgressParser:
+    def __init__(self):
+        self._buffer = b''
+        self._block = {}
+
+    def feed(self, chunk):
+        """Consume raw bytes and return the list of completed progress blocks."""
+        lines = (self._buffer + chunk).split(b'\n')
+        self._buffer = lines.pop()
+        blocks = []
+        for raw in lines:
+            key, sep, value = raw.strip().partition(b'=')
+            if not sep:
+                continue
+            key = key.decode('ascii', errors='replace')
+            value = value.strip().decode('ascii', errors='replace')
+            if key == 'progress':
+                block = parse_block(self._block)
+                block['progress'] = value
+                blocks.append(block)
+                self._block = {}
+            else:
+                self._block[key] = value
+        return blocks
+
+
+def parse_block(raw):
+    """Convert the string values of one block into numbers where possible."""
+    block = {}
+    for key in INT_FIELDS:
+        if key in raw:
+            value = _to_float(raw[key])
+            block[key] = int(value) if value is not None else None
+    if 'out_time_us' not in block and 'out_time_ms' in raw:
+        # Older FFmpeg builds report microseconds under the out_time_ms key
+        value = _to_float(raw['out_time_ms'])
+        block['out_time_us'] = int(value) if value is not None else None
+    if 'fps' in raw:
+        block['fps'] = _to_float(raw['fps'])
+    if 'bitrate' in raw:
+        block['bitrate_kbps'] = _to_float(raw['bitrate'], 'kbits/s')
+    if 'speed' in raw:
+        block['speed'] = _to_float(raw['speed'], 'x')
+    return block
@@ -0,0 +1,237 @@
+"""Server-side relay for the HLS previews of the predefined sources.
+
+Browsers fetch playlists and segments from here instead of the origin. Each
+playlist is fetched at most once per refresh interval and each segment once
+while it is cached, however many viewers there are. Fetching is driven by
+viewer requests only, so a source nobody watches costs nothing.
+
+Rewritten playlists point at opaque tokens under the source's relay path, and
+only URLs that appeared in one of the source's playlists can be fetched
+through the relay.
+"""
+import hashlib
+import posixpath
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+PLAYLIST_CONTENT_TYPE = 'application/vnd.apple.mpegurl'
+
+# URI="..." attributes of tags such as #EXT-X-KEY, #EXT-X-MAP and #EXT-X-MEDIA
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+
+
+class OriginError(Exception):
+    """The origin failed or the request names nothing the relay knows."""
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+class SegmentCache:
+    """In-memory LRU of segment bytes, bounded in total size, with a TTL per entry."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires, data, content_type)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, data, content_type):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, data, content_type)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+
+class _Fetch:
+    """One origin request that concurrent callers for the same URL wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HLSRelay:
+    def __init__(self, sources, origin=None, cache_bytes=64 * 1024 * 1024, segment_ttl=60.0,
+                 playlist_ttl=1.0, idle_timeout=60.0, timeout=5.0):
+        """sources maps a source name to its playlist URL. origin (e.g.
+        http://127.0.0.1:8900) replaces the scheme and host of every source URL,
+        to point the relay at a local stand-in."""
+        self.sources = {name: _with_origin(url, origin) if origin else url for name, url in sources.items()}
+        self.cache = SegmentCache(cache_bytes, segment_ttl)
+        self.playlist_ttl = playlist_ttl
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.origin_fetches = 0
+        self._playlists = {}  # url -> (fetched_at, text)
+        self._tokens = {}  # source -> {token: (url, last listed)}
+        self._last_viewed = {}  # source -> monotonic time of its last request
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def playlist(self, source):
+        """Rewritten entry playlist of a source."""
+        url = self.sources.get(source)
+        if url is None:
+            raise OriginError(f'Unknown source {source!r}', status=404)
+        return self._playlist(source, url)
+
+    def resource(self, source, token):
+        """A variant playlist or segment listed by one of the source's playlists.
+        Returns (body, content_type)."""
+        with self._lock:
+            entry = self._tokens.get(source, {}).get(token)
+        if entry is None:
+            raise OriginError(f'Unknown resource {token!r} of {source!r}', status=404)
+        url = entry[0]
+        if token.endswith('.m3u8'):
+            return self._playlist(source, url).encode(), PLAYLIST_CONTENT_TYPE
+        self._touch(source)
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        data, content_type = self._fetch(url)
+        content_type = content_type or 'video/mp2t'
+        self.cache.put(url, data, content_type)
+        return data, content_type
+
+    def watched(self):
+        """Sources requested within the idle timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            return sorted(source for source, seen in self._last_viewed.items() if seen >= cutoff)
+
+    def stats(self):
+        return {
+            'watched': self.watched(),
+            'origin_fetches': self.origin_fetches,
+            'cache_bytes': self.cache.bytes,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses
+        }
+
+    def _playlist(self, source, url):
+        self._touch(source)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._playlists.get(url)
+        if cached is not None and now - cached[0] < self.playlist_ttl:
+            return cached[1]
+        data, _ = self._fetch(url)
+        text = self._rewrite(source, url, data.decode('utf-8', errors='replace'))
+        with self._lock:
+            self._playlists[url] = (time.monotonic(), text)
+        return text
+
+    def _rewrite(self, source, base_url, text):
+        """Point every URI of a playlist at a relay token of the source."""
+        if not text.startswith('#EXTM3U'):
+            raise OriginError(f'Origin returned no playlist for {source!r}')
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens.setdefault(source, {})
+
+            def token_for(uri):
+                absolute = urljoin(base_url, uri)
+                path = urlsplit(absolute).path
+                extension = posixpath.splitext(path)[1].lower() or '.ts'
+                token = hashlib.sha1(absolute.encode()).hexdigest()[:20] + extension
+                tokens[token] = (absolute, now)
+                return token
+
+            lines = []
+            for line in text.splitlines():
+                stripped = line.strip()
+                if stripped and not stripped.startswith('#'):
+                    lines.append(token_for(stripped))
+                elif stripped.startswith('#') and 'URI="' in stripped:
+                    lines.append(_URI_ATTRIBUTE.sub(lambda m: f'URI="{token_for(m.group(1))}"', line))
+                else:
+                    lines.append(line)
+
+            # Live playlists list new segments all the time; forget the old ones
+            horizon = now - max(self.cache.ttl, self.idle_timeout)
+            for token in [t for t, (_, listed) in tokens.items() if listed < horizon]:
+                del tokens[token]
+        return '\n'.join(lines) + '\n'
+
+    def _touch(self, source):
+        now = time.monotonic()
+        with self._lock:
+            self._last_viewed[source] = now
+            # Drop playlists and tokens of sources nobody watches any more
+            for idle in [s for s, seen in self._last_viewed.items() if now - seen > self.idle_timeout]:
+                del self._last_viewed[idle]
+                for token_url, _ in self._tokens.pop(idle, {}).values():
+                    self._playlists.pop(token_url, None)
+                self._playlists.pop(self.sources.get(idle), None)
+
+    def _fetch(self, url):
+        """GET url, sharing one request among concurrent callers."""
+        with self._lock:
+            fetch = self._inflight.get(url)
+            leader = fetch is None
+            if leader:
+                fetch = self._inflight[url] = _Fetch()
+        if not leader:
+            fetch.done.wait(self.timeout * 2)
+            if fetch.error is not None:
+                raise fetch.error
+            if fetch.result is None:
+                raise OriginError(f'Timed out waiting for {url}', status=504)
+            return fetch.result
+
+        try:
+            self.origin_fetches += 1
+            request = urllib.request.Request(url, headers={'User-Agent': 'restream-hls-relay'})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                fetch.result = (response.read(), response.headers.get('Content-Type'))
+            return fetch.result
+        except urllib.error.HTTPError as e:
+            fetch.error = OriginError(f'Origin returned {e.code} for {url}', status=404 if e.code == 404 else 502)
+            raise fetch.error
+        except (urllib.error.URLError, OSError) as e:
+            fetch.error = OriginError(f'Origin unreachable for {url}: {e}', status=502)
+            raise fetch.error
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+            fetch.done.set()
+
+
+def _with_origin(url, origin):
+    parts, replacement = urlsplit(url), urlsplit(origin)
+    return urlunsplit((replacement.scheme, replacement.netloc, parts.path, parts.query, parts.fragment))
@@ -1,24 +1,64 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, Response, abort
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+import hmac
 import json
 import os
-from stream_manager import StreamManager
+from datetime import datetime, timezone
+import stream_state
+from stream_manager import StreamManager, ADMIN_ROLES, ADMIN_ROOM, RENDITIONS, user_room, metrics_room
+from stream_schedule import REPEAT_INTERVALS
+from stream_registry import StreamRegistry
+from source_prober import SourceProber
+from cluster import ClusterManager
+from hls_relay import HLSRelay, OriginError, PLAYLIST_CONTENT_TYPE
+from metrics_exporter import MetricsExporter, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from predefined_streams import RTMP_STREAMS, M3U8_STREAMS
 
 # Initialize Flask app and other components
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'your-secret-key')
 CORS(app)
-socketio = SocketIO(app)
+socketio = SocketIO(app, json=stream_state)  # Reuses the cached encoding of status payloads
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = None  # Disable default login message
 
-# Initialize the stream manager
-stream_manager = StreamManager(socketio)
+# Predefined sources are probed in the background; results show in the source dropdown
+source_prober = SourceProber(
+    RTMP_STREAMS,
+    interval=float(os.environ.get('SOURCE_PROBE_INTERVAL', 60)),  # 0 disables probing
+    workers=int(os.environ.get('SOURCE_PROBE_WORKERS', 8)),
+    on_update=lambda catalog: socketio.emit('source_catalog', catalog)
+)
+
+# Initialize the stream manager; streams recorded in the registry are reattached or restarted
+stream_registry = StreamRegistry(os.environ.get('STREAM_REGISTRY_PATH', 'stream_registry.db'))
+stream_manager = StreamManager(
+    socketio,
+    registry=stream_registry,
+    runtime_dir=os.environ.get('STREAM_RUNTIME_DIR', 'runtime'),
+    prober=source_prober
+)
+source_prober.start()
+
+# With WORKER_NODES (comma-separated agent URLs) FFmpeg runs on worker agents
+# (worker_agent.py) and this app only places streams and merges their status
+worker_nodes = [url.strip() for url in os.environ.get('WORKER_NODES', '').split(',') if url.strip()]
+cluster = ClusterManager(stream_manager, worker_nodes, token=os.environ.get('WORKER_TOKEN')) if worker_nodes else None
+stream_control = cluster or stream_manager  # Where start, stop and history requests go
+stream_manager.control = stream_control  # Scheduled starts and stops go the same way
+metrics_exporter = MetricsExporter(
+    stream_manager, refresh_interval=float(os.environ.get('METRICS_REFRESH_INTERVAL', 5.0))
+)
+# Dashboard previews go through this relay; HLS_ORIGIN points it at a stand-in origin
+hls_relay = HLSRelay(
+    M3U8_STREAMS,
+    origin=os.environ.get('HLS_ORIGIN'),
+    cache_bytes=int(os.environ.get('HLS_CACHE_MB', 64)) * 1024 * 1024
+)
 
 # Load or initialize user data
 USER_DATA_FILE = 'user_data.json'
@@ -73,7 +113,8 @@ def index():
     return render_template(
         'index.html', 
         rtmp_streams=RTMP_STREAMS, 
-        m3u8_streams=M3U8_STREAMS
+        m3u8_streams=M3U8_STREAMS,
+        renditions=RENDITIONS
     )
 
 @app.route('/users')
@@ -139,25 +180,203 @@ def change_password():
 
     return render_template('change_password.html')
 
+@app.route('/api/streams/<path:stream_name>/history')
+@login_required
+def stream_history(stream_name):
+    window = request.args.get('window', 900, type=int)
+    resolution = request.args.get('resolution', type=int)
+    if not stream_manager.can_view(stream_name, current_user.role, current_user.id):
+        return jsonify({'error': 'No history for this stream'}), 404
+    history = stream_control.get_stream_history(stream_name, window=window, resolution=resolution)
+    if history is None:
+        return jsonify({'error': 'No history for this stream'}), 404
+    return jsonify(history)
+
+@app.route('/api/streams/<path:stream_name>/log')
+@login_required
+def stream_log(stream_name):
+    lines = max(0, min(request.args.get('lines', 200, type=int), 1000))
+    if not stream_manager.can_view(stream_name, current_user.role, current_user.id):
+        return jsonify({'error': 'No log for this stream'}), 404
+    log = stream_control.get_stream_log(stream_name, lines=lines)
+    if log is None:
+        return jsonify({'error': 'No log for this stream'}), 404
+    return jsonify(log)
+
+@app.route('/api/schedule')
+@login_required
+def schedule():
+    return jsonify(stream_manager.get_schedule(None if current_user.role in ADMIN_ROLES else current_user.id))
+
+@app.route('/hls/<source>/index.m3u8')
+@login_required
+def hls_playlist(source):
+    try:
+        playlist = hls_relay.playlist(source)
+    except OriginError as e:
+        return Response(str(e), status=e.status, mimetype='text/plain')
+    response = Response(playlist, content_type=PLAYLIST_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/hls/<source>/<token>')
+@login_required
+def hls_resource(source, token):
+    try:
+        body, content_type = hls_relay.resource(source, token)
+    except OriginError as e:
+        return Response(str(e), status=e.status, mimetype='text/plain')
+    response = Response(body, content_type=content_type)
+    response.headers['Cache-Control'] = 'no-cache' if content_type == PLAYLIST_CONTENT_TYPE else 'private, max-age=60'
+    return response
+
+@app.route('/api/nodes')
+@login_required
+def worker_nodes_status():
+    if current_user.role not in ADMIN_ROLES:
+        abort(403)
+    return jsonify(cluster.nodes_status() if cluster else [])
+
+@app.route('/api/resources')
+@login_required
+def resource_status():
+    if current_user.role not in ADMIN_ROLES:
+        abort(403)
+    return jsonify(stream_manager.resource_status())
+
+@app.route('/metrics')
+def metrics():
+    # Scraped by Prometheus, so no session login: a bearer token when METRICS_TOKEN
+    # is set, otherwise only scrapes from this host are served
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    return Response(metrics_exporter.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
 # Socket.IO Events
 
+@socketio.on('connect')
+def handle_connect(auth=None):
+    if not current_user.is_authenticated:
+        return False
+    # Admins follow every stream; everyone else only gets deltas for their own
+    if current_user.role in ADMIN_ROLES:
+        join_room(ADMIN_ROOM)
+    else:
+        join_room(user_room(current_user.id))
+        stream_manager.add_viewer(current_user.id)
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    for room in rooms():
+        if room.startswith('metrics:'):
+            stream_manager.unsubscribe_metrics(room[len('metrics:'):])
+    if current_user.is_authenticated and current_user.role not in ADMIN_ROLES:
+        stream_manager.remove_viewer(current_user.id)
+
+def _stream_spec(data):
+    """start_stream keyword arguments from a client start request."""
+    return {
+        'stream_name': data.get('stream_name'),
+        'input_source': data.get('input'),
+        'destination': data.get('destination'),
+        'stream_key': data.get('stream_key'),
+        'source_name': data.get('source_name'),
+        'srt_passphrase': data.get('srt_passphrase'),
+        'srt_latency': data.get('srt_latency'),
+        'fan_out': bool(data.get('fan_out')),
+        'backup_input': data.get('backup_input') or None,
+        'backup_source_name': data.get('backup_source_name'),
+        'profile': data.get('profile') or 'standard',
+        'force': bool(data.get('force')),
+        'rendition': data.get('rendition') or 'copy',
+        # More destinations fed by the same FFmpeg process, each copied or transcoded
+        'outputs': [
+            {key: output.get(key) for key in ('destination', 'stream_key', 'srt_passphrase', 'srt_latency', 'rendition')}
+            for output in data.get('outputs') or [] if isinstance(output, dict)
+        ]
+    }
+
+def _schedule_time(value):
+    """Epoch seconds from an ISO 8601 time (UTC unless it has an offset) or a number."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _report_to(sid, operation):
+    """Per-stream result callback that sends each result to one client."""
+    def report(stream_name, success, message):
+        socketio.emit('stream_operation_result', {
+            'operation': operation, 'stream_name': stream_name,
+            'success': success, 'message': message
+        }, to=sid)
+    return report
+
 @socketio.on('start_stream')
 @login_required
 def handle_start_stream(data):
-    stream_name = data.get('stream_name')
-    input_source = data.get('input')
-    destination = data.get('destination')
-    stream_key = data.get('stream_key')
-    source_name = data.get('source_name')
-    srt_passphrase = data.get('srt_passphrase')
-    srt_latency = data.get('srt_latency')
-
-    success = stream_manager.start_stream(
-        stream_name, input_source, destination, stream_key,
-        owner=current_user.id, source_name=source_name,
-        srt_passphrase=srt_passphrase, srt_latency=srt_latency
+    spec = _stream_spec(data)
+    warning = stream_manager.input_warning(spec['input_source'])
+    if warning and not spec['force']:
+        # The client may confirm and retry with force
+        return {'success': False, 'input_offline': True, 'message': warning}
+    success = stream_control.start_stream(owner=current_user.id, **spec)
+    if not success:
+        # Refused or queued by admission control when the host budget is used up
+        # (the worker's, in cluster mode)
+        name = spec['stream_name']
+        return {'success': False, 'queued': stream_control.is_queued(name), 'message': stream_control.admission_message(name)}
+    return {'success': True}
+
+@socketio.on('start_streams')
+@login_required
+def handle_start_streams(data):
+    # Returns at once; each stream's result follows as a stream_operation_result event
+    specs = [_stream_spec(item) for item in (data or {}).get('streams', [])]
+    socketio.start_background_task(
+        stream_control.start_streams, specs, current_user.id, on_result=_report_to(request.sid, 'start')
+    )
+    return {'success': True, 'accepted': len(specs)}
+
+@socketio.on('schedule_stream')
+@login_required
+def handle_schedule_stream(data):
+    # Start fields as for start_stream, plus start_at and/or stop_at and an optional repeat
+    data = data or {}
+    try:
+        start_at = _schedule_time(data.get('start_at'))
+        stop_at = _schedule_time(data.get('stop_at'))
+        repeat = data.get('repeat') or 0
+        repeat = REPEAT_INTERVALS[repeat] if repeat in REPEAT_INTERVALS else int(repeat)
+    except (TypeError, ValueError):
+        return {'success': False, 'message': 'Invalid start time, stop time or repeat'}
+    spec = _stream_spec(data) if start_at is not None else None
+    entry, message = stream_manager.schedule_stream(
+        data.get('stream_name'), current_user.id, current_user.role,
+        spec=spec, start_at=start_at, stop_at=stop_at, repeat=repeat
     )
-    return {'success': success}
+    if entry is None:
+        return {'success': False, 'message': message}
+    return {'success': True, 'entry': entry}
+
+@socketio.on('cancel_schedule')
+@login_required
+def handle_cancel_schedule(data):
+    success, message = stream_manager.cancel_schedule((data or {}).get('id'), current_user.role, current_user.id)
+    return {'success': success, 'message': message}
+
+@socketio.on('get_schedule')
+@login_required
+def handle_get_schedule(data=None):
+    return stream_manager.get_schedule(None if current_user.role in ADMIN_ROLES else current_user.id)
 
 @socketio.on('stop_stream')
 @login_required
@@ -166,14 +385,92 @@ def handle_stop_stream(data):
     user_role = current_user.role
     user_id = current_user.id
     
-    success, message = stream_manager.stop_stream(stream_name, user_role, user_id)
+    success, message = stream_control.stop_stream(stream_name, user_role, user_id)
     return {'success': success, 'message': message}
 
+@socketio.on('stop_streams')
+@login_required
+def handle_stop_streams(data):
+    # Stops the named streams, or all of an owner's or a source's streams; every
+    # process is signalled at once and results follow as stream_operation_result events
+    data = data or {}
+    report = _report_to(request.sid, 'stop')
+    if data.get('owner'):
+        results = stream_control.stop_owner_streams(data['owner'], current_user.role, current_user.id, on_result=report)
+    elif data.get('source'):
+        results = stream_control.stop_source_streams(data['source'], current_user.role, current_user.id, on_result=report)
+    else:
+        results = stream_control.stop_streams(data.get('stream_names', []), current_user.role, current_user.id, on_result=report)
+    accepted = [name for name, (success, _) in results.items() if success]
+    return {'success': True, 'accepted': accepted, 'rejected': len(results) - len(accepted)}
+
 @socketio.on('get_stream_status')
 @login_required
 def handle_stream_status(data=None):
-    streams = stream_manager.get_active_streams()
-    return streams
+    # Full snapshot; clients also call this when they miss a delta version
+    if current_user.role in ADMIN_ROLES:
+        return stream_manager.get_status_snapshot()
+    return stream_manager.get_status_snapshot(current_user.id)
+
+@socketio.on('subscribe_stream_metrics')
+@login_required
+def handle_subscribe_stream_metrics(data=None):
+    # Every progress block of one stream, as stream_metrics events, until unsubscribed
+    stream_name = (data or {}).get('stream_name')
+    if not stream_manager.can_view(stream_name, current_user.role, current_user.id):
+        return {'success': False, 'message': 'Stream not found'}
+    room = metrics_room(stream_name)
+    if room not in rooms():
+        join_room(room)
+        stream_manager.subscribe_metrics(stream_name)
+    return {'success': True}
+
+@socketio.on('unsubscribe_stream_metrics')
+@login_required
+def handle_unsubscribe_stream_metrics(data=None):
+    stream_name = (data or {}).get('stream_name')
+    room = metrics_room(stream_name)
+    if room in rooms():
+        leave_room(room)
+        stream_manager.unsubscribe_metrics(stream_name)
+    return {'success': True}
+
+@socketio.on('get_source_catalog')
+@login_required
+def handle_source_catalog(data=None):
+    return source_prober.catalog()
+
+@socketio.on('get_stream_history')
+@login_required
+def handle_stream_history(data=None):
+    data = data or {}
+    try:
+        window = int(data.get('window', 900))
+        resolution = int(data['resolution']) if data.get('resolution') else None
+    except (TypeError, ValueError):
+        return {'success': False, 'message': 'Invalid window or resolution'}
+    if not stream_manager.can_view(data.get('stream_name'), current_user.role, current_user.id):
+        return {'success': False, 'message': 'No history for this stream'}
+    history = stream_control.get_stream_history(data.get('stream_name'), window=window, resolution=resolution)
+    if history is None:
+        return {'success': False, 'message': 'No history for this stream'}
+    return {'success': True, 'history': history}
+
+@socketio.on('get_stream_log')
+@login_required
+def handle_stream_log(data=None):
+    # Only sent on request, when a stream's details are opened
+    data = data or {}
+    try:
+        lines = max(0, min(int(data.get('lines', 200)), 1000))
+    except (TypeError, ValueError):
+        return {'success': False, 'message': 'Invalid line count'}
+    if not stream_manager.can_view(data.get('stream_name'), current_user.role, current_user.id):
+        return {'success': False, 'message': 'No log for this stream'}
+    log = stream_control.get_stream_log(data.get('stream_name'), lines=lines)
+    if log is None:
+        return {'success': False, 'message': 'No log for this stream'}
+    return {'success': True, 'log': log}
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
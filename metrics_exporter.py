@@ -0,0 +1,194 @@
+"""Prometheus text exposition (format 0.0.4) of stream and supervisor metrics.
+
+Rendered by hand so the app needs no client library. Scrapes are served
+from a cached rendering that is rebuilt at most once per refresh interval.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STREAM_STATUSES = ('active', 'warning', 'degraded', 'stalled', 'restarting', 'failed', 'queued')
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() may be called from any thread."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.total += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def render(self, name, help_text):
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.total, self.sum
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for bound, count in zip(self.buckets, counts):
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f'{name}_sum {total_sum}')
+        lines.append(f'{name}_count {total}')
+        return lines
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _stream_label(name, info):
+    """Label value of a stream. Shared ingests (and their standbys) are keyed by
+    their input URL, which may hold credentials, so they get a hash of it instead."""
+    if info.get('kind') not in ('ingest', 'standby'):
+        return name
+    group, _, suffix = name.partition('#')
+    label = 'ingest-' + hashlib.sha1(group.encode()).hexdigest()[:12]
+    return f'{label}#{suffix}' if suffix else label
+
+
+def _number(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    return value if isinstance(value, (int, float)) else None
+
+
+class MetricsExporter:
+    def __init__(self, stream_manager, refresh_interval=5.0):
+        self.stream_manager = stream_manager
+        self.refresh_interval = refresh_interval
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def render(self):
+        """Return the exposition text, rebuilding it if the cached copy is stale."""
+        with self._lock:
+            if self._cached is None or time.monotonic() - self._cached_at >= self.refresh_interval:
+                self._cached = self._build()
+                self._cached_at = time.monotonic()
+            return self._cached
+
+    def _build(self):
+        manager = self.stream_manager
+        now = datetime.now(timezone.utc)
+        streams = list(manager.get_active_streams().items())
+        lines = []
+
+        def family(name, metric_type, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                value = _number(value)
+                if value is None:
+                    continue
+                label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        def per_stream(field):
+            return [({'stream': _stream_label(name, info), 'kind': info.get('kind', 'stream')}, info['health'].get(field))
+                    for name, info in streams]
+
+        family('restream_stream_fps', 'gauge', 'Frames per second reported by FFmpeg.', per_stream('fps'))
+        family('restream_stream_bitrate_kbps', 'gauge', 'Output bitrate in kbit/s.', per_stream('bitrate_kbps'))
+        family('restream_stream_speed', 'gauge', 'Processing speed relative to realtime.', per_stream('speed'))
+        family('restream_stream_output_bytes', 'gauge',
+               'Bytes written by the current FFmpeg process.', per_stream('total_size'))
+        family('restream_stream_dropped_frames', 'gauge',
+               'Frames dropped by the current FFmpeg process.', per_stream('drop_frames'))
+        family('restream_stream_output_delay_seconds', 'gauge', 'Estimated input-to-output delay.', [
+            (labels, value / 1000 if value is not None else None)
+            for labels, value in per_stream('output_delay_ms')
+        ])
+        family('restream_stream_cpu_percent', 'gauge',
+               'CPU use of the FFmpeg process in percent of one core.', per_stream('cpu_percent'))
+        family('restream_stream_memory_bytes', 'gauge', 'Resident memory of the FFmpeg process.', [
+            (labels, value * 1048576 if value is not None else None) for labels, value in per_stream('rss_mb')
+        ])
+        family('restream_stream_egress_kbps', 'gauge',
+               'Output written by the stream over the throughput window, in kbit/s.', per_stream('egress_kbps'))
+        family('restream_stream_expected_kbps', 'gauge',
+               'Bitrate the stream is expected to write, in kbit/s.', per_stream('expected_kbps'))
+        family('restream_stream_stall_detect_seconds', 'gauge',
+               'Time from the last written byte until the last stall of the stream was flagged.', [
+                   (labels, value / 1000 if value is not None else None)
+                   for labels, value in per_stream('stall_detect_ms')
+               ])
+        family('restream_rendition_speed', 'gauge',
+               'Encode speed of a transcoded output relative to realtime.', [
+                   ({'stream': _stream_label(name, info), 'output': r['output'], 'rendition': r['rendition']}, r['speed'])
+                   for name, info in streams for r in info['health'].get('renditions') or ()
+               ])
+        family('restream_stream_restarts_total', 'counter',
+               'Automatic restarts since the stream was started.', per_stream('restart_count'))
+
+        uptimes = []
+        for name, info in streams:
+            try:
+                started = datetime.fromisoformat(info['start_time'])
+            except (TypeError, ValueError):
+                continue
+            uptimes.append(({'stream': _stream_label(name, info), 'kind': info.get('kind', 'stream')},
+                            (now - started).total_seconds()))
+        family('restream_stream_uptime_seconds', 'gauge', 'Seconds since the current FFmpeg session started.', uptimes)
+
+        family('restream_stream_status', 'gauge', 'Current stream status (1 for the active state).', [
+            ({'stream': _stream_label(name, info), 'status': status}, int(info['status'] == status))
+            for name, info in streams for status in STREAM_STATUSES
+        ])
+
+        relay_drops = []
+        for name, info in streams:
+            if info.get('kind') != 'ingest':
+                continue
+            relay = manager.supervisor.relay_stats(name)
+            for sink, sink_stats in (relay or {}).get('sinks', {}).items():
+                relay_drops.append(({'stream': sink}, sink_stats['bytes_dropped']))
+        family('restream_relay_dropped_bytes_total', 'counter',
+               'Bytes a slow egress leg lost from its relay backlog.', relay_drops)
+
+        supervisor = manager.supervisor.stats()
+        family('restream_ffmpeg_children', 'gauge', 'FFmpeg processes watched by the supervisor.',
+               [({}, supervisor['children'])])
+        family('restream_supervisor_timers', 'gauge', 'Timers queued on the supervisor loop.',
+               [({}, supervisor['timers'])])
+        family('restream_supervisor_loop_lag_seconds', 'gauge', 'Lateness of the last supervisor timer.',
+               [({}, supervisor['loop_lag_seconds'])])
+        family('restream_supervisor_loop_lag_max_seconds', 'gauge',
+               'Largest supervisor timer lateness since the previous snapshot.',
+               [({}, supervisor['loop_lag_max_seconds'])])
+        family('restream_status_emits_total', 'counter', 'Socket.IO status broadcasts sent.',
+               [({}, manager.status_emits)])
+        resources = manager.resource_status()
+        family('restream_host_cpu_percent', 'gauge', 'Host CPU use in percent of all cores.',
+               [({}, resources['host'].get('cpu_percent'))])
+        family('restream_host_egress_kbps', 'gauge', 'Host network egress in kbit/s.',
+               [({}, resources['host'].get('egress_kbps'))])
+        family('restream_admission_queue_length', 'gauge', 'Streams waiting for room in the host budget.',
+               [({}, len(resources['queued']))])
+        family('restream_admission_rejections_total', 'counter',
+               'Stream starts refused or queued by admission control.', [({}, resources['rejections'])])
+        family('restream_pending_restarts', 'gauge', 'Restarts waiting for their delay or a free slot.',
+               [({}, manager.restart_scheduler.pending())])
+        family('restream_scheduled_actions', 'gauge', 'Scheduled starts and stops waiting for their time.',
+               [({}, len(manager.get_schedule()))])
+
+        lines += manager.spawn_latency.render(
+            'restream_spawn_duration_seconds', 'Time to fork and exec an FFmpeg process.')
+        lines += manager.startup_latency.render(
+            'restream_startup_seconds', 'Time from spawn to the first output written by FFmpeg.')
+        lines += manager.schedule_offset.render(
+            'restream_schedule_offset_seconds', 'Distance between a scheduled start and its first output.')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,166 @@
+"""Resource accounting of the FFmpeg children and the host, and the budgets new
+streams are admitted against.
+
+Per-process CPU time and resident memory come from /proc/<pid>/stat; host CPU
+from /proc/stat, available memory from /proc/meminfo and network egress from
+/proc/net/dev. Sockets written with send() are not counted in /proc/<pid>/io,
+so per-stream egress is taken from FFmpeg's own output byte counter instead
+(see StreamSupervisor._check_egress).
+"""
+import os
+import threading
+import time
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class ResourceMonitor:
+    """Samples every process returned by processes() ({key: pid}) and the host
+    once per interval on a background thread. on_sample(usage, host) is called
+    after every round, with usage mapping each key to its cpu_percent (of one
+    core, like top) and rss_mb."""
+
+    def __init__(self, processes, interval=2.0, on_sample=None):
+        self.processes = processes
+        self.interval = interval
+        self.on_sample = on_sample
+        self.cpu_count = os.cpu_count() or 1
+        self._usage = {}
+        self._host = {}
+        self._cpu_times = {}  # key -> (pid, cpu ticks, monotonic time)
+        self._host_cpu = _read_host_cpu()
+        self._host_tx = _read_host_tx()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='resource-monitor', daemon=True)
+            self._thread.start()
+
+    def usage(self, key):
+        return self._usage.get(key)
+
+    def host(self):
+        """Last host sample: cpu_percent (of all cores), egress_kbps, memory_available_mb."""
+        return dict(self._host, cpu_count=self.cpu_count)
+
+    def sample(self):
+        now = time.monotonic()
+        usage = {}
+        cpu_times = {}
+        for key, pid in list(self.processes().items()):
+            stat = _read_process(pid)
+            if stat is None:
+                continue  # Exited between listing and reading
+            ticks, rss = stat
+            entry = {'cpu_percent': None, 'rss_mb': round(rss / 1048576, 1)}
+            previous = self._cpu_times.get(key)
+            if previous is not None and previous[0] == pid and now > previous[2]:
+                entry['cpu_percent'] = round(100 * (ticks - previous[1]) / CLOCK_TICKS / (now - previous[2]), 1)
+            cpu_times[key] = (pid, ticks, now)
+            usage[key] = entry
+        self._cpu_times = cpu_times
+        self._usage = usage
+
+        cpu, tx = _read_host_cpu(), _read_host_tx()
+        busy, total = cpu[0] - self._host_cpu[0], cpu[1] - self._host_cpu[1]
+        self._host = {
+            'cpu_percent': round(100 * busy / total, 1) if total else 0.0,
+            'egress_kbps': round((tx[0] - self._host_tx[0]) * 8 / 1000 / max(tx[1] - self._host_tx[1], 1e-3), 1),
+            'memory_available_mb': _read_available_memory()
+        }
+        self._host_cpu, self._host_tx = cpu, tx
+        return usage
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                usage = self.sample()
+                if self.on_sample:
+                    self.on_sample(usage, self.host())
+            except Exception as e:
+                print(f"Resource monitor error: {e}")
+
+
+class HostBudget:
+    """Host limits that new streams are admitted against; 0 disables a limit.
+
+    mode 'reject' refuses a stream that does not fit, 'queue' holds it until
+    enough running streams have stopped.
+    """
+
+    def __init__(self, max_streams=0, cpu_percent=0, egress_mbps=0, memory_mb=0, mode='reject'):
+        self.max_streams = max_streams
+        self.cpu_percent = cpu_percent
+        self.egress_mbps = egress_mbps
+        self.memory_mb = memory_mb
+        self.mode = mode if mode in ('reject', 'queue') else 'reject'
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_streams=int(os.environ.get('HOST_MAX_STREAMS', 0)),
+            cpu_percent=float(os.environ.get('HOST_CPU_BUDGET', 0)),
+            egress_mbps=float(os.environ.get('HOST_EGRESS_BUDGET_MBPS', 0)),
+            memory_mb=float(os.environ.get('HOST_MEMORY_BUDGET_MB', 0)),
+            mode=os.environ.get('ADMISSION_MODE', 'reject')
+        )
+
+    def check(self, load, cost):
+        """Why a stream costing cost does not fit next to load, or None if it does.
+        Both are dicts of streams, cpu_percent (of all cores), egress_kbps and rss_mb."""
+        if self.max_streams and load['streams'] + 1 > self.max_streams:
+            return f"Stream limit reached ({load['streams']} of {self.max_streams})"
+        if self.cpu_percent and load['cpu_percent'] + cost['cpu_percent'] > self.cpu_percent:
+            return (f"CPU budget exceeded ({load['cpu_percent']:.0f}% in use, about "
+                    f"{cost['cpu_percent']:.1f}% more needed, budget {self.cpu_percent:.0f}%)")
+        if self.egress_mbps and (load['egress_kbps'] + cost['egress_kbps']) / 1000 > self.egress_mbps:
+            return (f"Egress budget exceeded ({load['egress_kbps'] / 1000:.1f} Mbit/s in use, about "
+                    f"{cost['egress_kbps'] / 1000:.1f} more needed, budget {self.egress_mbps:g} Mbit/s)")
+        if self.memory_mb and load['rss_mb'] + cost['rss_mb'] > self.memory_mb:
+            return (f"Memory budget exceeded ({load['rss_mb']:.0f} MB in use, about "
+                    f"{cost['rss_mb']:.0f} MB more needed, budget {self.memory_mb:g} MB)")
+        return None
+
+    def limits(self):
+        return {'max_streams': self.max_streams, 'cpu_percent': self.cpu_percent,
+                'egress_mbps': self.egress_mbps, 'memory_mb': self.memory_mb, 'mode': self.mode}
+
+
+def _read_process(pid):
+    """(CPU ticks in user and kernel mode, resident bytes) of a process, or None."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses; fields follow the last ')'
+    fields = data[data.rfind(b')') + 2:].split()
+    return int(fields[11]) + int(fields[12]), int(fields[21]) * PAGE_SIZE
+
+
+def _read_host_cpu():
+    with open('/proc/stat') as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    idle = values[3] + values[4]  # idle + iowait
+    return sum(values) - idle, sum(values)
+
+
+def _read_host_tx():
+    sent = 0
+    with open('/proc/net/dev') as f:
+        for line in f.readlines()[2:]:
+            interface, data = line.split(':', 1)
+            if interface.strip() != 'lo':
+                sent += int(data.split()[8])
+    return sent, time.monotonic()
+
+
+def _read_available_memory():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return round(int(line.split()[1]) / 1024)
+    return None
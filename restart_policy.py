@@ -0,0 +1,137 @@
+import random
+import time
+from collections import deque
+
+# FFmpeg log substrings per failure category, checked in this order
+FAILURE_PATTERNS = (
+    ('auth_error', (
+        'server returned 401', 'server returned 403', 'unauthorized', 'forbidden',
+        'authentication failed', 'access denied'
+    )),
+    ('destination_rejected', (
+        'rtmp_connect_stream', 'netstream.publish.badname', 'already publishing',
+        'server rejected', 'error writing trailer'
+    )),
+    ('input_down', (
+        'server returned 404', 'no such file or directory', 'invalid data found',
+        'end of file', 'stream not found'
+    )),
+    ('network', (
+        'connection refused', 'connection reset', 'connection timed out',
+        'input/output error', 'network is unreachable', 'broken pipe',
+        'name or service not known', 'temporary failure in name resolution'
+    )),
+)
+
+# Retry behaviour per failure category. Delays grow as base_delay * 2^(attempt-1)
+# up to max_delay; max_attempts=None retries until the stream is stopped.
+RESTART_POLICIES = {
+    'auth_error': {'base_delay': 30, 'max_delay': 600, 'max_attempts': 2},
+    'destination_rejected': {'base_delay': 10, 'max_delay': 300, 'max_attempts': 6},
+    'input_down': {'base_delay': 5, 'max_delay': 120, 'max_attempts': 40},
+    'network': {'base_delay': 2, 'max_delay': 60, 'max_attempts': 30},
+    'stalled': {'base_delay': 2, 'max_delay': 60, 'max_attempts': 20},
+    'exited': {'base_delay': 2, 'max_delay': 60, 'max_attempts': 10},
+}
+
+
+def classify_failure(log_line):
+    """Return the failure category of an FFmpeg log line, or None if it is not fatal."""
+    line = log_line.lower()
+    for category, patterns in FAILURE_PATTERNS:
+        if any(pattern in line for pattern in patterns):
+            return category
+    return None
+
+
+class RestartPolicy:
+    """Exponential backoff with jitter, per failure category."""
+
+    def __init__(self, policies=None, stable_after=60, jitter=0.5):
+        self.policies = policies or RESTART_POLICIES
+        self.stable_after = stable_after  # Uptime after which the attempt counter resets
+        self.jitter = jitter  # Fraction of each delay that is randomised
+
+    def next_delay(self, category, attempt):
+        """Delay before restart number `attempt` (1-based), or None to give up."""
+        policy = self.policies.get(category) or self.policies['exited']
+        if policy['max_attempts'] is not None and attempt > policy['max_attempts']:
+            return None
+        delay = min(policy['max_delay'], policy['base_delay'] * 2 ** (attempt - 1))
+        # Spread restarts of streams that failed together so they don't hit the origin at once
+        return delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+
+
+class RestartScheduler:
+    """Runs restarts on the supervisor loop with a global cap on concurrent restarts.
+
+    A restart stays in flight from its spawn until release() (first progress
+    from the new process, or its exit) or admission_timeout, whichever is first.
+    Restarts due while the cap is reached wait in FIFO order. Its state is only
+    touched on the loop; the public methods may be called from any thread.
+    """
+
+    def __init__(self, supervisor, max_concurrent=4, admission_timeout=15):
+        self.supervisor = supervisor
+        self.max_concurrent = max_concurrent
+        self.admission_timeout = admission_timeout
+        self._timers = {}
+        self._waiting = deque()
+        self._in_flight = {}
+
+    def schedule(self, key, delay, callback):
+        self._in_loop(self._schedule, key, delay, callback)
+
+    def cancel(self, key):
+        self._in_loop(self._cancel, key)
+
+    def release(self, key):
+        self._in_loop(self._release, key)
+
+    def pending(self):
+        return len(self._timers) + len(self._waiting)
+
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def _in_loop(self, callback, *args):
+        # Timers, the queue and the in-flight slots belong to the supervisor loop;
+        # calls from other threads (stops from Socket.IO handlers) are handed over
+        if self.supervisor.in_loop():
+            callback(*args)
+        else:
+            self.supervisor.call_soon(callback, *args)
+
+    def _schedule(self, key, delay, callback):
+        self._cancel(key)
+        self._timers[key] = self.supervisor.call_later(delay, self._due, key, callback)
+
+    def _cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        self._waiting = deque(item for item in self._waiting if item[0] != key)
+        self._release(key)
+
+    def _release(self, key):
+        if self._in_flight.pop(key, None) is not None:
+            self._admit()
+
+    def _due(self, key, callback):
+        self._timers.pop(key, None)
+        self._waiting.append((key, callback))
+        self._admit()
+
+    def _admit(self):
+        now = time.monotonic()
+        for key, started in list(self._in_flight.items()):
+            if now - started > self.admission_timeout:
+                del self._in_flight[key]
+        while self._waiting and len(self._in_flight) < self.max_concurrent:
+            key, callback = self._waiting.popleft()
+            self._in_flight[key] = now
+            callback(key)
+        if self._waiting and self._in_flight:
+            # Re-check once the oldest in-flight restart times out
+            oldest = min(self._in_flight.values())
+            self.supervisor.call_later(max(0.1, oldest + self.admission_timeout - now), self._admit)
@@ -0,0 +1,116 @@
+"""Background liveness and stream-parameter probing of the predefined sources.
+
+Every source is checked with ffprobe on a bounded worker pool once per
+interval. Results are cached with a TTL; a stale entry counts as unknown.
+"""
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+
+class SourceProber:
+    def __init__(self, sources, interval=60.0, ttl=180.0, workers=8, timeout=10.0, on_update=None):
+        """sources maps a source name to its input URL. on_update(catalog) is
+        called after every probe round."""
+        self.sources = dict(sources)
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.on_update = on_update
+        self.ffprobe_bin = os.environ.get('FFPROBE_BIN', 'ffprobe')
+        self._results = {}  # url -> probe result
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='source-probe')
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='source-prober', daemon=True)
+            self._thread.start()
+
+    def lookup(self, url):
+        """Fresh probe result for url, or None if it was not probed within the TTL."""
+        with self._lock:
+            result = self._results.get(url)
+        if result is None or time.monotonic() - result['_probed'] > self.ttl:
+            return None
+        return result
+
+    def catalog(self):
+        """{source name: public probe result or None} for every source."""
+        catalog = {}
+        for name, url in self.sources.items():
+            result = self.lookup(url)
+            catalog[name] = {k: v for k, v in result.items() if not k.startswith('_')} if result else None
+        return catalog
+
+    def probe_all(self):
+        list(self._pool.map(self.probe, self.sources.values()))
+
+    def probe(self, url):
+        cmd = [self.ffprobe_bin, '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format']
+        if url.startswith(('rtmp://', 'http://', 'https://')):
+            cmd += ['-rw_timeout', str(int(self.timeout * 1000000))]
+        cmd.append(url)
+        started = time.monotonic()
+        try:
+            completed = subprocess.run(cmd, capture_output=True, timeout=self.timeout + 5)
+            result = _parse_probe(completed)
+        except subprocess.TimeoutExpired:
+            result = {'live': False, 'error': 'Probe timed out'}
+        except OSError as e:
+            result = {'live': False, 'error': f'Cannot run ffprobe: {e}'}
+        result['probe_ms'] = round((time.monotonic() - started) * 1000)
+        result['checked_at'] = datetime.now(timezone.utc).isoformat()
+        result['_probed'] = time.monotonic()
+        with self._lock:
+            self._results[url] = result
+        return result
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_all()
+                if self.on_update:
+                    self.on_update(self.catalog())
+            except Exception as e:
+                print(f"Source prober error: {e}")
+            time.sleep(self.interval)
+
+
+def _parse_probe(completed):
+    if completed.returncode != 0:
+        lines = completed.stderr.decode(errors='replace').strip().splitlines()
+        return {'live': False, 'error': lines[-1] if lines else f'ffprobe exited with {completed.returncode}'}
+    try:
+        info = json.loads(completed.stdout or b'{}')
+    except ValueError:
+        return {'live': False, 'error': 'Unreadable ffprobe output'}
+    streams = info.get('streams') or []
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if video is None and audio is None:
+        return {'live': False, 'error': 'No audio or video streams'}
+
+    bit_rate = (info.get('format') or {}).get('bit_rate') or (video or {}).get('bit_rate')
+    fps = None
+    if video and video.get('avg_frame_rate', '0/0') != '0/0':
+        num, _, den = video['avg_frame_rate'].partition('/')
+        try:
+            fps = round(float(num) / float(den or 1), 2)
+        except (ValueError, ZeroDivisionError):
+            pass
+    return {
+        'live': True,
+        'error': None,
+        'video_codec': video.get('codec_name') if video else None,
+        'width': video.get('width') if video else None,
+        'height': video.get('height') if video else None,
+        'fps': fps,
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'bitrate_kbps': round(int(bit_rate) / 1000) if str(bit_rate or '').isdigit() else None
+    }
@@ -1,5 +1,10 @@
 let socket = io();
 let activeStreamData = {};
+let statusVersion = null;
+let bitrateHistory = {};  // stream name -> recent bitrate samples for sparklines
+const SPARKLINE_SECONDS = 300;
+let streamDetails = {};  // stream name -> latest stream_metrics event, for streams with details open
+let streamLogs = {};  // stream name -> log fetched when its details were opened
 let hls = null;
 
 // Wait for DOM to be fully loaded
@@ -61,6 +66,7 @@ function initializeControls() {
 
     // Start Stream Button Click
     elements.startButton.addEventListener('click', handleStartStream);
+    document.getElementById('stopAllMine').addEventListener('click', handleStopAllMine);
 }
 
 function handleStartStream() {
@@ -72,6 +78,13 @@ function handleStartStream() {
     const destSelect = document.getElementById('destination');
     const destValue = destSelect.value;
 
+    const fanOut = document.getElementById('fanOut').checked;
+    const backupSelect = document.getElementById('backupInput');
+    const backupInput = backupSelect.value || null;
+    const backupSourceName = backupInput ? backupSelect.options[backupSelect.selectedIndex].dataset.sourceName : null;
+    const profile = document.getElementById('pipelineProfile').value;
+    const rendition = document.getElementById('rendition').value;
+
     // Get the source name from the selected option
     const selectedOption = inputSelect.options[inputSelect.selectedIndex];
     const sourceName = inputSelect.value === 'custom'
@@ -89,14 +102,19 @@ function handleStartStream() {
             return;
         }
 
-        socket.emit('start_stream', {
+        emitStartStream({
             stream_name: streamName,
             input: inputSource,
             destination: 'srt',
             stream_key: srtHost,  // host:port used as key to build srt:// URL
             source_name: sourceName,
             srt_passphrase: srtPassphrase || null,
-            srt_latency: srtLatency || null
+            srt_latency: srtLatency || null,
+            fan_out: fanOut,
+            backup_input: backupInput,
+            backup_source_name: backupSourceName,
+            profile: profile,
+            rendition: rendition
         });
         return;
     }
@@ -114,12 +132,76 @@ function handleStartStream() {
         return;
     }
 
-    socket.emit('start_stream', {
+    emitStartStream({
         stream_name: streamName,
         input: inputSource,
         destination: destination,
         stream_key: streamKey,
-        source_name: sourceName
+        source_name: sourceName,
+        fan_out: fanOut,
+        backup_input: backupInput,
+        backup_source_name: backupSourceName,
+        profile: profile,
+        rendition: rendition
+    });
+}
+
+function readSchedule() {
+    // datetime-local values are local time; the server gets UTC
+    const start = document.getElementById('scheduleStart').value;
+    const stop = document.getElementById('scheduleStop').value;
+    if (!start && !stop) return null;
+    return {
+        start_at: start ? new Date(start).toISOString() : null,
+        stop_at: stop ? new Date(stop).toISOString() : null,
+        repeat: document.getElementById('scheduleRepeat').value || null
+    };
+}
+
+function emitStartStream(payload) {
+    const schedule = readSchedule();
+    if (schedule) {
+        socket.emit('schedule_stream', { ...payload, ...schedule }, (response) => {
+            if (response && !response.success) {
+                alert(response.message || 'Failed to schedule stream');
+            }
+            requestSchedule();
+        });
+        return;
+    }
+    socket.emit('start_stream', payload, (response) => {
+        // The source prober saw this input down; let the operator decide
+        if (response && response.input_offline && confirm(`${response.message}\n\nStart the stream anyway?`)) {
+            emitStartStream({ ...payload, force: true });
+        } else if (response && !response.success && !response.input_offline && response.message) {
+            // Refused by the host budget, or queued until there is room
+            alert(response.message);
+        }
+    });
+}
+
+function applySourceCatalog(catalog) {
+    // Prefix every predefined source with its last probe result
+    document.querySelectorAll('#inputSource option[data-source-name], #backupInput option[data-source-name]').forEach((option) => {
+        const name = option.dataset.sourceName;
+        if (!(name in (catalog || {}))) return;
+        const probe = catalog[name];
+        if (!probe) {
+            option.textContent = `⚪ ${name}`;
+            option.title = 'Not probed yet';
+        } else if (!probe.live) {
+            option.textContent = `🔴 ${name} (offline)`;
+            option.title = `${probe.error || 'Offline'} - checked ${new Date(probe.checked_at).toLocaleTimeString()}`;
+        } else {
+            const details = [
+                probe.width && probe.height ? `${probe.width}x${probe.height}` : null,
+                probe.video_codec,
+                probe.fps ? `${probe.fps}fps` : null,
+                probe.bitrate_kbps ? `${probe.bitrate_kbps}kb/s` : null
+            ].filter(Boolean).join(' ');
+            option.textContent = `🟢 ${name}${details ? ` · ${details}` : ''}`;
+            option.title = `Checked ${new Date(probe.checked_at).toLocaleTimeString()}`;
+        }
     });
 }
 
@@ -127,9 +209,96 @@ function initializeSocketListeners() {
     socket.on('connect', () => {
         console.log('Connected to server');
         requestStreamStatus();
+        requestSchedule();
+        socket.emit('get_source_catalog', {}, applySourceCatalog);
+        Object.keys(streamDetails).forEach((name) => socket.emit('subscribe_stream_metrics', { stream_name: name }));
     });
     
-    socket.on('stream_status_update', updateActiveStreams);
+    socket.on('stream_metrics', (metrics) => {
+        if (!(metrics.stream in streamDetails)) return;
+        streamDetails[metrics.stream] = metrics;
+        const element = document.querySelector(`[data-details="${CSS.escape(metrics.stream)}"]`);
+        if (element) element.innerHTML = formatStreamDetails(metrics);
+    });
+    
+    socket.on('stream_status_update', applyStatusUpdate);
+    socket.on('source_catalog', applySourceCatalog);
+    socket.on('schedule_changed', requestSchedule);
+    socket.on('stream_operation_result', (result) => {
+        if (!result.success) {
+            console.warn(`Could not ${result.operation} '${result.stream_name}': ${result.message}`);
+        }
+    });
+}
+
+function applyStatusUpdate(update) {
+    if (!update) return;
+
+    // Full snapshots replace local state; deltas must follow the version we hold
+    if (update.full) {
+        activeStreamData = update.streams || {};
+        statusVersion = update.version;
+    } else {
+        if (statusVersion === null || update.version <= statusVersion) return;
+        // Scoped feeds skip versions without changes to our streams; `since` is
+        // the version of the delta before this one on the same feed
+        const since = update.since ?? update.version - 1;
+        if (since > statusVersion) {
+            // Missed at least one delta - resync from a full snapshot
+            statusVersion = null;
+            requestStreamStatus();
+            return;
+        }
+        Object.assign(activeStreamData, update.streams || {});
+        (update.removed || []).forEach((name) => delete activeStreamData[name]);
+        statusVersion = update.version;
+        Object.entries(update.streams || {}).forEach(([name, data]) => appendBitrateSample(name, data.health));
+    }
+    syncBitrateHistory();
+    updateActiveStreams(activeStreamData);
+}
+
+function appendBitrateSample(name, health) {
+    const samples = bitrateHistory[name];
+    if (!samples || !health || health.bitrate_kbps == null) return;
+    samples.push(health.bitrate_kbps);
+    if (samples.length > SPARKLINE_SECONDS) samples.shift();
+}
+
+function syncBitrateHistory() {
+    // Backfill new streams once from the server; deltas extend them afterwards
+    Object.keys(bitrateHistory).forEach((name) => {
+        if (!activeStreamData[name]) delete bitrateHistory[name];
+    });
+    Object.keys(streamDetails).forEach((name) => {
+        if (!activeStreamData[name]) delete streamDetails[name];
+    });
+    Object.keys(streamLogs).forEach((name) => {
+        if (!activeStreamData[name]) delete streamLogs[name];
+    });
+    Object.keys(activeStreamData).forEach((name) => {
+        if (bitrateHistory[name]) return;
+        bitrateHistory[name] = [];
+        socket.emit('get_stream_history', { stream_name: name, window: SPARKLINE_SECONDS }, (response) => {
+            if (!response || !response.success || !bitrateHistory[name]) return;
+            const samples = response.history.series.bitrate_kbps.filter((value) => value != null);
+            bitrateHistory[name] = samples.concat(bitrateHistory[name]).slice(-SPARKLINE_SECONDS);
+        });
+    });
+}
+
+function renderSparkline(name) {
+    const samples = bitrateHistory[name] || [];
+    if (samples.length < 2) return '';
+    const width = 140, height = 28;
+    const max = Math.max(...samples) || 1;
+    const step = width / (samples.length - 1);
+    const points = samples
+        .map((value, i) => `${(i * step).toFixed(1)},${(height - (value / max) * (height - 2) - 1).toFixed(1)}`)
+        .join(' ');
+    return `<svg class="sparkline" width="${width}" height="${height}" viewBox="0 0 ${width} ${height}">
+        <title>Bitrate, last ${Math.round(samples.length / 60)} min (max ${max.toFixed(0)} kb/s)</title>
+        <polyline points="${points}" /></svg>`;
 }
 
 function showPreviewError(message) {
@@ -227,9 +396,21 @@ function updateActiveStreams(streams) {
     const container = document.getElementById('activeStreams');
     container.innerHTML = '';
     
-    Object.entries(streams).forEach(([name, data]) => {
-        const streamElement = createStreamElement(name, data);
-        container.appendChild(streamElement);
+    const entries = Object.entries(streams);
+    entries.forEach(([name, data]) => {
+        if (data.kind === 'leg' || data.kind === 'standby') return;  // Rendered under their shared ingest
+        container.appendChild(createStreamElement(name, data));
+
+        if (data.kind === 'ingest') {
+            entries
+                .filter(([, leg]) => (leg.kind === 'standby' || leg.kind === 'leg') && leg.group === name)
+                .sort(([, a], [, b]) => (b.kind === 'standby') - (a.kind === 'standby'))
+                .forEach(([legName, leg]) => {
+                    const legElement = createStreamElement(legName, leg);
+                    legElement.classList.add('stream-leg-row');
+                    container.appendChild(legElement);
+                });
+        }
     });
 }
 
@@ -237,8 +418,11 @@ function getStatusBadgeClass(status) {
     const statusClasses = {
         'active': 'status-active',
         'warning': 'status-warning',
+        'degraded': 'status-warning',
+        'stalled': 'status-failed',
         'failed': 'status-failed',
-        'restarting': 'status-active'
+        'restarting': 'status-active',
+        'queued': 'status-warning'
     };
     return `status-badge ${statusClasses[status] || 'status-active'}`;
 }
@@ -252,7 +436,20 @@ function formatHealthData(health) {
         <div class="stream-health-modern">
             <div class="health-metric"><span>FPS:</span><span>${health.fps || 0}</span></div>
             <div class="health-metric"><span>Bitrate:</span><span>${health.bitrate || '0 kb/s'}</span></div>
+            ${health.speed != null ? `<div class="health-metric ${health.behind_realtime ? 'text-danger' : ''}"><span>Speed:</span><span>${health.speed.toFixed(2)}x</span></div>` : ''}
+            ${health.startup_ms != null ? `<div class="health-metric"><span>Startup:</span><span>${health.startup_ms}ms</span></div>` : ''}
+            ${health.schedule_offset_ms != null ? `<div class="health-metric"><span>On air:</span><span>${health.schedule_offset_ms >= 0 ? '+' : ''}${health.schedule_offset_ms}ms</span></div>` : ''}
+            ${health.output_delay_ms != null ? `<div class="health-metric"><span>Delay:</span><span>${(health.output_delay_ms / 1000).toFixed(1)}s</span></div>` : ''}
+            ${health.active_input ? `<div class="health-metric ${health.active_input === 'standby' ? 'text-warning' : ''}"><span>Input:</span><span>${health.active_input === 'standby' ? 'backup' : 'primary'}</span></div>` : ''}
+            ${health.failovers ? `<div class="health-metric"><span>Failovers:</span><span>${health.failovers} (last ${health.failover_latency_ms}ms)</span></div>` : ''}
+            ${health.queue_position != null ? `<div class="health-metric text-warning"><span>Queue:</span><span>#${health.queue_position}</span></div>` : ''}
+            ${(health.renditions || []).map((r) => `<div class="health-metric ${r.speed != null && r.speed < 0.95 ? 'text-danger' : ''}"><span>${r.rendition}:</span><span>${r.speed != null ? r.speed.toFixed(2) + 'x' : '...'}</span></div>`).join('')}
+            ${health.cpu_percent != null ? `<div class="health-metric"><span>CPU:</span><span>${health.cpu_percent.toFixed(1)}%</span></div>` : ''}
+            ${health.rss_mb != null ? `<div class="health-metric"><span>Memory:</span><span>${health.rss_mb.toFixed(0)} MB</span></div>` : ''}
+            ${health.egress_kbps != null ? `<div class="health-metric ${health.egress_state === 'degraded' || health.egress_state === 'stalled' ? 'text-danger' : ''}" title="Over the last ${health.egress_window_s}s${health.expected_kbps ? `, expected ${(health.expected_kbps / 1000).toFixed(2)} Mbit/s` : ''}"><span>Egress:</span><span>${(health.egress_kbps / 1000).toFixed(2)} Mbit/s</span></div>` : ''}
+            ${health.egress_state === 'stalled' ? `<div class="health-metric text-danger"><span>Stalled:</span><span>flagged after ${(health.stall_detect_ms / 1000).toFixed(1)}s</span></div>` : ''}
             <div class="health-metric"><span>Restarts:</span><span>${health.restart_count || 0}</span></div>
+            ${health.next_restart_in != null ? `<div class="health-metric text-warning"><span>Retry:</span><span>${health.failure_category || 'failure'}, in ${health.next_restart_in}s</span></div>` : ''}
             ${health.last_error ? `<div class="health-metric text-danger"><span>Error:</span><span>${health.last_error.slice(0, 30)}...</span></div>` : ''}
         </div>
     `;
@@ -306,6 +503,11 @@ function createStreamElement(name, data) {
     
     // Use the actual source name if available, fallback to old logic for backward compatibility
     const sourceDisplay = data.source_name ? `📺 ${data.source_name}` : formatSource(data.input);
+    const displayName = data.kind === 'ingest' ? `${data.source_name} (shared ingest)`
+        : data.kind === 'standby' ? `↳ backup: ${data.source_name}`
+        : data.kind === 'leg' ? `↳ ${name}` : name;
+    const destinationDisplay = data.kind === 'ingest' ? `🔀 Fan-out`
+        : data.kind === 'standby' ? `🛟 Hot standby` : formattedDestination;
     
     // Calculate stream duration and integrate into status badge
     const duration = calculateStreamDuration(data.start_time);
@@ -313,19 +515,79 @@ function createStreamElement(name, data) {
     const statusWithDuration = `<span class="${getStatusBadgeClass(data.status)}">${statusText}</span>`;
     
     row.innerHTML = `
-        <td><strong>${name}</strong></td>
+        <td><strong>${displayName}</strong></td>
         <td>${sourceDisplay}</td>
-        <td>${formattedDestination}</td>
+        <td>${destinationDisplay}</td>
         <td>${statusWithDuration}</td>
         <td>${data.owner}</td>
-        <td>${formatHealthData(data.health)}</td>
+        <td>${formatHealthData(data.health)}${renderSparkline(name)}${name in streamDetails
+            ? `<div class="stream-details" data-details="${name}">${formatStreamDetails(streamDetails[name])}</div>${formatStreamLog(name)}` : ''}</td>
         <td>
             <button class="btn-modern btn-secondary-modern" onclick="handleStopStream('${name}')" style="padding: 6px 12px; font-size: 0.8rem;">🛑 Stop</button>
+            <button class="btn-modern btn-secondary-modern" onclick="toggleStreamDetails('${name}')" style="padding: 6px 12px; font-size: 0.8rem;">📈 ${name in streamDetails ? 'Hide' : 'Details'}</button>
         </td>
     `;
     return row;
 }
 
+function toggleStreamDetails(streamName) {
+    // Detailed metrics are only sent to clients that asked for them
+    if (streamName in streamDetails) {
+        delete streamDetails[streamName];
+        delete streamLogs[streamName];
+        socket.emit('unsubscribe_stream_metrics', { stream_name: streamName });
+        updateActiveStreams(activeStreamData);
+        return;
+    }
+    socket.emit('subscribe_stream_metrics', { stream_name: streamName }, (response) => {
+        if (!response || !response.success) return;
+        streamDetails[streamName] = null;
+        updateActiveStreams(activeStreamData);
+    });
+    refreshStreamLog(streamName);
+}
+
+function refreshStreamLog(streamName) {
+    // Logs are never pushed; they are fetched when asked for
+    socket.emit('get_stream_log', { stream_name: streamName, lines: 100 }, (response) => {
+        if (!response || !response.success || !(streamName in streamDetails)) return;
+        streamLogs[streamName] = response.log;
+        updateActiveStreams(activeStreamData);
+    });
+}
+
+function formatStreamLog(name) {
+    const log = streamLogs[name];
+    if (!log) return '';
+    const escape = (text) => String(text).replace(/[&<>"]/g, (c) => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' }[c]));
+    const time = (iso) => new Date(iso).toLocaleTimeString();
+    const events = log.events.slice(-10).map((e) => `${time(e.time)} [${e.kind}] ${e.message}`);
+    const lines = log.lines.map((l) => `${time(l.time)} ${l.text}`);
+    return `<div class="stream-log">
+        <button class="btn-modern btn-secondary-modern" onclick="refreshStreamLog('${name}')" style="padding: 2px 8px; font-size: 0.75rem;">↻ Log</button>
+        <pre>${escape(events.concat(['---'], lines).join('\n'))}</pre>
+    </div>`;
+}
+
+function formatStreamDetails(metrics) {
+    if (!metrics) return '<small>Waiting for metrics…</small>';
+    const progress = metrics.progress || {};
+    const parts = [
+        `frame ${progress.frame ?? '-'}`,
+        `fps ${progress.fps ?? '-'}`,
+        `${progress.bitrate_kbps ?? '-'} kb/s`,
+        `speed ${progress.speed ?? '-'}x`,
+        `dup ${progress.dup_frames ?? 0} / drop ${progress.drop_frames ?? 0}`,
+        `${((progress.total_size || 0) / 1048576).toFixed(1)} MB out`
+    ];
+    if (metrics.relay) {
+        Object.entries(metrics.relay.sinks || {}).forEach(([sink, stats]) => {
+            parts.push(`${sink}: backlog ${(stats.backlog_bytes / 1024).toFixed(0)} KB, dropped ${stats.bytes_dropped}`);
+        });
+    }
+    return `<small>${parts.join(' · ')}</small>`;
+}
+
 function handleStopStream(streamName) {
     // Disable the button and show stopping state
     const button = event.target;
@@ -345,6 +607,57 @@ function handleStopStream(streamName) {
     });
 }
 
+function handleStopAllMine() {
+    const button = document.getElementById('stopAllMine');
+    if (!confirm('Stop all of your streams?')) return;
+    button.disabled = true;
+    // Every stream is signalled at once; per-stream results arrive as stream_operation_result
+    socket.emit('stop_streams', { owner: button.dataset.owner }, (response) => {
+        button.disabled = false;
+        if (response.rejected) {
+            alert(`${response.rejected} stream(s) could not be stopped`);
+        }
+        requestStreamStatus();
+    });
+}
+
+function requestSchedule() {
+    socket.emit('get_schedule', {}, renderSchedule);
+}
+
+function renderSchedule(entries) {
+    const tbody = document.getElementById('scheduledStreams');
+    const escape = (text) => String(text).replace(/[&<>"]/g, (c) => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' }[c]));
+    const time = (iso) => new Date(iso).toLocaleString();
+    tbody.innerHTML = (entries || []).map((entry) => {
+        const prewarm = entry.prewarm;
+        const warnings = prewarm ? [
+            prewarm.input_live === false ? 'input offline' : null,
+            ...(prewarm.destinations || []).filter((d) => d.error).map((d) => `${d.host} unreachable`)
+        ].filter(Boolean) : [];
+        const last = entry.last;
+        const lastRun = !last ? '-' : last.error ? `<span class="text-danger">${escape(last.error)}</span>`
+            : last.offset_ms != null ? `${last.offset_ms >= 0 ? '+' : ''}${last.offset_ms}ms` : 'starting…';
+        return `<tr>
+            <td><strong>${escape(entry.stream_name)}</strong><br><small>${escape(entry.owner)}</small></td>
+            <td>${entry.next} ${time(entry.due_at)}${entry.next === 'start' && entry.stop_at ? `<br><small>until ${time(entry.stop_at)}</small>` : ''}
+                ${prewarm ? `<br><small class="${warnings.length ? 'text-danger' : ''}">${warnings.length ? escape(warnings.join(', ')) : 'pre-warmed'}</small>` : ''}</td>
+            <td>${entry.repeat ? (entry.repeat === 86400 ? 'daily' : entry.repeat === 604800 ? 'weekly' : `${entry.repeat}s`) : 'once'}</td>
+            <td>${lastRun}</td>
+            <td><button class="btn-modern btn-secondary-modern" onclick="handleCancelSchedule('${entry.id}')" style="padding: 6px 12px; font-size: 0.8rem;">✖ Cancel</button></td>
+        </tr>`;
+    }).join('');
+}
+
+function handleCancelSchedule(entryId) {
+    socket.emit('cancel_schedule', { id: entryId }, (response) => {
+        if (!response.success) {
+            alert(response.message || 'Failed to cancel');
+        }
+        requestSchedule();
+    });
+}
+
 function calculateStreamDuration(startTime) {
     if (!startTime) return '';
     
@@ -366,5 +679,5 @@ function calculateStreamDuration(startTime) {
 }
 
 function requestStreamStatus() {
-    socket.emit('get_stream_status', {}, updateActiveStreams);
+    socket.emit('get_stream_status', {}, applyStatusUpdate);
 }
@@ -0,0 +1,169 @@
+"""Per-stream logs: recent FFmpeg output and lifecycle events in bounded rings.
+
+Appending is a deque append on the supervisor loop, with no formatting and no
+I/O. Logs are only read when an operator opens a stream's details. With a log
+directory, lines and events are also written to rotating per-stream files by
+a background thread.
+"""
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+
+class StreamLog:
+    def __init__(self, owner, max_lines=500, max_events=200):
+        self.owner = owner
+        self.lines = deque(maxlen=max_lines)  # (time, text)
+        self.events = deque(maxlen=max_events)  # (time, kind, message, details)
+        self.closed_at = None
+
+
+class StreamLogStore:
+    def __init__(self, max_lines=500, max_events=200, keep_closed=50, log_dir=None, max_bytes=1024 * 1024, backups=3):
+        """Logs of stopped streams stay readable until keep_closed newer ones
+        have been closed. log_dir enables the rotating files: max_bytes per file,
+        with backups older files (name.log.1 ...) kept."""
+        self.max_lines = max_lines
+        self.max_events = max_events
+        self.keep_closed = keep_closed
+        self._logs = {}
+        self._closed = OrderedDict()
+        self._lock = threading.Lock()  # Opening and closing; appends need none
+        self._writer = _RotatingWriter(log_dir, max_bytes, backups) if log_dir else None
+
+    def open(self, stream_name, owner):
+        """Start the log of a stream unless it is open; a stopped stream of the
+        same name and owner continues its history."""
+        with self._lock:
+            if stream_name in self._logs:
+                return self._logs[stream_name]
+            log = self._closed.pop(stream_name, None)
+            if log is None or log.owner != owner:
+                log = StreamLog(owner, self.max_lines, self.max_events)
+            log.closed_at = None
+            self._logs[stream_name] = log
+        return log
+
+    def close(self, stream_name):
+        with self._lock:
+            log = self._logs.pop(stream_name, None)
+            if log is None:
+                return
+            log.closed_at = time.time()
+            self._closed[stream_name] = log
+            while len(self._closed) > self.keep_closed:
+                self._closed.popitem(last=False)
+
+    def line(self, stream_name, text):
+        log = self._logs.get(stream_name)
+        if log is not None:
+            now = time.time()
+            log.lines.append((now, text))
+            if self._writer:
+                self._writer.put(stream_name, now, text)
+
+    def event(self, stream_name, kind, message, **details):
+        log = self._logs.get(stream_name)
+        if log is not None:
+            now = time.time()
+            log.events.append((now, kind, message, details))
+            if self._writer:
+                self._writer.put(stream_name, now, f'[{kind}] {message}')
+
+    def owner(self, stream_name):
+        with self._lock:
+            log = self._logs.get(stream_name) or self._closed.get(stream_name)
+        return log.owner if log else None
+
+    def get(self, stream_name, lines=200, events=100):
+        """The newest lines and events of a stream, oldest first, or None if it has no log."""
+        with self._lock:
+            log = self._logs.get(stream_name) or self._closed.get(stream_name)
+        if log is None:
+            return None
+        # A negative count would slice from the front instead of taking a tail
+        recent_lines = list(log.lines)[-lines:] if lines > 0 else []
+        recent_events = list(log.events)[-events:] if events > 0 else []
+        return {
+            'stream': stream_name,
+            'closed_at': _iso(log.closed_at) if log.closed_at else None,
+            'lines': [{'time': _iso(at), 'text': text} for at, text in recent_lines],
+            'events': [dict(details, time=_iso(at), kind=kind, message=message)
+                       for at, kind, message, details in recent_events]
+        }
+
+
+class _RotatingWriter:
+    """Writes queued log lines to <dir>/<stream>.log on its own thread, rotating
+    each file at max_bytes. Only the most recently written files stay open."""
+
+    def __init__(self, log_dir, max_bytes, backups, max_open=64):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_open = max_open
+        self._files = OrderedDict()  # stream -> open file
+        self._queue = queue.SimpleQueue()
+        os.makedirs(log_dir, mode=0o700, exist_ok=True)
+        threading.Thread(target=self._run, name='stream-log-writer', daemon=True).start()
+
+    def put(self, stream_name, at, text):
+        self._queue.put((stream_name, at, text))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            grouped = {}
+            for stream_name, at, text in batch:
+                grouped.setdefault(stream_name, []).append(f'{_iso(at)} {text}\n')
+            for stream_name, lines in grouped.items():
+                try:
+                    self._write(stream_name, ''.join(lines))
+                except OSError as e:
+                    print(f"Error writing log file of stream '{stream_name}': {e}")
+
+    def _write(self, stream_name, text):
+        f = self._files.pop(stream_name, None)
+        if f is None:
+            # FFmpeg's stderr can carry stream keys and SRT passphrases
+            fd = os.open(self._path(stream_name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            os.fchmod(fd, 0o600)  # Also for files left by versions that used the umask
+            f = os.fdopen(fd, 'a', encoding='utf-8')
+        self._files[stream_name] = f
+        f.write(text)
+        f.flush()
+        if f.tell() >= self.max_bytes:
+            f.close()
+            del self._files[stream_name]
+            self._rotate(self._path(stream_name))
+        while len(self._files) > self.max_open:
+            self._files.popitem(last=False)[1].close()
+
+    def _rotate(self, path):
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{index}'):
+                os.replace(f'{path}.{index}', f'{path}.{index + 1}')
+        if self.backups:
+            os.replace(path, f'{path}.1')
+        else:
+            os.unlink(path)
+
+    def _path(self, stream_name):
+        # Stream names are user input; keep them readable but safe as file names
+        safe = re.sub(r'[^A-Za-z0-9_.-]+', '_', stream_name)[:64].lstrip('.')
+        digest = hashlib.sha1(stream_name.encode()).hexdigest()[:8]
+        return os.path.join(self.log_dir, f'{safe}-{digest}.log')
+
+
+def _iso(at):
+    return datetime.fromtimestamp(at, timezone.utc).isoformat()
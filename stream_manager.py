@@ -1,130 +1,1455 @@
 import subprocess
 import threading
-import time
-import select
 import os
-import fcntl
+import hashlib
+import re
+import signal
+import socket
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from supervisor import StreamSupervisor
+from restart_policy import RestartPolicy, RestartScheduler, classify_failure
+from stream_metrics import MetricsStore
+from stream_log import StreamLogStore
+from stream_state import Payload, StreamStateStore
+from metrics_exporter import Histogram
+from resource_monitor import HostBudget, ResourceMonitor
+from stream_schedule import StreamSchedule
+from stream_registry import AttachedProcess, process_start_time
+
+# Input of an egress leg: MPEG-TS relayed from the shared ingest on stdin
+RELAY_INPUT = 'pipe:0'
+
+# Per-stream FFmpeg tuning, selected with the `profile` field of start_stream.
+# realtime: read network inputs at native rate (-re); file inputs always are.
+# input: options for every input, relay pipes included; source: options for
+# the original source only; output: muxer options.
+PIPELINE_PROFILES = {
+    'standard': {
+        'realtime': True,
+        'input': [],
+        'source': [],
+        'output': []
+    },
+    'low-latency': {
+        # Live sources already arrive in real time; -re would only add buffering
+        'realtime': False,
+        'input': ['-fflags', 'nobuffer', '-flags', 'low_delay',
+                  '-probesize', '500000', '-analyzeduration', '1000000'],
+        'source': [],
+        'output': ['-flush_packets', '1']
+    },
+    'resilient': {
+        'realtime': True,
+        'input': ['-thread_queue_size', '4096'],
+        'source': ['-probesize', '10000000', '-analyzeduration', '10000000',
+                   '-rw_timeout', '15000000'],
+        'output': ['-max_muxing_queue_size', '4096']
+    },
+}
+
+# Encoder presets for transcoded outputs (libx264 and AAC on the CPU), selected
+# per output with `rendition`; 'copy' passes the source through untouched.
+# Renditions of one process share a single decode of the input. height is a
+# ceiling (smaller sources are not upscaled), fps a cap (None keeps the source
+# rate). cpu_percent is a rough cost in percent of one core for admission control.
+RENDITIONS = {
+    '1080p': {'height': 1080, 'fps': None, 'video_kbps': 6000, 'audio_kbps': 160, 'preset': 'veryfast', 'cpu_percent': 150},
+    '720p': {'height': 720, 'fps': None, 'video_kbps': 3000, 'audio_kbps': 128, 'preset': 'veryfast', 'cpu_percent': 80},
+    # Instagram Live takes at most 720p at 30 fps
+    'instagram': {'height': 720, 'fps': 30, 'video_kbps': 3500, 'audio_kbps': 128, 'preset': 'veryfast', 'cpu_percent': 70},
+    '480p': {'height': 480, 'fps': 30, 'video_kbps': 1200, 'audio_kbps': 96, 'preset': 'veryfast', 'cpu_percent': 35},
+    # For partners on thin links
+    '360p': {'height': 360, 'fps': 30, 'video_kbps': 600, 'audio_kbps': 64, 'preset': 'superfast', 'cpu_percent': 20},
+}
+
+
+def _ladder_filter(renditions):
+    """filter_complex that decodes the first video stream once and scales one
+    branch per rendition, labelled [v0], [v1], ..."""
+    if len(renditions) == 1:
+        sources, graph = ['[0:v:0]'], []
+    else:
+        sources = [f'[s{i}]' for i in range(len(renditions))]
+        graph = [f"[0:v:0]split={len(renditions)}{''.join(sources)}"]
+    for i, name in enumerate(renditions):
+        preset = RENDITIONS[name]
+        chain = f"scale=-2:'min({preset['height']},ih)'"
+        if preset['fps']:
+            chain += f",fps={preset['fps']}"
+        graph.append(f'{sources[i]}{chain}[v{i}]')
+    return ';'.join(graph)
+
+
+def _encoder_args(preset):
+    kbps = preset['video_kbps']
+    return ['-c:v', 'libx264', '-preset', preset['preset'], '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+            '-b:v', f'{kbps}k', '-maxrate', f'{kbps}k', '-bufsize', f'{kbps * 2}k',
+            # Keyframe every 2 seconds whatever the frame rate, as the live platforms require
+            '-force_key_frames', 'expr:gte(t,n_forced*2)',
+            '-c:a', 'aac', '-b:a', f"{preset['audio_kbps']}k", '-ar', '48000']
+
+
+# The passphrase parameter of an SRT URL, up to the next parameter
+SRT_PASSPHRASE_PARAM = re.compile(r'(passphrase=)[^&\s]+')
+
+# Socket.IO rooms: admins get every status delta, other users only the deltas
+# of streams they can see, and per-stream metrics go to their subscribers only
+ADMIN_ROLES = ('master_admin', 'admin')
+ADMIN_ROOM = 'admins'
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+def metrics_room(stream_name):
+    return f'metrics:{stream_name}'
+
 
 class StreamManager:
-    def __init__(self, socketio):
+    def __init__(self, socketio, registry=None, runtime_dir=None, prober=None, budget=None):
         self.active_streams = {}
         self.socketio = socketio
-        self.max_restart_attempts = 3  # Maximum restart attempts before giving up
-        self.restart_delay = 5  # Delay in seconds between restarts
+        self.registry = registry  # Optional StreamRegistry for crash-safe recovery
+        self.prober = prober  # Optional SourceProber with cached liveness and stream parameters
+        self.runtime_dir = runtime_dir or tempfile.mkdtemp(prefix='restream-')
+        os.makedirs(self.runtime_dir, mode=0o700, exist_ok=True)
+        # Parallel spawns for bulk starts and recovery; further starts queue for a worker
+        self.spawn_workers = int(os.environ.get('MAX_CONCURRENT_SPAWNS', 8))
+        self._spawn_pool = ThreadPoolExecutor(max_workers=self.spawn_workers, thread_name_prefix='stream-spawn')
+        self.heartbeat_timeout = 30  # Seconds without FFmpeg output before a stream is considered dead
+        self.progress_period = 1  # Seconds between FFmpeg -progress reports
+        self.min_realtime_speed = 0.95  # Below this encode speed a stream is falling behind realtime
+        self.ffmpeg_bin = os.environ.get('FFMPEG_BIN', 'ffmpeg')  # e.g. a stand-in for load tests
+        self.failover_stall_timeout = 0.5  # Seconds without primary input before switching to the backup
+        self.failover_switch_back = 5.0  # Seconds of healthy primary input before switching back
+        # Per-rendition encode stats need -stats_enc_post (FFmpeg 6.1+); 0 turns them off for older builds
+        self.encoder_stats = os.environ.get('FFMPEG_ENCODER_STATS', '1') != '0'
 
-    def start_stream(self, stream_name, input_source, destination, stream_key, owner, source_name=None, srt_passphrase=None, srt_latency=None):
-        if stream_name in self.active_streams:
-            print(f"Stream '{stream_name}' is already running.")
-            return False
+        # Bounded per-stream history of the numeric health fields
+        self.metrics = MetricsStore()
+        # Recent FFmpeg output and lifecycle events per stream, read on demand;
+        # STREAM_LOG_DIR also writes them to rotating files
+        self.logs = StreamLogStore(
+            max_lines=int(os.environ.get('STREAM_LOG_LINES', 500)),
+            log_dir=os.environ.get('STREAM_LOG_DIR') or None
+        )
+        self.spawn_latency = Histogram((0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+        self.startup_latency = Histogram((0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0))
+        self.status_emits = 0
+
+        # One event loop watches every FFmpeg process instead of a thread per stream.
+        # Egress processes are judged by the bytes they write over a rolling
+        # window: EGRESS_WINDOW seconds is how long a stall takes to be flagged
+        # (it must span a few progress periods), EGRESS_DEGRADED_RATIO of the
+        # expected bitrate is the degraded threshold, and a stall lasting
+        # EGRESS_STALL_RESTART more seconds restarts the stream (0 only flags it).
+        self.supervisor = StreamSupervisor(
+            egress_window=max(float(os.environ.get('EGRESS_WINDOW', 3)), 2 * self.progress_period),
+            degraded_ratio=float(os.environ.get('EGRESS_DEGRADED_RATIO', 0.5)),
+            stall_restart_after=float(os.environ.get('EGRESS_STALL_RESTART', 10))
+        )
+
+        # Restarts back off per failure category and are capped globally, so a
+        # source outage does not make every stream hit the origin at the same moment
+        self.restart_policy = RestartPolicy()
+        self.restart_scheduler = RestartScheduler(
+            self.supervisor, max_concurrent=int(os.environ.get('MAX_CONCURRENT_RESTARTS', 4))
+        )
+
+        # Status broadcasts are coalesced: stat changes only mark a stream dirty and
+        # a background tick commits the changed streams to the state store and
+        # sends them as a versioned delta. Readers only ever see store snapshots.
+        self.status_interval = float(os.environ.get('STATUS_BROADCAST_INTERVAL', 1.0))
+        self.state = StreamStateStore()
+        self._viewers = {}  # Non-admin user -> connected clients
+        self._room_versions = {}  # User room -> version of its last delta
+        self._metrics_subscribers = {}  # Stream -> clients subscribed to its detailed metrics
+        self._remote_views = {}  # Streams run by worker agents (see cluster.py), merged into the feed
+        self._dirty_streams = set()
+        self._removed_streams = set()
+        self._status_lock = threading.Lock()
+        self.supervisor.call_later(self.status_interval, self._broadcast_tick)
 
-        cmd_args = self._build_ffmpeg_command(input_source, destination, stream_key, srt_passphrase, srt_latency)
-        # Log command without exposing stream key
-        safe_args = [('[STREAM_KEY_REDACTED]' if (stream_key and stream_key in arg) else arg) for arg in cmd_args]
-        print(f"Starting stream '{stream_name}' with command: {' '.join(safe_args)}")
+        # New streams are admitted against the host budget (HostBudget.from_env()
+        # unless given), from the measured host load plus the expected cost of
+        # streams that were admitted but do not show in the measurements yet.
+        # Recovery and automatic restarts of admitted streams are not checked.
+        self.budget = budget or HostBudget.from_env()
+        # Cost of a stream before any have been measured; cpu_percent is of one core
+        self.default_stream_cost = {
+            'cpu_percent': float(os.environ.get('STREAM_CPU_ESTIMATE', 5)),
+            'egress_kbps': float(os.environ.get('STREAM_EGRESS_ESTIMATE_KBPS', 5000)),
+            'rss_mb': 50.0
+        }
+        self.reservation_time = 30.0  # Seconds a new stream's expected cost is held at most
+        self.admission_queue_timeout = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 300))
+        self.admission_rejections = 0
+        self._admission_lock = threading.RLock()
+        self._reservations = {}  # Stream -> (expected cost, expiry)
+        self._queued = OrderedDict()  # Stream -> {'owner', 'spec', 'queued_at', 'reason'}
+        self._starting = set()  # Streams whose start is in progress; guarded by _admission_lock
+        self._ingest_lock = threading.RLock()  # Creation of shared ingests and changes to their legs
+        self._rejections = OrderedDict()  # Stream -> reason of its last refused start
+        self.resources = ResourceMonitor(
+            self._process_pids, interval=float(os.environ.get('RESOURCE_SAMPLE_INTERVAL', 2.0)),
+            on_sample=lambda usage, host: self.supervisor.call_soon(self._apply_resource_usage, usage, host)
+        )
+        self.resources.start()
+
+        # Timed starts and stops, kept in the registry database so they survive
+        # a restart. Each start is pre-warmed (input probed, destinations resolved
+        # and connected) and fired early by its learnt startup time, so that
+        # output begins at the scheduled moment; the offset is measured.
+        self.control = self  # Where scheduled starts and stops go; main.py points it at the cluster
+        self.schedule_start_lead = float(os.environ.get('SCHEDULE_START_LEAD', 2.0))
+        self.schedule_offset = Histogram((0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+        self._scheduled_starts = {}  # Stream -> (schedule entry, scheduled time) until its first output
+        self._prewarm_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='stream-prewarm')
+        self.schedule = StreamSchedule(
+            registry.path if registry else None,
+            prewarm_lead=float(os.environ.get('SCHEDULE_PREWARM_LEAD', 30)),
+            estimate_lead=self._expected_startup,
+            on_due=self._on_schedule_due,
+            on_change=self._on_schedule_change
+        )
 
+        if self.registry:
+            self.recover()
+        # After recovery, so starts missed while the server was down see reattached streams
+        self.schedule.start()
+
+    def start_stream(self, stream_name, input_source, destination, stream_key, owner, source_name=None, srt_passphrase=None, srt_latency=None, fan_out=False, backup_input=None, backup_source_name=None, profile='standard', force=False, rendition='copy', outputs=None):
+        # Take the name before anything is spawned, so that two concurrent
+        # starts of the same stream cannot both run FFmpeg
+        with self._admission_lock:
+            if stream_name in self.active_streams or stream_name in self._starting:
+                print(f"Stream '{stream_name}' is already running.")
+                return False
+            self._starting.add(stream_name)
         try:
-            process = subprocess.Popen(
-                cmd_args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
+            return self._start_stream(
+                stream_name, input_source, destination, stream_key, owner, source_name=source_name,
+                srt_passphrase=srt_passphrase, srt_latency=srt_latency, fan_out=fan_out, backup_input=backup_input,
+                backup_source_name=backup_source_name, profile=profile, force=force, rendition=rendition, outputs=outputs
             )
+        finally:
+            with self._admission_lock:
+                self._starting.discard(stream_name)
 
-            self.active_streams[stream_name] = {
-                'process': process,
-                'input': input_source,
-                'destination': destination,
-                'stream_key': stream_key,
-                'srt_passphrase': srt_passphrase,
-                'srt_latency': srt_latency,
-                'status': 'active',
-                'owner': owner,
-                'source_name': source_name or 'Unknown',
-                'start_time': datetime.now(timezone.utc).isoformat(),
-                'health': {
-                    'fps': 0,
-                    'bitrate': '0 kb/s',
-                    'last_error': None,
-                    'restart_count': 0,
-                    'last_restart': None,
-                    'last_health_check': datetime.now(timezone.utc).isoformat()
-                }
+    def _start_stream(self, stream_name, input_source, destination, stream_key, owner, source_name=None, srt_passphrase=None, srt_latency=None, fan_out=False, backup_input=None, backup_source_name=None, profile='standard', force=False, rendition='copy', outputs=None):
+        rendition = rendition or 'copy'
+        outputs = [dict(output, rendition=output.get('rendition') or 'copy') for output in outputs or ()]
+        error = self._spec_error(profile, rendition, outputs)
+        if error:
+            print(f"Not starting stream '{stream_name}': {error}.")
+            return False
+        # Known-dead inputs would only burn restart attempts; force starts them anyway
+        warning = self.input_warning(input_source)
+        if warning and not force:
+            print(f"Not starting stream '{stream_name}': {warning}")
+            return False
+        reason = self._admit(stream_name, input_source, fan_out or bool(backup_input), backup_input, profile,
+                             [rendition] + [output['rendition'] for output in outputs])
+        if reason:
+            spec = {
+                'input_source': input_source, 'destination': destination, 'stream_key': stream_key,
+                'source_name': source_name, 'srt_passphrase': srt_passphrase, 'srt_latency': srt_latency,
+                'fan_out': fan_out, 'backup_input': backup_input, 'backup_source_name': backup_source_name,
+                'profile': profile, 'force': force, 'rendition': rendition, 'outputs': outputs
             }
-            print(f"Stream '{stream_name}' started successfully.")
-            # Start monitoring the stream
-            threading.Thread(
-                target=self._monitor_stream,
-                args=(stream_name, process),
-                daemon=True
-            ).start()
-            return True
+            self._refuse(stream_name, owner, spec, reason)
+            return False
+
+        stream = self._new_stream(
+            'stream', input_source, destination, stream_key, owner, source_name,
+            srt_passphrase=srt_passphrase, srt_latency=srt_latency, profile=profile,
+            rendition=rendition, outputs=outputs
+        )
+        # A backup input needs the relay, which can switch sources under a running egress
+        fan_out = fan_out or bool(backup_input)
+        if fan_out:
+            # Share one ingest process per input; this stream becomes one of its egress legs
+            group = self._ensure_ingest(stream_name, input_source, owner, source_name, backup_input, backup_source_name, profile)
+            if not group:
+                self._release_reservation(stream_name)
+                return False
+            stream['kind'] = 'leg'
+            stream['group'] = group
 
+        try:
+            self._spawn(stream_name, stream)
         except Exception as e:
             print(f"Error starting stream '{stream_name}': {e}")
+            self._release_reservation(stream_name)
+            if fan_out:
+                self._release_leg(stream_name, stream)
             return False
 
-    def stop_stream(self, stream_name, user_role, user_id):
+        self.active_streams[stream_name] = stream
+        self._persist(stream_name)
+        self.logs.event(stream_name, 'started', 'Stream started', owner=owner)
+        print(f"Stream '{stream_name}' started successfully.")
+        self._emit_status_now(stream_name)
+        return True
+
+    def start_streams(self, specs, owner, on_result=None):
+        """Start several streams at once and wait for all of them.
+
+        specs are dicts of start_stream keyword arguments (stream_name,
+        input_source, destination, ...). Spawns run in parallel on the spawn
+        pool, which caps how many run at a time; legs that share an ingest start
+        one after another so the ingest is created once. on_result(stream_name,
+        success, message) fires as each stream is done. Returns {stream_name: success}.
+        """
+        results = {}
+        batches = {}
+        names = set()
+        for spec in specs:
+            name = spec.get('stream_name')
+            if not name or name in names:
+                results[name] = False
+                if on_result:
+                    on_result(name, False, 'Missing or duplicate stream name')
+                continue
+            names.add(name)
+            if spec.get('fan_out') or spec.get('backup_input'):
+                key = self._ingest_group(spec.get('input_source'), spec.get('backup_input'), spec.get('profile') or 'standard')
+            else:
+                key = name
+            batches.setdefault(key, []).append(spec)
+
+        def start_batch(batch):
+            for spec in batch:
+                name = spec['stream_name']
+                try:
+                    success = self.start_stream(owner=owner, **spec)
+                except Exception as e:
+                    print(f"Error starting stream '{name}': {e}")
+                    success = False
+                results[name] = success
+                if on_result:
+                    on_result(name, success, 'Stream started' if success else self.admission_message(name))
+
+        list(self._spawn_pool.map(start_batch, batches.values()))
+        return results
+
+    def input_warning(self, input_source):
+        """Why input_source is known to be down, or None if it is up or unknown."""
+        probe = self.prober.lookup(input_source) if self.prober else None
+        if probe is None or probe['live']:
+            return None
+        return f"Input appears to be offline ({probe['error']}; checked {probe['checked_at']})"
+
+    def admission_message(self, stream_name):
+        """Why the last start of stream_name did not go through: queued or refused
+        by admission control, or a generic failure."""
+        with self._admission_lock:
+            entry = self._queued.get(stream_name)
+            if entry is not None:
+                position = list(self._queued).index(stream_name) + 1
+                return f"Queued at position {position}: {entry['reason']}"
+            return self._rejections.pop(stream_name, None) or 'Failed to start stream'
+
+    def is_queued(self, stream_name):
+        return stream_name in self._queued
+
+    def resource_status(self):
+        """Host load, budget and admission queue, for the dashboard and /metrics."""
+        with self._admission_lock:
+            load = self._host_load(time.monotonic())
+            queued = list(self._queued)
+        return {
+            'host': self.resources.host(),
+            'load': load,
+            'budget': self.budget.limits(),
+            'queued': queued,
+            'rejections': self.admission_rejections
+        }
+
+    def schedule_stream(self, stream_name, owner, user_role, spec=None, start_at=None, stop_at=None, repeat=0):
+        """Schedule a start at start_at (spec holds the other start_stream keyword
+        arguments) and/or a stop at stop_at, both epoch seconds, every repeat
+        seconds if repeat. A stop alone applies to a stream started otherwise.
+        Returns (entry view, None) or (None, why it was refused)."""
+        now = time.time()
+        if not stream_name:
+            return None, 'Missing stream name'
+        if start_at is None and stop_at is None:
+            return None, 'A start or stop time is needed'
+        if start_at is not None and stop_at is not None and stop_at <= start_at:
+            return None, 'The stop time must be after the start time'
+        if (stop_at if stop_at is not None else start_at) <= now:
+            return None, 'The scheduled time has already passed'
+        if repeat and (repeat < 60 or (start_at is not None and stop_at is not None and stop_at - start_at >= repeat)):
+            return None, 'Repeating slots must be at least a minute apart and must not overlap'
+        if start_at is not None:
+            spec = dict(spec or {})
+            spec.pop('stream_name', None)
+            if not spec.get('input_source') or not spec.get('destination'):
+                return None, 'A scheduled start needs an input and a destination'
+            spec['profile'] = spec.get('profile') or 'standard'
+            spec['rendition'] = spec.get('rendition') or 'copy'
+            spec['outputs'] = [dict(o, rendition=o.get('rendition') or 'copy') for o in spec.get('outputs') or ()]
+            error = self._spec_error(spec['profile'], spec['rendition'], spec['outputs'])
+            if error:
+                return None, error
+        else:
+            spec = None
+            # A timed stop acts for the stream's owner
+            stream = self.active_streams.get(stream_name) or self._remote_views.get(stream_name)
+            if stream is not None:
+                if user_role not in ADMIN_ROLES and stream['owner'] != owner:
+                    return None, 'Permission denied'
+                owner = stream['owner']
+        return self.schedule.add(stream_name, owner, spec, start_at, stop_at, repeat), None
+
+    def cancel_schedule(self, entry_id, user_role, user_id):
+        entry = self.schedule.get(entry_id)
+        if entry is None:
+            return False, 'Schedule entry not found'
+        if user_role not in ADMIN_ROLES and entry['owner'] != user_id:
+            return False, 'Permission denied'
+        self.schedule.cancel(entry_id)
+        return True, 'Schedule entry cancelled'
+
+    def get_schedule(self, user_id=None):
+        """Scheduled starts and stops, without stream keys; only user_id's unless None."""
+        return self.schedule.entries(owner=user_id)
+
+    def stop_stream(self, stream_name, user_role, user_id, on_stopped=None):
+        """Stop a stream without waiting for FFmpeg to exit.
+        on_stopped(stream_name, returncode) fires once the process is gone."""
+        with self._admission_lock:
+            entry = self._queued.get(stream_name)
+            if entry is not None and user_role not in ADMIN_ROLES and entry['owner'] != user_id:
+                return False, 'Permission denied'
+            if entry is not None:
+                del self._queued[stream_name]
+        if entry is not None:
+            self._emit_status_now(stream_name, removed=True)
+            if on_stopped:
+                on_stopped(stream_name, None)
+            return True, 'Stream removed from the admission queue'
+
         stream = self.active_streams.get(stream_name)
         if not stream:
             return False, 'Stream not found'
-
-        # Permission check: allow master_admin, admin, or owner of the stream
-        if user_role not in ['master_admin', 'admin'] and stream['owner'] != user_id:
+        if not self._may_stop(stream, user_role, user_id):
             return False, 'Permission denied'
 
-        # Stop the stream process with timeout
+        legs = list(stream['legs']) if stream.get('kind') == 'ingest' else ()
+        # The ingest goes first: stopping its last leg would otherwise stop it
+        # through _release_leg, without on_stopped
+        self._stop_process(stream_name, on_stopped)
+        # Stopping the shared ingest stops every leg fed by it
+        for leg in legs:
+            self._stop_process(leg)
+        return True, 'Stream stopped successfully'
+
+    def stop_streams(self, stream_names, user_role, user_id, on_result=None):
+        """Stop several streams at once. Every process gets SIGTERM right away
+        and is reaped by the supervisor; on_result(stream_name, success, message)
+        fires once a stream's process has exited, or at once if it cannot be
+        stopped. Returns {stream_name: (accepted, message)}."""
+        def stopped(name, returncode):
+            if on_result:
+                exit_info = f' (exit code {returncode})' if returncode is not None else ''
+                on_result(name, True, f'Stream stopped{exit_info}')
+
+        results = {}
+        for name in stream_names:
+            results[name] = self.stop_stream(name, user_role, user_id, on_stopped=stopped)
+            if not results[name][0] and on_result:
+                on_result(name, False, results[name][1])
+        return results
+
+    def stop_owner_streams(self, owner, user_role, user_id, on_result=None):
+        """Stop every stream started by owner (shared ingests stop with their last leg)."""
+        names = [name for name, stream in list(self.active_streams.items())
+                 if stream['owner'] == owner and stream.get('kind', 'stream') in ('stream', 'leg')]
+        names += [name for name, entry in list(self._queued.items()) if entry['owner'] == owner]
+        return self.stop_streams(names, user_role, user_id, on_result)
+
+    def stop_source_streams(self, input_source, user_role, user_id, on_result=None):
+        """Stop every stream that restreams input_source."""
+        names = [name for name, stream in list(self.active_streams.items())
+                 if stream['input'] == input_source and stream.get('kind', 'stream') in ('stream', 'leg')]
+        names += [name for name, entry in list(self._queued.items()) if entry['spec']['input_source'] == input_source]
+        return self.stop_streams(names, user_role, user_id, on_result)
+
+    def _may_stop(self, stream, user_role, user_id):
+        # Allow master_admin, admin, or owner of the stream. A shared ingest
+        # (and its standby) belongs to whoever owns all of its legs.
+        if user_role in ADMIN_ROLES:
+            return True
+        if stream.get('kind') in ('ingest', 'standby'):
+            ingest = self.active_streams.get(stream['group']) or {}
+            owners = {self.active_streams[leg]['owner'] for leg in ingest.get('legs', ()) if leg in self.active_streams}
+            return not owners - {user_id}
+        return stream['owner'] == user_id
+
+    def _stop_process(self, stream_name, on_stopped=None):
+        # Forget the stream first so the supervisor does not restart it when it exits
+        stream = self.active_streams.pop(stream_name, None)
+        if not stream:
+            return
+        self.restart_scheduler.cancel(stream_name)
+        self._scheduled_starts.pop(stream_name, None)
+        self._forget(stream_name)
+        self.metrics.remove(stream_name)
+
+        kind = stream.get('kind')
+        if kind == 'leg':
+            self._release_leg(stream_name, stream)
+        elif kind == 'standby':
+            self._release_standby(stream_name, stream)
+        elif kind == 'ingest':
+            if stream.get('standby'):
+                self._stop_process(stream['standby'])
+            self.supervisor.close_relay(stream_name)
+
+        self.logs.event(stream_name, 'stopping', 'Stop requested')
+
+        def reaped(key, returncode):
+            self.logs.event(key, 'stopped', f'Stopped (exit code {returncode})', returncode=returncode)
+            if key not in self.active_streams:
+                self.logs.close(key)
+            if returncode is not None:
+                print(f"Stream '{key}' stopped successfully.")
+            if on_stopped:
+                on_stopped(key, returncode)
+
+        # Never wait here: the supervisor signals the process group, escalates to
+        # SIGKILL after its grace period and reaps the child on its own loop
+        self.supervisor.terminate(stream_name, on_reaped=reaped)
+
+        # Notify clients of the removal
+        self._emit_status_now(stream_name, removed=True)
+        # Its held cost goes with it, so a queued stream may fit now
+        self._release_reservation(stream_name)
+        self._drain_admission_queue(time.monotonic())
+
+    def _admit(self, stream_name, input_source, shared, backup_input=None, profile='standard', renditions=('copy',)):
+        """Check a new stream against the host budget and hold its expected cost
+        until it shows in the measurements. Returns why it does not fit, or None."""
+        with self._admission_lock:
+            now = time.monotonic()
+            for name in [n for n, (_, expires) in self._reservations.items() if expires <= now]:
+                del self._reservations[name]
+            if stream_name in self._reservations:
+                return None  # Admitted from the queue
+            new_ingest = shared and self._ingest_group(input_source, backup_input, profile) not in self.active_streams
+            cost = self._stream_cost(input_source, new_ingest, renditions)
+            reason = self.budget.check(self._host_load(now), cost)
+            if reason is None:
+                self._reservations[stream_name] = (cost, now + self.reservation_time)
+            return reason
+
+    def _release_reservation(self, stream_name):
+        with self._admission_lock:
+            self._reservations.pop(stream_name, None)
+
+    def _refuse(self, stream_name, owner, spec, reason):
+        with self._admission_lock:
+            self.admission_rejections += 1
+            if self.budget.mode == 'queue' and stream_name not in self._queued:
+                self._queued[stream_name] = {'owner': owner, 'spec': spec, 'queued_at': time.monotonic(), 'reason': reason}
+                queued = True
+            else:
+                self._rejections[stream_name] = reason
+                while len(self._rejections) > 100:
+                    self._rejections.popitem(last=False)
+                queued = False
+        if queued:
+            print(f"Stream '{stream_name}' queued: {reason}")
+            self._emit_status_now(stream_name)
+        else:
+            print(f"Not starting stream '{stream_name}': {reason}")
+
+    def _stream_cost(self, input_source, new_ingest=False, renditions=('copy',)):
+        """Expected cost of one more stream: the mean of the measured copy-only
+        streams (or the defaults), with the source bitrate from the prober as
+        the egress of each copy output, plus the preset cost of each transcoded
+        rendition. CPU is in percent of all cores, like the host load it is added to."""
+        measured = [stream['health'] for stream in list(self.active_streams.values())
+                    if stream.get('kind', 'stream') in ('stream', 'leg') and stream['health'].get('cpu_percent') is not None
+                    and not stream.get('outputs') and stream.get('rendition', 'copy') == 'copy']
+        cost = dict(self.default_stream_cost)
+        for field in cost:
+            values = [health[field] for health in measured if health.get(field) is not None]
+            if values:
+                cost[field] = sum(values) / len(values)
+        probe = self.prober.lookup(input_source) if self.prober else None
+        if probe and probe.get('bitrate_kbps'):
+            cost['egress_kbps'] = probe['bitrate_kbps']
+        if new_ingest:
+            # The shared ingest is one more process of about the same weight
+            cost['cpu_percent'] *= 2
+            cost['rss_mb'] *= 2
+        copies = sum(1 for name in renditions if name == 'copy')
+        encoded = [RENDITIONS[name] for name in renditions if name != 'copy']
+        cost['egress_kbps'] = cost['egress_kbps'] * copies + sum(p['video_kbps'] + p['audio_kbps'] for p in encoded)
+        cost['cpu_percent'] += sum(preset['cpu_percent'] for preset in encoded)
+        cost['cpu_percent'] /= self.resources.cpu_count
+        return cost
+
+    def _host_load(self, now):
+        """Measured host load plus the held cost of streams not measured yet."""
+        host = self.resources.host()
+        held = [cost for name, (cost, expires) in self._reservations.items() if expires > now]
+        streams = sum(1 for stream in list(self.active_streams.values()) if stream.get('kind', 'stream') in ('stream', 'leg'))
+        return {
+            'streams': streams + sum(1 for name in self._reservations if name not in self.active_streams),
+            'cpu_percent': host.get('cpu_percent', 0.0) + sum(cost['cpu_percent'] for cost in held),
+            'egress_kbps': host.get('egress_kbps', 0.0) + sum(cost['egress_kbps'] for cost in held),
+            'rss_mb': sum(stream['health'].get('rss_mb') or 0 for stream in list(self.active_streams.values()))
+                      + sum(cost['rss_mb'] for cost in held)
+        }
+
+    def _process_pids(self):
+        """{stream: pid} of every running FFmpeg process, for the resource monitor."""
+        return {name: stream['process'].pid for name, stream in list(self.active_streams.items())
+                if stream.get('process') is not None}
+
+    def _apply_resource_usage(self, usage, host):
+        """Runs on the supervisor loop after each resource sample."""
+        now = time.monotonic()
+        for name, stream in list(self.active_streams.items()):
+            entry = usage.get(name)
+            if entry is None:
+                continue
+            health = stream['health']
+            health['cpu_percent'] = entry['cpu_percent']
+            health['rss_mb'] = entry['rss_mb']
+            if entry['cpu_percent'] is not None and stream.get('_output_started'):
+                # Its cost shows in the host load from now on
+                self._release_reservation(name)
+            self._mark_dirty(name)
+        self._drain_admission_queue(now)
+
+    def _drain_admission_queue(self, now):
+        """Start queued streams in order while the head of the queue fits."""
+        expired, admitted = [], []
+        with self._admission_lock:
+            for name, entry in list(self._queued.items()):
+                if now - entry['queued_at'] > self.admission_queue_timeout:
+                    del self._queued[name]
+                    expired.append(name)
+            while self._queued:
+                name, entry = next(iter(self._queued.items()))
+                spec = entry['spec']
+                reason = self._admit(name, spec['input_source'], spec['fan_out'] or bool(spec['backup_input']),
+                                     spec['backup_input'], spec['profile'],
+                                     [spec['rendition']] + [output['rendition'] for output in spec['outputs']])
+                if reason:
+                    entry['reason'] = reason
+                    break
+                del self._queued[name]
+                admitted.append((name, entry))
+            waiting = list(self._queued)
+        for name in expired:
+            print(f"Stream '{name}' left the admission queue after {self.admission_queue_timeout:.0f}s without room.")
+            self._mark_dirty(name, removed=True)
+        for name, entry in admitted:
+            self._spawn_pool.submit(self._start_queued, name, entry)
+        if admitted:
+            for name in waiting:
+                self._mark_dirty(name)  # Queue positions moved up
+
+    def _start_queued(self, stream_name, entry):
+        print(f"Stream '{stream_name}' leaves the admission queue.")
         try:
-            process = stream['process']
-            process.terminate()
-            
-            # Wait for process to terminate with timeout
+            success = self.start_stream(stream_name, owner=entry['owner'], **entry['spec'])
+        except Exception as e:
+            print(f"Error starting stream '{stream_name}': {e}")
+            success = False
+        if not success:
+            self._release_reservation(stream_name)
+            self._emit_status_now(stream_name, removed=stream_name not in self._queued)
+
+    def _queued_view(self, stream_name):
+        entry = self._queued.get(stream_name)
+        if entry is None:
+            return None
+        spec = entry['spec']
+        order = list(self._queued)
+        # The same fields as a running stream's view, so clients need no special case
+        stream = self._new_stream(
+            'stream', spec['input_source'], spec['destination'], None, entry['owner'], spec['source_name'],
+            profile=spec['profile'], rendition=spec.get('rendition'), outputs=spec.get('outputs')
+        )
+        stream.update(status='queued', start_time=None)
+        stream['health'].update(
+            queue_position=order.index(stream_name) + 1 if stream_name in order else None,
+            last_error=entry['reason'], last_health_check=None
+        )
+        return self._stream_view(stream)
+
+    def _spec_error(self, profile, rendition, outputs):
+        if profile not in PIPELINE_PROFILES:
+            return f"Unknown pipeline profile '{profile}'"
+        for name in [rendition] + [output['rendition'] for output in outputs]:
+            if name != 'copy' and name not in RENDITIONS:
+                return f"Unknown rendition '{name}'"
+        if any(not output.get('destination') for output in outputs):
+            return 'Every extra output needs a destination'
+        return None
+
+    def _expected_startup(self):
+        """Lead of scheduled starts that have not run before: the mean measured
+        startup time, or schedule_start_lead until there is none."""
+        total, total_sum = self.startup_latency.total, self.startup_latency.sum
+        return total_sum / total if total else self.schedule_start_lead
+
+    def _on_schedule_due(self, action, entries):
+        # Runs on the schedule thread, which must not block
+        if action == 'prewarm':
+            for entry in entries:
+                self._prewarm_pool.submit(self._prewarm, entry)
+        elif action == 'start':
+            by_owner = {}
+            for entry in entries:
+                by_owner.setdefault(entry['owner'], []).append(entry)
+            for owner, batch in by_owner.items():
+                threading.Thread(target=self._start_scheduled, args=(owner, batch),
+                                 name='scheduled-start', daemon=True).start()
+        else:
+            threading.Thread(target=self._stop_scheduled, args=(entries,), name='scheduled-stop', daemon=True).start()
+
+    def _on_schedule_change(self, owner):
+        self.socketio.emit('schedule_changed', {}, to=ADMIN_ROOM)
+        self.socketio.emit('schedule_changed', {}, to=user_room(owner))
+
+    def _prewarm(self, entry):
+        """Probe a scheduled stream's input and resolve and connect to its
+        destinations ahead of the start. The fresh probe also lets FFmpeg skip
+        most of its own input analysis when the stream starts."""
+        name = entry['stream_name']
+        try:
+            spec = entry['spec']
+            result = {'at': datetime.now(timezone.utc).isoformat(), 'input_live': None, 'probe_ms': None, 'destinations': []}
+            if self.prober and '://' in spec['input_source']:
+                probe = self.prober.probe(spec['input_source'])
+                result.update(input_live=probe['live'], probe_ms=probe['probe_ms'], input_error=probe['error'])
+                if not probe['live']:
+                    print(f"Scheduled stream '{name}': input appears to be offline ({probe['error']}).")
+            targets = [(spec['destination'], spec.get('stream_key'), spec.get('srt_passphrase'), spec.get('srt_latency'))]
+            targets += [(o['destination'], o.get('stream_key'), o.get('srt_passphrase'), o.get('srt_latency'))
+                        for o in spec.get('outputs') or ()]
+            for target in targets:
+                warm = _warm_destination(self._output_target(*target)[-1])
+                if warm['error']:
+                    print(f"Scheduled stream '{name}': cannot reach {warm['host']} ({warm['error']}).")
+                result['destinations'].append(warm)
+            self.schedule.prewarmed(entry['id'], result)
+        except Exception as e:
+            print(f"Error pre-warming scheduled stream '{name}': {e}")
+
+    def _start_scheduled(self, owner, entries):
+        by_name = {entry['stream_name']: entry for entry in entries}
+        specs = []
+        for entry in entries:
+            if self.control is self:
+                # Output of worker agents is not measured here
+                self._scheduled_starts[entry['stream_name']] = (entry['id'], entry['scheduled_at'])
+            # The slot goes ahead even if the source is late; restarts keep trying it
+            specs.append(dict(entry['spec'], stream_name=entry['stream_name'], force=True))
+
+        def started(name, success, message):
+            entry = by_name.get(name)
+            if entry is not None and not success:
+                self._scheduled_starts.pop(name, None)
+                self.schedule.record(entry['id'], entry['scheduled_at'], error=message)
+                print(f"Scheduled start of stream '{name}' failed: {message}")
+
+        self.control.start_streams(specs, owner, on_result=started)
+
+    def _stop_scheduled(self, entries):
+        for entry in entries:
+            success, message = self.control.stop_stream(entry['stream_name'], None, entry['owner'])
+            if not success:
+                print(f"Scheduled stop of stream '{entry['stream_name']}' skipped: {message}")
+
+    def _ensure_ingest(self, leg, input_source, owner, source_name, backup_input=None, backup_source_name=None, profile='standard'):
+        """Return the key of the shared ingest for input_source, starting it if
+        needed, with leg already counted as one of its legs."""
+        group = self._ingest_group(input_source, backup_input, profile)
+        # Under the lock so that concurrent legs create the ingest once and the
+        # last leg leaving cannot stop it under a leg that is joining
+        with self._ingest_lock:
+            if group in self.active_streams:
+                self.active_streams[group]['legs'].add(leg)
+                return group
+
+            ingest = self._new_ingest(group, input_source, owner, source_name, backup_input, profile)
             try:
-                process.wait(timeout=3)  # Wait up to 3 seconds
-            except subprocess.TimeoutExpired:
-                # If it doesn't terminate gracefully, force kill
-                process.kill()
-                process.wait()
-                
-            print(f"Stream '{stream_name}' stopped successfully.")
+                self._spawn(group, ingest)
+            except Exception as e:
+                print(f"Error starting ingest for '{source_name or input_source}': {e}")
+                return None
+            ingest['legs'].add(leg)
+            self.active_streams[group] = ingest
+        self._persist(group)
+        self._emit_status_now(group)
+        if backup_input:
+            self._start_standby(group, backup_input, owner, backup_source_name, profile)
+        return group
+
+    def _ingest_group(self, input_source, backup_input=None, profile='standard'):
+        group = f"ingest:{input_source}"
+        if backup_input:
+            group += f"|backup:{backup_input}"
+        if profile != 'standard':
+            # The profile tunes the input side, so legs only share an ingest with the same one
+            group += f"|profile:{profile}"
+        return group
+
+    def _new_ingest(self, group, input_source, owner, source_name, backup_input=None, profile='standard'):
+        ingest = self._new_stream('ingest', input_source, 'fan-out', None, owner, source_name, profile=profile)
+        ingest['group'] = group
+        ingest['legs'] = set()
+        ingest['backup_input'] = backup_input
+        ingest['standby'] = None
+        if backup_input:
+            ingest['health'].update({'active_input': 'primary', 'failovers': 0, 'failover_latency_ms': None})
+        return ingest
+
+    def _start_standby(self, group, backup_input, owner, backup_source_name, profile='standard'):
+        """Run the backup input hot next to the ingest so the relay can switch to it at once."""
+        name = f"{group}#standby"
+        standby = self._new_stream('standby', backup_input, 'standby', None, owner, backup_source_name, profile=profile)
+        standby['group'] = group
+        try:
+            self._spawn(name, standby)
         except Exception as e:
-            print(f"Error stopping stream '{stream_name}': {e}")
-            
-        # Remove from active streams and notify
-        del self.active_streams[stream_name]
-        self.socketio.emit('stream_status_update', self.get_active_streams())
-        return True, 'Stream stopped successfully'
+            # The primary keeps running; only the failover is lost
+            print(f"Error starting backup input for '{group}': {e}")
+            return
+        self.active_streams[name] = standby
+        self.active_streams[group]['standby'] = name
+        self._persist(name)
+        self._emit_status_now(name)
 
-    def get_active_streams(self):
-        # Return active streams with owner info for frontend permissions
+    def _release_standby(self, stream_name, stream):
+        """Detach a standby from its relay; the ingest runs on without failover."""
+        group = stream.get('group')
+        ingest = self.active_streams.get(group)
+        if ingest is not None and ingest.get('standby') == stream_name:
+            ingest['standby'] = None
+            ingest['health']['active_input'] = 'primary'
+            self.supervisor.relay_standby(group, None)
+
+    def _release_leg(self, stream_name, stream):
+        """Detach a leg from its relay and stop the ingest once no legs are left."""
+        group = stream.get('group')
+        self.supervisor.remove_sink(group, stream_name)
+        with self._ingest_lock:
+            ingest = self.active_streams.get(group)
+            if ingest is None:
+                return
+            ingest['legs'].discard(stream_name)
+            if not ingest['legs']:
+                print(f"No egress legs left for '{ingest['source_name']}', stopping its ingest.")
+                self._stop_process(group)
+
+    def _new_stream(self, kind, input_source, destination, stream_key, owner, source_name, srt_passphrase=None, srt_latency=None, profile='standard', rendition='copy', outputs=None):
         return {
-            name: {
-                'input': info['input'],
-                'destination': info['destination'],
-                'status': info['status'],
-                'owner': info['owner'],
-                'source_name': info.get('source_name', 'Unknown'),
-                'start_time': info.get('start_time'),
-                'health': info['health']
+            'kind': kind,
+            'group': None,
+            'profile': profile,
+            'rendition': rendition or 'copy',
+            'outputs': list(outputs or ()),
+            'process': None,
+            'input': input_source,
+            'destination': destination,
+            'stream_key': stream_key,
+            'srt_passphrase': srt_passphrase,
+            'srt_latency': srt_latency,
+            'status': 'active',
+            'owner': owner,
+            'source_name': source_name or 'Unknown',
+            'start_time': datetime.now(timezone.utc).isoformat(),
+            'health': {
+                'fps': 0,
+                'bitrate': '0 kb/s',
+                'bitrate_kbps': 0.0,
+                'speed': None,
+                'behind_realtime': False,
+                'frame': 0,
+                'drop_frames': 0,
+                'dup_frames': 0,
+                'total_size': 0,
+                'out_time_us': 0,
+                'startup_ms': None,
+                'output_delay_ms': None,
+                'cpu_percent': None,
+                'rss_mb': None,
+                'egress_kbps': None,
+                'expected_kbps': None,
+                'egress_state': None,
+                'egress_window_s': None,
+                'stall_detect_ms': None,
+                'renditions': None,
+                'schedule_offset_ms': None,
+                'last_error': None,
+                'restart_count': 0,
+                'restart_attempt': 0,
+                'failure_category': None,
+                'next_restart_in': None,
+                'last_restart': None,
+                'last_health_check': datetime.now(timezone.utc).isoformat()
             }
-            for name, info in self.active_streams.items()
         }
 
-    def _build_ffmpeg_command(self, input_source, destination, stream_key, srt_passphrase=None, srt_latency=None):
-        """Return a list of arguments for subprocess — no shell parsing, safe for any URL characters."""
-        base = ['ffmpeg', '-re', '-i', input_source, '-c:v', 'copy', '-c:a', 'copy']
+    def _spawn(self, stream_name, stream):
+        """Start the FFmpeg process for a stream, ingest or leg and hand it to the supervisor."""
+        kind = stream.get('kind', 'stream')
+        # Transcoded renditions report per-packet encoder stats on one more pipe
+        transcodes = self.encoder_stats and kind in ('stream', 'leg') and any(
+            name != 'copy' for name in [stream.get('rendition', 'copy')] + [o['rendition'] for o in stream.get('outputs', ())]
+        )
+        fifo_paths = None
+        log_r = log_w = progress_r = progress_w = stats_r = stats_w = None
+        try:
+            if kind == 'stream':
+                # Standalone streams log to named FIFOs in their own session, so they
+                # outlive a server restart and the next instance can reattach
+                fifo_paths = self._fifo_paths(stream_name, stats=transcodes)
+                log_r, log_w = self._open_fifo(fifo_paths[0])
+                progress_r, progress_w = self._open_fifo(fifo_paths[1])
+                if transcodes:
+                    stats_r, stats_w = self._open_fifo(fifo_paths[2])
+            elif kind in ('ingest', 'standby'):
+                # stdout carries the MPEG-TS relay, so progress goes to an extra inherited pipe
+                progress_r, progress_w = os.pipe()
+            elif transcodes:
+                stats_r, stats_w = os.pipe()
+            progress_target = f'pipe:{progress_w}' if progress_w is not None else 'pipe:1'
+
+            if kind in ('ingest', 'standby'):
+                # A slate file used as backup loops so the standby never runs dry
+                loop = kind == 'standby' and '://' not in stream['input']
+                cmd_args = self._build_ingest_command(stream['input'], progress_target, loop=loop, profile=stream['profile'])
+            else:
+                input_source = RELAY_INPUT if kind == 'leg' else stream['input']
+                cmd_args = self._build_ffmpeg_command(
+                    input_source, stream['destination'], stream['stream_key'],
+                    stream.get('srt_passphrase'), stream.get('srt_latency'),
+                    progress_target=progress_target, profile=stream['profile'],
+                    rendition=stream.get('rendition', 'copy'), outputs=stream.get('outputs', ()),
+                    stats_target=f'pipe:{stats_w}' if stats_w is not None else None
+                )
+            # Log command without exposing stream keys or SRT passphrases (also
+            # those written into an input or destination URL)
+            stream_keys = [key for key in [stream.get('stream_key')] + [o.get('stream_key') for o in stream.get('outputs', ())] if key]
+            passphrases = [p for p in [stream.get('srt_passphrase')] + [o.get('srt_passphrase') for o in stream.get('outputs', ())] if p]
+            safe_args = [('[STREAM_KEY_REDACTED]' if any(key in arg for key in stream_keys) else arg) for arg in cmd_args]
+            safe_args = [_redact_passphrases(arg, passphrases) for arg in safe_args]
+            self.logs.open(stream_name, stream['owner'])
+            self.logs.event(stream_name, 'spawn', ' '.join(safe_args))
 
+            spawn_started = time.monotonic()
+            process = subprocess.Popen(
+                cmd_args,
+                stdin=subprocess.PIPE if kind == 'leg' else subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL if kind == 'stream' else subprocess.PIPE,
+                stderr=log_w if log_w is not None else subprocess.PIPE,
+                pass_fds=tuple(fd for fd in (progress_w, stats_w) if fd is not None),
+                start_new_session=True
+            )
+            self.spawn_latency.observe(time.monotonic() - spawn_started)
+        except Exception as e:
+            for fd in (log_r, progress_r, stats_r):
+                if fd is not None:
+                    os.close(fd)
+            self._unlink_fifos(fifo_paths)
+            self.logs.event(stream_name, 'error', f'Could not start FFmpeg: {e}')
+            if stream_name not in self.active_streams:
+                self.logs.close(stream_name)
+            raise
+        finally:
+            for fd in (log_w, progress_w, stats_w):
+                if fd is not None:
+                    os.close(fd)
+
+        process.fifo_paths = fifo_paths
+        stream['process'] = process
+        stream['_spawned_at'] = time.monotonic()
+        stream['_output_started'] = False  # Startup and delay are measured from this spawn
+        stream['health']['startup_ms'] = None
+        stream['_encoder_clock'] = {}
+        stream['_encoder_sample'] = {}
+        stream['health']['renditions'] = None
+        stream['health']['egress_state'] = None
+        stream['health']['egress_kbps'] = None
+        stream['health']['stall_detect_ms'] = None
+        egress = kind in ('stream', 'leg')  # Ingest output is watched by the relay
+        self.supervisor.watch(
+            stream_name, process,
+            on_line=self._update_stream_stats,
+            on_exit=self._on_process_exit,
+            heartbeat_timeout=self.heartbeat_timeout,
+            on_progress=self._update_stream_progress,
+            progress_pipe=os.fdopen(progress_r, 'rb', buffering=0) if progress_r is not None else None,
+            log_pipe=os.fdopen(log_r, 'rb', buffering=0) if log_r is not None else None,
+            on_stats=self._update_encoder_stats if stats_r is not None else None,
+            stats_pipe=os.fdopen(stats_r, 'rb', buffering=0) if stats_r is not None else None,
+            on_egress=self._update_egress if egress else None,
+            expected_kbps=self._expected_output_kbps(stream) if egress else None
+        )
+        if kind == 'ingest':
+            self.supervisor.relay(stream_name, process.stdout)
+        elif kind == 'standby':
+            self.supervisor.relay_standby(
+                stream['group'], process.stdout,
+                stall_timeout=self.failover_stall_timeout,
+                switch_back_after=self.failover_switch_back,
+                on_switch=self._on_input_switch
+            )
+        elif kind == 'leg':
+            self.supervisor.add_sink(stream['group'], stream_name, process.stdin)
+        return process
+
+    def _fifo_paths(self, stream_name, stats=False):
+        stem = f"{hashlib.sha1(stream_name.encode()).hexdigest()[:16]}-{time.time_ns()}"
+        paths = (os.path.join(self.runtime_dir, f'{stem}.log'),
+                 os.path.join(self.runtime_dir, f'{stem}.progress'))
+        # Encoder stats of transcoded renditions; found again on reattach by its stem
+        return paths + (os.path.join(self.runtime_dir, f'{stem}.stats'),) if stats else paths
+
+    def _open_fifo(self, path):
+        """Create a FIFO and return (read_fd, write_fd); the write end goes to FFmpeg."""
+        os.mkfifo(path, 0o600)
+        read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            write_fd = os.open(path, os.O_WRONLY)
+        except OSError:
+            os.close(read_fd)
+            raise
+        return read_fd, write_fd
+
+    def _unlink_fifos(self, fifo_paths):
+        for path in fifo_paths or ():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _persist(self, stream_name):
+        stream = self.active_streams.get(stream_name)
+        if self.registry and stream:
+            try:
+                self.registry.save(stream_name, stream)
+            except Exception as e:
+                print(f"Error saving stream '{stream_name}' to registry: {e}")
+
+    def _forget(self, stream_name):
+        if self.registry:
+            try:
+                self.registry.remove(stream_name)
+            except Exception as e:
+                print(f"Error removing stream '{stream_name}' from registry: {e}")
+
+    def recover(self):
+        """Rebuild streams recorded by a previous server instance.
+
+        Standalone streams whose FFmpeg is still running are reattached through
+        their FIFOs without interrupting output. Everything else (including
+        fan-out ingests and legs, whose relay pipes died with the old server) is
+        restarted in parallel.
+        """
+        records = self.registry.load()
+        to_spawn = []
+        for record in records:
+            name = record['name']
+            definition = record['definition']
+            profile = definition.get('profile') or 'standard'
+            stream = self._new_stream(
+                definition.get('kind') or 'stream', definition['input'], definition['destination'],
+                definition.get('stream_key'), definition['owner'], definition.get('source_name'),
+                srt_passphrase=definition.get('srt_passphrase'), srt_latency=definition.get('srt_latency'),
+                profile=profile, rendition=definition.get('rendition'), outputs=definition.get('outputs')
+            )
+            if stream['kind'] == 'ingest':
+                stream = self._new_ingest(
+                    definition.get('group'), definition['input'], definition['owner'],
+                    definition.get('source_name'), definition.get('backup_input'), profile
+                )
+            stream['group'] = definition.get('group')
+            stream['start_time'] = record['start_time'] or stream['start_time']
+            stream['health']['restart_count'] = record['restart_count']
+            self.active_streams[name] = stream
+
+            if stream['kind'] == 'stream' and self._reattach(name, stream, record):
+                print(f"Reattached to stream '{name}' (pid {record['pid']}).")
+                self._emit_status_now(name)
+            else:
+                self._kill_orphan(record)
+                to_spawn.append(name)
+
+        for name in list(to_spawn):
+            stream = self.active_streams[name]
+            if stream['kind'] not in ('leg', 'standby'):
+                continue
+            ingest = self.active_streams.get(stream['group'])
+            if ingest is None:
+                # Ingest record missing; a leg or standby without a relay cannot run
+                print(f"Dropping stream '{name}': its shared ingest was not recorded.")
+                to_spawn.remove(name)
+                self.active_streams.pop(name, None)
+                self._forget(name)
+                continue
+            if stream['kind'] == 'leg':
+                ingest['legs'].add(name)
+            else:
+                ingest['standby'] = name
+        for name in list(to_spawn):
+            stream = self.active_streams.get(name)
+            if stream and stream['kind'] == 'ingest' and not stream['legs']:
+                for unused in (name, stream['standby']):
+                    if unused in to_spawn:
+                        to_spawn.remove(unused)
+                        self.active_streams.pop(unused, None)
+                        self._forget(unused)
+
+        list(self._spawn_pool.map(self._recover_spawn, to_spawn))
+        if records:
+            print(f"Recovered {len(records)} stream(s): {len(records) - len(to_spawn)} reattached, {len(to_spawn)} restarted.")
+        self._clean_runtime_dir()
+
+    def _reattach(self, stream_name, stream, record):
+        pid, pid_start = record['pid'], record['pid_start']
+        fifo_paths = (record['log_fifo'], record['progress_fifo'])
+        if not pid or pid_start is None or process_start_time(pid) != pid_start:
+            return False
+        if not all(path and os.path.exists(path) for path in fifo_paths):
+            return False
+        stats_path = os.path.splitext(fifo_paths[1])[0] + '.stats'
+        if os.path.exists(stats_path):
+            fifo_paths += (stats_path,)
+        try:
+            log_r = os.open(fifo_paths[0], os.O_RDONLY | os.O_NONBLOCK)
+            progress_r = os.open(fifo_paths[1], os.O_RDONLY | os.O_NONBLOCK)
+            stats_r = os.open(stats_path, os.O_RDONLY | os.O_NONBLOCK) if len(fifo_paths) > 2 else None
+        except OSError:
+            return False
+
+        log_pipe = os.fdopen(log_r, 'rb', buffering=0)
+        progress_pipe = os.fdopen(progress_r, 'rb', buffering=0)
+        stats_pipe = os.fdopen(stats_r, 'rb', buffering=0) if stats_r is not None else None
+        process = AttachedProcess(pid, pid_start, log_pipe, progress_pipe, fifo_paths)
+        stream['process'] = process
+        stream['_spawned_at'] = time.monotonic()
+        stream['_encoder_clock'] = {}
+        stream['_encoder_sample'] = {}
+        self.logs.open(stream_name, stream['owner'])
+        self.logs.event(stream_name, 'reattached', f'Reattached to FFmpeg pid {pid} after a server restart', pid=pid)
+        self.supervisor.watch(
+            stream_name, process,
+            on_line=self._update_stream_stats,
+            on_exit=self._on_process_exit,
+            heartbeat_timeout=self.heartbeat_timeout,
+            on_progress=self._update_stream_progress,
+            progress_pipe=progress_pipe,
+            log_pipe=log_pipe,
+            on_stats=self._update_encoder_stats if stats_pipe is not None else None,
+            stats_pipe=stats_pipe,
+            on_egress=self._update_egress,
+            expected_kbps=self._expected_output_kbps(stream)
+        )
+        return True
+
+    def _kill_orphan(self, record):
+        """Kill a recorded process that cannot be reattached, so it never pushes twice."""
+        pid, pid_start = record['pid'], record['pid_start']
+        if pid and pid_start is not None and process_start_time(pid) == pid_start:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    def _recover_spawn(self, stream_name):
+        stream = self.active_streams.get(stream_name)
+        if not stream:
+            return
+        try:
+            self._spawn(stream_name, stream)
+            stream['start_time'] = datetime.now(timezone.utc).isoformat()
+            self._persist(stream_name)
+        except Exception as e:
+            print(f"Error restarting recovered stream '{stream_name}': {e}")
+            stream['status'] = 'failed'
+            stream['health']['last_error'] = str(e)
+        self._emit_status_now(stream_name)
+
+    def _clean_runtime_dir(self):
+        """Remove FIFOs left behind by processes that are gone."""
+        in_use = set()
+        for stream in list(self.active_streams.values()):
+            in_use.update(getattr(stream.get('process'), 'fifo_paths', None) or ())
+        for entry in os.listdir(self.runtime_dir):
+            path = os.path.join(self.runtime_dir, entry)
+            if path not in in_use and entry.endswith(('.log', '.progress', '.stats')):
+                self._unlink_fifos((path,))
+
+    def get_active_streams(self):
+        """Read-only mapping of stream name to its last broadcast view (with
+        owner info for frontend permissions). Safe to iterate from any thread."""
+        return self.state.snapshot()[1]
+
+    def get_stream_history(self, stream_name, window=900, resolution=None):
+        """Metric history of a running stream, or None if it is unknown."""
+        if stream_name not in self.active_streams:
+            return None
+        return self.metrics.history(stream_name, window=window, resolution=resolution)
+
+    def get_stream_log(self, stream_name, lines=200):
+        """Recent FFmpeg output and events of a stream, also shortly after it
+        stopped, or None if it has no log."""
+        return self.logs.get(stream_name, lines=lines)
+
+    def get_status_snapshot(self, user_id=None):
+        """Full status snapshot tagged with the current broadcast version, of
+        every stream or only those user_id can see. A payload and its JSON
+        encoding are shared by every caller until the next change."""
+        return self.state.full_payload(user_id)
+
+    def add_viewer(self, user_id):
+        """A non-admin client joined user_room(user_id); deltas are built for it from now on."""
+        with self._status_lock:
+            self._viewers[user_id] = self._viewers.get(user_id, 0) + 1
+
+    def remove_viewer(self, user_id):
+        with self._status_lock:
+            count = self._viewers.get(user_id, 0) - 1
+            if count > 0:
+                self._viewers[user_id] = count
+            else:
+                self._viewers.pop(user_id, None)
+                self._room_versions.pop(user_room(user_id), None)
+
+    def can_view(self, stream_name, user_role, user_id):
+        stream = self.active_streams.get(stream_name)
+        if stream is None:
+            audience = self.state.audiences().get(stream_name)
+            if audience is None:
+                # Stopped or failed: the log stays readable for its owner
+                owner = self.logs.owner(stream_name)
+                return owner is not None and (user_role in ADMIN_ROLES or owner == user_id)
+            return user_role in ADMIN_ROLES or user_id in audience
+        return user_role in ADMIN_ROLES or user_id in self._audience(stream)
+
+    def update_remote(self, stream_name, view):
+        """Publish the view of a stream that runs on a worker agent."""
+        self._remote_views[stream_name] = view
+        self._mark_dirty(stream_name)
+
+    def remove_remote(self, stream_name):
+        if self._remote_views.pop(stream_name, None) is not None:
+            self._mark_dirty(stream_name, removed=True)
+
+    def subscribe_metrics(self, stream_name):
+        """Count a client of metrics_room(stream_name); every progress block of
+        the stream is sent there while it has subscribers."""
+        with self._status_lock:
+            self._metrics_subscribers[stream_name] = self._metrics_subscribers.get(stream_name, 0) + 1
+
+    def unsubscribe_metrics(self, stream_name):
+        with self._status_lock:
+            count = self._metrics_subscribers.get(stream_name, 0) - 1
+            if count > 0:
+                self._metrics_subscribers[stream_name] = count
+            else:
+                self._metrics_subscribers.pop(stream_name, None)
+
+    def _audience(self, info):
+        """Users besides admins who see a stream: its owner and, for a shared
+        ingest or its standby, the owners of the legs it feeds."""
+        users = {info['owner']}
+        if info.get('kind') in ('ingest', 'standby'):
+            ingest = self.active_streams.get(info['group']) or {}
+            users.update(self.active_streams[leg]['owner'] for leg in list(ingest.get('legs', ())) if leg in self.active_streams)
+        return frozenset(users)
+
+    def _stream_view(self, info):
+        return {
+            'kind': info.get('kind', 'stream'),
+            'group': info.get('group'),
+            'profile': info.get('profile', 'standard'),
+            'rendition': info.get('rendition', 'copy'),
+            # Extra outputs without their keys
+            'outputs': [{'destination': o['destination'], 'rendition': o['rendition']} for o in info.get('outputs', ())],
+            'input': info['input'],
+            'destination': info['destination'],
+            'status': info['status'],
+            'owner': info['owner'],
+            'source_name': info.get('source_name', 'Unknown'),
+            'start_time': info.get('start_time'),
+            'health': dict(info['health'])
+        }
+
+    def _mark_dirty(self, stream_name, removed=False):
+        with self._status_lock:
+            if removed:
+                self._dirty_streams.discard(stream_name)
+                self._removed_streams.add(stream_name)
+            else:
+                self._removed_streams.discard(stream_name)
+                self._dirty_streams.add(stream_name)
+
+    def _emit_status_now(self, stream_name, removed=False):
+        """Lifecycle changes (start, stop, failure, restart) skip the tick and go out immediately."""
+        self._mark_dirty(stream_name, removed=removed)
+        self._flush_status()
+
+    def _flush_status(self):
+        """Send changed streams since the last flush as one versioned delta."""
+        with self._status_lock:
+            if not self._dirty_streams and not self._removed_streams:
+                return
+            dirty, self._dirty_streams = self._dirty_streams, set()
+            removed, self._removed_streams = self._removed_streams, set()
+
+            changed = {}
+            audiences = {}
+            for name in dirty:
+                info = self.active_streams.get(name)
+                remote = self._remote_views.get(name)
+                if info is not None:
+                    changed[name] = self._stream_view(info)
+                    audiences[name] = self._audience(info)
+                elif remote is not None:
+                    changed[name] = remote
+                    audiences[name] = frozenset({remote['owner']})
+                else:
+                    queued = self._queued_view(name)
+                    if queued is not None:
+                        changed[name] = queued
+                        audiences[name] = frozenset({queued['owner']})
+                    else:
+                        removed.add(name)
+            previous = self.state.audiences()
+            delta = self.state.commit(changed, removed, audiences)
+            self.status_emits += 1
+
+            # Emit while holding the lock so deltas reach clients in version order
+            self.socketio.emit('stream_status_update', delta, to=ADMIN_ROOM)
+
+            # Users only get the streams they can see, and only when one of them
+            # changed; `since` is the version of the room's previous delta
+            scoped = {}
+            for name, view in changed.items():
+                for user in audiences[name]:
+                    if user in self._viewers:
+                        scoped.setdefault(user, ({}, []))[0][name] = view
+            for name in removed:
+                for user in previous.get(name, ()):
+                    if user in self._viewers:
+                        scoped.setdefault(user, ({}, []))[1].append(name)
+            for name in changed:
+                # e.g. a shared ingest after the user's last leg on it stopped
+                for user in previous.get(name, frozenset()) - audiences[name]:
+                    if user in self._viewers:
+                        scoped.setdefault(user, ({}, []))[1].append(name)
+            for user, (streams, gone) in scoped.items():
+                room = user_room(user)
+                self.socketio.emit('stream_status_update', Payload({
+                    'version': delta['version'],
+                    'since': self._room_versions.get(room, 0),
+                    'full': False,
+                    'streams': streams,
+                    'removed': sorted(gone)
+                }), to=room)
+                self._room_versions[room] = delta['version']
+
+    def _broadcast_tick(self):
+        try:
+            self._flush_status()
+        except Exception as e:
+            print(f"Error broadcasting stream status: {e}")
+        self.supervisor.call_later(self.status_interval, self._broadcast_tick)
+
+    def _global_args(self, progress_target):
+        # Stats come from the machine-readable -progress blocks, not stderr
+        return [self.ffmpeg_bin, '-nostdin', '-nostats', '-progress', progress_target,
+                '-stats_period', str(self.progress_period)]
+
+    def _input_args(self, input_source, profile='standard'):
+        settings = PIPELINE_PROFILES[profile]
+        if input_source == RELAY_INPUT:
+            # Egress leg fed by a shared ingest; the ingest already paces the input.
+            # Ingest restarts and backup failovers make timestamps jump, so any
+            # discontinuity over a second is folded back into a continuous timeline.
+            return settings['input'] + ['-dts_delta_threshold', '1', '-f', 'mpegts', '-i', RELAY_INPUT]
+        is_live = '://' in input_source and not input_source.startswith('file:')
+        realtime = ['-re'] if settings['realtime'] or not is_live else []
+        probe = self.prober.lookup(input_source) if self.prober else None
+        quick_probe = []
+        if probe and probe['live'] and '-probesize' not in settings['input'] + settings['source']:
+            # The prober already found the streams, so FFmpeg only needs a short look
+            quick_probe = ['-probesize', '500000', '-analyzeduration', '500000']
+        return realtime + settings['input'] + settings['source'] + quick_probe + ['-i', input_source]
+
+    def _build_ingest_command(self, input_source, progress_target, loop=False, profile='standard'):
+        """Pull the input once and write it as MPEG-TS to stdout for the relay."""
+        loop_args = ['-stream_loop', '-1'] if loop else []
+        return (self._global_args(progress_target) + loop_args + self._input_args(input_source, profile)
+                + ['-c:v', 'copy', '-c:a', 'copy'] + PIPELINE_PROFILES[profile]['output']
+                + ['-f', 'mpegts', 'pipe:1'])
+
+    def _build_ffmpeg_command(self, input_source, destination, stream_key, srt_passphrase=None, srt_latency=None, progress_target='pipe:1', profile='standard', rendition='copy', outputs=(), stats_target=None):
+        """Return a list of arguments for subprocess — no shell parsing, safe for any URL characters.
+
+        destination is the first output; outputs adds more, each a dict with
+        destination, stream_key, srt_passphrase, srt_latency and rendition.
+        Transcoded renditions share one decode of the input, split in a
+        filter graph; 'copy' outputs pass the source through next to them.
+        """
+        base = self._global_args(progress_target) + self._input_args(input_source, profile)
+        targets = [{'destination': destination, 'stream_key': stream_key, 'srt_passphrase': srt_passphrase,
+                    'srt_latency': srt_latency, 'rendition': rendition or 'copy'}] + list(outputs)
+        if len(targets) == 1 and targets[0]['rendition'] == 'copy':
+            # Stream copy passes the source GOP through, so no encoder options (e.g. -g) apply
+            return (base + ['-c:v', 'copy', '-c:a', 'copy'] + PIPELINE_PROFILES[profile]['output']
+                    + self._output_target(destination, stream_key, srt_passphrase, srt_latency))
+
+        encoded = [target['rendition'] for target in targets if target.get('rendition', 'copy') != 'copy']
+        args = list(base)
+        if encoded:
+            args += ['-filter_complex', _ladder_filter(encoded)]
+        branch = 0
+        for target in targets:
+            name = target.get('rendition', 'copy')
+            if name == 'copy':
+                args += ['-map', '0:v:0?', '-map', '0:a:0?', '-c:v', 'copy', '-c:a', 'copy']
+            else:
+                preset = RENDITIONS[name]
+                args += ['-map', f'[v{branch}]', '-map', '0:a:0?'] + _encoder_args(preset)
+                if stats_target:
+                    # One line per encoded video packet, read back for the per-rendition speed
+                    args += ['-stats_enc_post:v:0', stats_target, '-stats_enc_post_fmt:v:0', '{fidx} {n} {t}']
+                branch += 1
+            args += PIPELINE_PROFILES[profile]['output'] + self._output_target(
+                target['destination'], target.get('stream_key'), target.get('srt_passphrase'), target.get('srt_latency')
+            )
+        return args
+
+    def _output_target(self, destination, stream_key, srt_passphrase=None, srt_latency=None):
+        """Muxer and URL of one output."""
         if destination == "youtube":
-            return base + ['-g', '60', '-f', 'flv',
-                           f'rtmp://a.rtmp.youtube.com/live2/{stream_key}']
+            return ['-f', 'flv', f'rtmp://a.rtmp.youtube.com/live2/{stream_key}']
 
         elif destination == "facebook":
-            return base + ['-g', '60', '-f', 'flv',
-                           f'rtmps://live-api-s.facebook.com:443/rtmp/{stream_key}']
+            return ['-f', 'flv', f'rtmps://live-api-s.facebook.com:443/rtmp/{stream_key}']
 
         elif destination == "instagram":
-            return base + ['-g', '60', '-f', 'flv',
-                           f'rtmps://live-upload.instagram.com:443/rtmp/{stream_key}']
+            return ['-f', 'flv', f'rtmps://live-upload.instagram.com:443/rtmp/{stream_key}']
 
         elif destination == "srt":
             latency = int(srt_latency) if srt_latency else 120
@@ -140,178 +1465,346 @@ class StreamManager:
             if srt_passphrase:
                 srt_url += f'&passphrase={srt_passphrase}'
 
-            return base + ['-f', 'mpegts', srt_url]
+            return ['-f', 'mpegts', srt_url]
 
         else:
             # Custom RTMP or full SRT URL
             dest_url = f'{destination}/{stream_key}' if stream_key else destination
             if dest_url.startswith('srt://'):
-                return base + ['-f', 'mpegts', dest_url]
-            return base + ['-g', '60', '-f', 'flv', dest_url]
-
-    def _monitor_stream(self, stream_name, process):
-        """Monitor a running stream's FFmpeg output and update its status."""
-        last_activity = datetime.now(timezone.utc)
-        heartbeat_timeout = 30  # seconds without activity before marking as failed
-        
-        # Make stderr non-blocking
-        fd = process.stderr.fileno()
-        fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-        fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-        
-        partial_line = ""
-        
-        while process.poll() is None:
-            # Check if process should be terminated due to fatal error
-            stream = self.active_streams.get(stream_name)
-            if stream and stream.get('_terminate_requested'):
-                print(f"Terminating stream '{stream_name}' due to fatal error")
-                try:
-                    process.terminate()
-                    process.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                break
-            
-            # Non-blocking read with timeout
-            ready, _, _ = select.select([process.stderr], [], [], 1.0)
-            
-            if ready:
-                try:
-                    chunk = process.stderr.read(1024)
-                    if chunk:
-                        last_activity = datetime.now(timezone.utc)
-                        partial_line += chunk
-                        
-                        # Process complete lines (both \n and \r as delimiters)
-                        while '\n' in partial_line or '\r' in partial_line:
-                            if '\n' in partial_line:
-                                line, partial_line = partial_line.split('\n', 1)
-                            else:
-                                line, partial_line = partial_line.split('\r', 1)
-                            
-                            if line.strip():
-                                self._update_stream_stats(stream_name, line.strip())
-                except (BlockingIOError, OSError):
-                    pass
-            
-            # Check for heartbeat timeout
-            time_since_activity = (datetime.now(timezone.utc) - last_activity).total_seconds()
-            if time_since_activity > heartbeat_timeout:
-                print(f"Stream '{stream_name}' appears dead - no activity for {time_since_activity:.1f}s")
-                try:
-                    process.terminate()
-                    process.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    process.kill()
+                return ['-f', 'mpegts', dest_url]
+            return ['-f', 'flv', dest_url]
+
+    def _on_process_exit(self, stream_name, process, returncode, tail, stalled=False):
+        """Runs on the supervisor loop once an FFmpeg child has been reaped."""
+        self._unlink_fifos(getattr(process, 'fifo_paths', None))
+        stream = self.active_streams.get(stream_name)
+        if not stream or stream['process'] is not process:
+            return  # Stopped by a user, or an older process of a restarted stream
+        self.restart_scheduler.release(stream_name)
+
+        # FFmpeg's own output leading up to the exit is in the stream's log
+        health = stream['health']
+        category = stream.pop('_failure', None) or ('stalled' if stalled else None)
+        for line in reversed(tail):
+            if category:
                 break
+            category = classify_failure(line)
+        category = category or 'exited'
+        self.logs.event(stream_name, 'exited', f'FFmpeg exited with code {returncode} ({category})',
+                        returncode=returncode, category=category, last_line=tail[-1] if tail else None)
 
-        # Capture any remaining stderr output to show the real FFmpeg error
-        try:
-            remaining = process.stderr.read()
-            if remaining:
-                # Print the last meaningful error lines from FFmpeg
-                error_lines = [l.strip() for l in remaining.splitlines() if l.strip()]
-                if error_lines:
-                    print(f"[FFmpeg stderr for '{stream_name}']:")
-                    for line in error_lines[-20:]:  # last 20 lines
-                        print(f"  {line}")
-                        if stream_name in self.active_streams:
-                            self._update_stream_stats(stream_name, line)
-        except Exception:
-            pass
-
-        # If stream ends unexpectedly, check for restarts
-        if stream_name in self.active_streams:
-            stream = self.active_streams[stream_name]
-            if stream['health']['restart_count'] < self.max_restart_attempts:
-                stream['health']['restart_count'] += 1
-                stream['health']['last_restart'] = datetime.now(timezone.utc).isoformat()
-                print(f"Stream '{stream_name}' failed, attempting restart... (Attempt {stream['health']['restart_count']})")
-                time.sleep(self.restart_delay)
-                self._restart_stream(stream_name)
-            else:
-                stream['status'] = 'failed'
-                print(f"Stream '{stream_name}' failed after maximum retries.")
-                self.socketio.emit('stream_status_update', self.get_active_streams())
-                del self.active_streams[stream_name]
+        uptime = time.monotonic() - stream.get('_spawned_at', 0)
+        if uptime >= self.restart_policy.stable_after:
+            health['restart_attempt'] = 0  # It ran fine for a while; this is a fresh failure
+        attempt = health['restart_attempt'] + 1
+        delay = self.restart_policy.next_delay(category, attempt)
+        health['failure_category'] = category
 
-    def _update_stream_stats(self, stream_name, log_line):
-        """Extract and update stream stats from FFmpeg log output."""
+        if delay is not None:
+            health['restart_attempt'] = attempt
+            health['restart_count'] += 1
+            health['last_restart'] = datetime.now(timezone.utc).isoformat()
+            health['next_restart_in'] = round(delay, 1)
+            stream['status'] = 'restarting'
+            print(f"Stream '{stream_name}' failed ({category}), restarting in {delay:.1f}s... (Attempt {attempt})")
+            self.logs.event(stream_name, 'restart', f'Restarting in {delay:.1f}s (attempt {attempt})',
+                            attempt=attempt, delay=round(delay, 1))
+            if self.registry:
+                self.registry.update_restart_count(stream_name, health['restart_count'])
+            self.restart_scheduler.schedule(stream_name, delay, self._restart_stream)
+            self._emit_status_now(stream_name)
+        else:
+            stream['status'] = 'failed'
+            health['next_restart_in'] = None
+            print(f"Stream '{stream_name}' failed ({category}) after {attempt - 1} restart attempt(s), giving up.")
+            self.logs.event(stream_name, 'failed', f'Gave up after {attempt - 1} restart attempt(s)', category=category)
+            self._emit_status_now(stream_name)
+            if stream.get('kind') == 'ingest':
+                # Nothing can feed the legs any more
+                for leg in list(stream['legs']):
+                    self._stop_process(leg)
+                if stream.get('standby'):
+                    self._stop_process(stream['standby'])
+            elif stream.get('kind') == 'leg':
+                self._release_leg(stream_name, stream)
+            elif stream.get('kind') == 'standby':
+                self._release_standby(stream_name, stream)
+            self.active_streams.pop(stream_name, None)
+            self.logs.close(stream_name)
+            self._forget(stream_name)
+            self.metrics.remove(stream_name)
+            self._mark_dirty(stream_name, removed=True)
+            self._release_reservation(stream_name)
+            self._drain_admission_queue(time.monotonic())
+
+    def _on_input_switch(self, group, role, latency_ms):
+        """Runs on the supervisor loop when a relay switches between primary and backup input."""
+        ingest = self.active_streams.get(group)
+        if not ingest:
+            return
+        health = ingest['health']
+        health['active_input'] = role
+        if role == 'standby':
+            health['failovers'] = health.get('failovers', 0) + 1
+            health['failover_latency_ms'] = latency_ms
+            print(f"Ingest '{group}' failed over to its backup input in {latency_ms:.0f}ms.")
+            self.logs.event(group, 'failover', f'Switched to the backup input in {latency_ms:.0f}ms', latency_ms=latency_ms)
+        else:
+            print(f"Ingest '{group}' switched back to its primary input.")
+            self.logs.event(group, 'failback', 'Switched back to the primary input')
+        self._emit_status_now(group)
+
+    def _update_stream_progress(self, stream_name, progress):
+        """Update stream stats from one FFmpeg -progress block."""
         stream = self.active_streams.get(stream_name)
         if not stream:
             return
 
-        # Parse FPS
-        if "fps=" in log_line:
-            fps_value = log_line.split("fps=")[1].split()[0]
+        # Output is flowing again, so this restart no longer counts against the cap
+        self.restart_scheduler.release(stream_name)
+
+        health = stream['health']
+        for key in ('frame', 'drop_frames', 'dup_frames', 'total_size', 'out_time_us'):
+            if progress.get(key) is not None:
+                health[key] = progress[key]
+        if progress.get('fps') is not None:
+            health['fps'] = int(progress['fps'])
+        if progress.get('bitrate_kbps') is not None:
+            health['bitrate_kbps'] = progress['bitrate_kbps']
+            health['bitrate'] = f"{progress['bitrate_kbps']:.1f}kbits/s"
+
+        # Startup: spawn until the first block reporting written output. Delay:
+        # wall time since spawn minus output media time, i.e. how far the output
+        # trails the input (connect, probe and buffering included). Reattached
+        # processes were spawned by an earlier server and are not measured.
+        elapsed_ms = (time.monotonic() - stream.get('_spawned_at', 0)) * 1000
+        if stream.get('_output_started') is False and (progress.get('total_size') or progress.get('out_time_us')):
+            stream['_output_started'] = True
+            health['startup_ms'] = round(elapsed_ms)
+            self.startup_latency.observe(elapsed_ms / 1000)
+            scheduled = self._scheduled_starts.pop(stream_name, None)
+            if scheduled:
+                self._record_schedule_offset(stream_name, health, *scheduled)
+        if stream.get('_output_started') and progress.get('out_time_us') is not None:
+            health['output_delay_ms'] = max(0, round(elapsed_ms - progress['out_time_us'] / 1000))
+
+        speed = progress.get('speed')
+        if speed is not None:
+            health['speed'] = speed
+            behind = speed < self.min_realtime_speed
+            if behind and stream['status'] == 'active':
+                stream['status'] = 'warning'
+            elif not behind and health['behind_realtime'] and stream['status'] == 'warning':
+                stream['status'] = 'active'
+            health['behind_realtime'] = behind
+        if stream.get('_encoder_clock'):
+            health['renditions'] = self._rendition_speeds(stream)
+
+        health['last_health_check'] = datetime.now(timezone.utc).isoformat()
+        self.metrics.record(stream_name, health)
+        self._mark_dirty(stream_name)
+        if stream_name in self._metrics_subscribers:
+            self._emit_stream_metrics(stream_name, stream, progress)
+
+    def _expected_output_kbps(self, stream):
+        """Bitrate the first output of a stream should be written at (FFmpeg's
+        total_size counts the first output only): its rendition's, or the probed
+        input bitrate for a copy. None if unknown; the supervisor then learns it."""
+        rendition = stream.get('rendition', 'copy')
+        if rendition != 'copy':
+            return RENDITIONS[rendition]['video_kbps'] + RENDITIONS[rendition]['audio_kbps']
+        probe = self.prober.lookup(stream['input']) if self.prober else None
+        return probe['bitrate_kbps'] if probe and probe['live'] else None
+
+    def _update_egress(self, stream_name, egress):
+        """Output throughput of a stream from the supervisor, once per tick."""
+        stream = self.active_streams.get(stream_name)
+        if not stream:
+            return
+        health = stream['health']
+        previous = health['egress_state']
+        health.update(
+            egress_kbps=egress['kbps'], expected_kbps=egress['expected_kbps'],
+            egress_state=egress['state'], egress_window_s=egress['window_s'],
+            stall_detect_ms=egress['detect_ms']
+        )
+        # Throughput problems outrank log warnings in the status
+        status = stream['status']
+        if egress['state'] in ('degraded', 'stalled') and status in ('active', 'warning', 'degraded', 'stalled'):
+            stream['status'] = egress['state']
+            if egress['state'] != previous:
+                if egress['state'] == 'stalled':
+                    message = f"No output written for {egress['detect_ms']} ms"
+                else:
+                    message = f"Writing {egress['kbps']} of about {egress['expected_kbps']} kb/s"
+                print(f"Stream '{stream_name}' {egress['state']}: {message}")
+                self.logs.event(stream_name, egress['state'], message, kbps=egress['kbps'],
+                                expected_kbps=egress['expected_kbps'], detect_ms=egress['detect_ms'])
+        elif egress['state'] == 'ok' and status in ('degraded', 'stalled'):
+            stream['status'] = 'active'
+            self.logs.event(stream_name, 'recovered', f"Writing {egress['kbps']} kb/s again", kbps=egress['kbps'])
+        if stream['status'] != status:
+            self._emit_status_now(stream_name)
+        else:
+            self._mark_dirty(stream_name)
+
+    def _record_schedule_offset(self, stream_name, health, entry_id, scheduled_at):
+        """How far from its scheduled moment a scheduled start put output on the wire."""
+        offset = time.time() - scheduled_at
+        health['schedule_offset_ms'] = round(offset * 1000)
+        self.schedule_offset.observe(abs(offset))
+        self.schedule.record(entry_id, scheduled_at, offset=offset, startup_ms=health['startup_ms'])
+        self.logs.event(stream_name, 'scheduled', f"Output began {offset * 1000:+.0f} ms from the scheduled time",
+                        offset_ms=health['schedule_offset_ms'])
+
+    def _update_encoder_stats(self, stream_name, lines):
+        """Latest frame count and output time of each transcoded output, from
+        its "{fidx} {n} {t}" -stats_enc_post lines."""
+        stream = self.active_streams.get(stream_name)
+        if not stream:
+            return
+        clock = stream['_encoder_clock']
+        for line in lines:
+            fields = line.split()
             try:
-                stream['health']['fps'] = int(float(fps_value))
-            except ValueError:
-                print(f"Could not parse FPS from log: {fps_value}")
+                clock[int(fields[0])] = (int(fields[1]), float(fields[2]))
+            except (IndexError, ValueError):
+                continue  # No timestamp yet (N/A)
 
-        # Parse bitrate
-        if "bitrate=" in log_line:
-            bitrate = log_line.split("bitrate=")[1].split()[0]
-            stream['health']['bitrate'] = bitrate
+    def _rendition_speeds(self, stream):
+        """Encode speed (output media seconds per wall second) and frame rate of
+        each transcoded output since the previous progress block."""
+        now = time.monotonic()
+        previous = stream['_encoder_sample']
+        names = [stream.get('rendition', 'copy')] + [output['rendition'] for output in stream.get('outputs', ())]
+        renditions = []
+        for index, (frames, media_time) in sorted(stream['_encoder_clock'].items()):
+            entry = {'output': index, 'rendition': names[index] if index < len(names) else None, 'speed': None, 'fps': None}
+            last = previous.get(index)
+            if last is not None and now > last[2]:
+                entry['speed'] = round((media_time - last[1]) / (now - last[2]), 3)
+                entry['fps'] = round((frames - last[0]) / (now - last[2]), 1)
+            renditions.append(entry)
+        stream['_encoder_sample'] = {index: (frames, media_time, now) for index, (frames, media_time) in stream['_encoder_clock'].items()}
+        return renditions
+
+    def _emit_stream_metrics(self, stream_name, stream, progress):
+        """Every progress block, unthrottled, with the relay counters of an ingest."""
+        self.socketio.emit('stream_metrics', {
+            'stream': stream_name,
+            'time': time.time(),
+            'status': stream['status'],
+            'progress': progress,
+            'relay': self.supervisor.relay_stats(stream_name) if stream.get('kind') == 'ingest' else None
+        }, to=metrics_room(stream_name))
+
+    def _log_secrets(self, stream):
+        """(secret, mask) pairs to take out of a stream's FFmpeg output, which
+        echoes the input and output URLs. Keys too short to be told apart from
+        ordinary text are left in."""
+        if '_log_secrets' not in stream:
+            outputs = [stream] + list(stream.get('outputs', ()))
+            stream['_log_secrets'] = [
+                (secret, mask) for field, mask in (('stream_key', '[STREAM_KEY_REDACTED]'),
+                                                   ('srt_passphrase', '[SRT_PASSPHRASE_REDACTED]'))
+                for secret in (output.get(field) for output in outputs) if secret and len(secret) >= 6
+            ]
+        return stream['_log_secrets']
+
+    def _update_stream_stats(self, stream_name, log_line):
+        """Update stream status from FFmpeg log output (errors and failures)."""
+        stream = self.active_streams.get(stream_name)
+        log_line = _redact_passphrases(log_line, ())
+        for secret, label in self._log_secrets(stream) if stream else ():
+            if secret in log_line:
+                log_line = log_line.replace(secret, label)
+        self.logs.line(stream_name, log_line)
+        if not stream:
+            return
 
         # Parse errors and specific failure conditions
         if 'error' in log_line.lower():
             stream['health']['last_error'] = log_line
             stream['status'] = 'warning'
             
-        # Check for specific input/connection failures
-        if any(failure in log_line.lower() for failure in [
-            'connection refused', 'connection reset', 'no such file or directory',
-            'input/output error', 'server returned 404', 'server returned 403',
-            'rtmp_connect_stream', 'invalid data found', 'connection timed out',
-            'end of file'
-        ]):
+        # Input/connection failures end the process; the category picks the retry policy
+        category = classify_failure(log_line)
+        fatal = category is not None and '_failure' not in stream
+        if fatal:
+            stream['_failure'] = category
             stream['health']['last_error'] = log_line
             stream['status'] = 'failed'
-            stream['_terminate_requested'] = True  # Signal monitor to terminate process
-            print(f"Stream '{stream_name}' detected fatal error: {log_line}")
+            self.logs.event(stream_name, 'error', log_line, category=category)
+            self.supervisor.terminate(stream_name)
 
         # Update health check timestamp
         stream['health']['last_health_check'] = datetime.now(timezone.utc).isoformat()
-        self.socketio.emit('stream_status_update', self.get_active_streams())
+        if fatal:
+            self._emit_status_now(stream_name)
+        else:
+            self._mark_dirty(stream_name)
 
     def _restart_stream(self, stream_name):
         stream = self.active_streams.get(stream_name)
         if not stream:
             return
+        stream['health']['next_restart_in'] = None
 
-        cmd_args = self._build_ffmpeg_command(
-            stream['input'], stream['destination'], stream['stream_key'],
-            stream.get('srt_passphrase'), stream.get('srt_latency')
-        )
         try:
-            new_process = subprocess.Popen(
-                cmd_args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            stream['process'] = new_process
+            self._spawn(stream_name, stream)
             stream['status'] = 'active'
             # Reset start_time for the new FFmpeg session
             stream['start_time'] = datetime.now(timezone.utc).isoformat()
-            # Clear any previous termination flags and errors
-            stream.pop('_terminate_requested', None)
-            stream['health']['last_error'] = None
-            stream['health']['fps'] = 0
-            stream['health']['bitrate'] = '0 kb/s'
-
-            # Start monitoring the new process
-            threading.Thread(
-                target=self._monitor_stream,
-                args=(stream_name, new_process),
-                daemon=True
-            ).start()
+            # Clear any previous errors
+            stream['health'].update({
+                'last_error': None,
+                'fps': 0,
+                'bitrate': '0 kb/s',
+                'bitrate_kbps': 0.0,
+                'speed': None,
+                'behind_realtime': False
+            })
+            self._persist(stream_name)
 
         except Exception as e:
             stream['status'] = 'failed'
             stream['health']['last_error'] = str(e)
             print(f"Error restarting stream '{stream_name}': {e}")
+            self.restart_scheduler.release(stream_name)
+
+        self._emit_status_now(stream_name)
+
+
+def _warm_destination(url, timeout=5.0):
+    """Resolve the host of an output URL and, for TCP outputs, open and close
+    a connection to it. The stream key in the URL is not reported."""
+    parts = urlsplit(url)
+    result = {'host': parts.hostname, 'dns_ms': None, 'connect_ms': None, 'error': None}
+    if not parts.hostname:
+        return result
+    udp = parts.scheme == 'srt'
+    port = parts.port or {'rtmp': 1935, 'rtmps': 443}.get(parts.scheme, 1935)
+    started = time.monotonic()
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_DGRAM if udp else socket.SOCK_STREAM)
+        result['dns_ms'] = round((time.monotonic() - started) * 1000)
+        if not udp:
+            family, kind, proto, _, address = addresses[0]
+            started = time.monotonic()
+            with socket.socket(family, kind, proto) as sock:
+                sock.settimeout(timeout)
+                sock.connect(address)
+            result['connect_ms'] = round((time.monotonic() - started) * 1000)
+    except OSError as e:
+        result['error'] = str(e)
+    return result
+
 
-        self.socketio.emit('stream_status_update', self.get_active_streams())
+def _redact_passphrases(arg, passphrases):
+    """arg with the SRT passphrases in it masked: the passphrase parameter of
+    any SRT URL, and the given passphrases wherever else they appear."""
+    if 'passphrase=' in arg:
+        arg = SRT_PASSPHRASE_PARAM.sub(r'\1[SRT_PASSPHRASE_REDACTED]', arg)
+    for passphrase in passphrases:
+        arg = arg.replace(passphrase, '[SRT_PASSPHRASE_REDACTED]')
+    return arg
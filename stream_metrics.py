@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from array import array
+
+# Numeric health fields kept as history
+METRIC_FIELDS = ('bitrate_kbps', 'fps', 'speed', 'drop_frames', 'output_delay_ms', 'cpu_percent', 'egress_kbps')
+
+# (seconds per slot, number of slots): 1s for 15 minutes, 10s for 24 hours
+TIERS = ((1, 900), (10, 8640))
+
+
+class _Tier:
+    """Fixed-size ring of time slots. A slot holds the mean of the samples that
+    fell into it; slot_ids tells which period a ring position currently holds."""
+
+    def __init__(self, resolution, size, fields):
+        self.resolution = resolution
+        self.size = size
+        self.slot_ids = array('q', [-1]) * size
+        self.counts = array('H', [0]) * size
+        self.values = {field: array('f', [math.nan]) * size for field in fields}
+
+    def add(self, now, sample):
+        slot = int(now // self.resolution)
+        index = slot % self.size
+        if self.slot_ids[index] != slot:
+            self.slot_ids[index] = slot
+            self.counts[index] = 0
+            for values in self.values.values():
+                values[index] = math.nan
+        count = self.counts[index] = min(self.counts[index] + 1, 65535)
+        for field, value in sample.items():
+            values = self.values[field]
+            current = values[index]
+            # Running mean downsamples the 1s samples into coarser slots
+            values[index] = value if math.isnan(current) else current + (value - current) / count
+
+    def read(self, now, since, fields):
+        newest = int(now // self.resolution)
+        oldest = max(newest - self.size + 1, int(since // self.resolution) if since else 0)
+        timestamps = []
+        series = {field: [] for field in fields}
+        for slot in range(oldest, newest + 1):
+            index = slot % self.size
+            if self.slot_ids[index] != slot:
+                continue  # No samples in that period
+            timestamps.append(slot * self.resolution)
+            for field in fields:
+                value = self.values[field][index]
+                series[field].append(None if math.isnan(value) else round(value, 3))
+        return timestamps, series
+
+    def nbytes(self):
+        arrays = [self.slot_ids, self.counts] + list(self.values.values())
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+class MetricsStore:
+    """Per-stream metric history in preallocated numeric ring buffers.
+
+    Memory per stream is fixed at creation (about 360 KB with the default
+    tiers and fields) regardless of how long the stream runs.
+    """
+
+    def __init__(self, tiers=TIERS, fields=METRIC_FIELDS):
+        self.tiers = tiers
+        self.fields = fields
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def record(self, stream_name, health, now=None):
+        """Add one sample taken from a stream's health dict."""
+        now = time.time() if now is None else now
+        sample = {}
+        for field in self.fields:
+            value = health.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sample[field] = float(value)
+        if not sample:
+            return
+        with self._lock:
+            tiers = self._streams.get(stream_name)
+            if tiers is None:
+                tiers = self._streams[stream_name] = [_Tier(r, n, self.fields) for r, n in self.tiers]
+            for tier in tiers:
+                tier.add(now, sample)
+
+    def history(self, stream_name, window=900, resolution=None, fields=None):
+        """Samples of the last `window` seconds from the finest tier that covers it
+        (or the tier with the given resolution). Returns None for unknown streams."""
+        fields = [f for f in (fields or self.fields) if f in self.fields]
+        now = time.time()
+        with self._lock:
+            tiers = self._streams.get(stream_name)
+            if tiers is None:
+                return None
+            if resolution is not None:
+                tier = next((t for t in tiers if t.resolution == resolution), None)
+                if tier is None:
+                    return None
+            else:
+                tier = next((t for t in tiers if t.resolution * t.size >= window), tiers[-1])
+            timestamps, series = tier.read(now, now - window, fields)
+        return {
+            'stream': stream_name,
+            'resolution': tier.resolution,
+            'timestamps': timestamps,
+            'series': series
+        }
+
+    def remove(self, stream_name):
+        with self._lock:
+            self._streams.pop(stream_name, None)
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(tier.nbytes() for tiers in self._streams.values() for tier in tiers)
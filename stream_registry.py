@@ -0,0 +1,156 @@
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import threading
+import time
+
+# Stream fields needed to rebuild a stream after a server restart
+DEFINITION_FIELDS = (
+    'kind', 'group', 'input', 'destination', 'stream_key',
+    'srt_passphrase', 'srt_latency', 'owner', 'source_name', 'backup_input',
+    'profile', 'rendition', 'outputs'
+)
+
+
+class StreamRegistry:
+    """On-disk record of stream definitions and runtime state (SQLite, WAL mode).
+
+    Written only at lifecycle points (spawn, restart, stop), never per stats update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        try:
+            os.chmod(path, 0o600)  # Holds stream keys
+        except OSError:
+            pass
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS streams (
+                name TEXT PRIMARY KEY,
+                definition TEXT NOT NULL,
+                pid INTEGER,
+                pid_start INTEGER,
+                log_fifo TEXT,
+                progress_fifo TEXT,
+                start_time TEXT,
+                restart_count INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def save(self, name, stream):
+        """Store a stream's definition together with its current process."""
+        process = stream.get('process')
+        # A third FIFO (encoder stats) is found again next to the progress FIFO
+        log_fifo, progress_fifo = (getattr(process, 'fifo_paths', None) or (None, None))[:2]
+        definition = json.dumps({field: stream.get(field) for field in DEFINITION_FIELDS})
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO streams
+                   (name, definition, pid, pid_start, log_fifo, progress_fifo, start_time, restart_count, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    name, definition,
+                    process.pid if process else None,
+                    process_start_time(process.pid) if process else None,
+                    log_fifo, progress_fifo,
+                    stream.get('start_time'),
+                    stream['health']['restart_count'],
+                    time.time()
+                )
+            )
+
+    def update_restart_count(self, name, restart_count):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE streams SET restart_count = ?, updated_at = ? WHERE name = ?',
+                (restart_count, time.time(), name)
+            )
+
+    def remove(self, name):
+        with self._lock:
+            self._conn.execute('DELETE FROM streams WHERE name = ?', (name,))
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT name, definition, pid, pid_start, log_fifo, progress_fifo, start_time, restart_count
+                   FROM streams"""
+            ).fetchall()
+        records = []
+        for name, definition, pid, pid_start, log_fifo, progress_fifo, start_time, restart_count in rows:
+            records.append({
+                'name': name,
+                'definition': json.loads(definition),
+                'pid': pid,
+                'pid_start': pid_start,
+                'log_fifo': log_fifo,
+                'progress_fifo': progress_fifo,
+                'start_time': start_time,
+                'restart_count': restart_count
+            })
+        return records
+
+
+def process_start_time(pid):
+    """Kernel start time of pid (clock ticks since boot), used to detect pid reuse."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces; fields after it are space separated
+    fields = stat[stat.rindex(')') + 2:].split()
+    if fields[0] == 'Z':
+        return None  # Zombie: already exited
+    return int(fields[19])
+
+
+class AttachedProcess:
+    """Popen-like handle for an FFmpeg process started by an earlier server instance.
+
+    It is not our child, so its exit status cannot be collected; an exited
+    process reports returncode -1.
+    """
+
+    def __init__(self, pid, pid_start, log_pipe, progress_pipe, fifo_paths):
+        self.pid = pid
+        self.pid_start = pid_start
+        self.returncode = None
+        self.stdin = None
+        self.stdout = None
+        self.stderr = log_pipe
+        self.progress_pipe = progress_pipe
+        self.fifo_paths = fifo_paths
+
+    def poll(self):
+        if self.returncode is None and process_start_time(self.pid) != self.pid_start:
+            self.returncode = -1
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(f'pid {self.pid}', timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
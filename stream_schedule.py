@@ -0,0 +1,277 @@
+"""Timed starts and stops of streams, one-off or as recurring slots.
+
+Entries are kept in SQLite and survive a server restart; the heap of upcoming
+actions is rebuilt from them on load. A thread of its own sleeps until the
+earliest action, so firing never waits behind the supervisor loop. Due times
+are wall clock (epoch seconds); repeats are fixed intervals.
+
+Every occurrence of an entry runs up to three actions: 'prewarm' prewarm_lead
+seconds before the start, 'start' lead seconds before it so that output is on
+the wire at the scheduled moment, and 'stop'. An entry's lead is learnt from
+how far off its earlier starts were.
+"""
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+REPEAT_INTERVALS = {'daily': 86400, 'weekly': 7 * 86400}
+
+
+class StreamSchedule:
+    def __init__(self, path=None, prewarm_lead=30.0, missed_grace=300.0, estimate_lead=None, on_due=None, on_change=None):
+        """path is the SQLite database to keep entries in (None keeps them in
+        memory only). A start more than missed_grace seconds overdue on load is
+        skipped, unless its slot has not ended yet. estimate_lead() gives the
+        lead of entries that have not run yet. on_due(action, entries) runs on
+        the schedule thread with copies of every entry whose action is due and
+        must not block; on_change(owner) fires whenever an entry changes."""
+        self.prewarm_lead = prewarm_lead
+        self.missed_grace = missed_grace
+        self.estimate_lead = estimate_lead or (lambda: 1.0)
+        self.on_due = on_due
+        self.on_change = on_change
+        self._entries = {}
+        self._generations = {}  # Entry -> generation of its heap items; older items are stale
+        self._heap = []  # (due, seq, entry id, action, generation)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS schedule (
+                    id TEXT PRIMARY KEY,
+                    entry TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def start(self):
+        """Load the stored entries and start firing them."""
+        if self._thread is not None:
+            return
+        now = time.time()
+        for (data,) in self._conn.execute('SELECT entry FROM schedule').fetchall() if self._conn else ():
+            entry = json.loads(data)
+            with self._cond:
+                self._entries[entry['id']] = entry
+                if entry['next'] == 'start' and entry['start_at'] < now - self.missed_grace and not (
+                        entry['stop_at'] and entry['stop_at'] > now):
+                    print(f"Missed scheduled start of stream '{entry['stream_name']}' at {_iso(entry['start_at'])}.")
+                    entry['last'] = {'scheduled_at': _iso(entry['start_at']), 'error': 'Missed while the server was down'}
+                    self._advance(entry, now)
+                else:
+                    entry['prewarmed'] = False
+                    self._arm(entry)
+        self._thread = threading.Thread(target=self._run, name='stream-schedule', daemon=True)
+        self._thread.start()
+
+    def add(self, stream_name, owner, spec=None, start_at=None, stop_at=None, repeat=0):
+        """Schedule a start (spec holds start_stream keyword arguments) at
+        start_at and/or a stop at stop_at, every repeat seconds if repeat."""
+        entry = {
+            'id': uuid.uuid4().hex[:12],
+            'stream_name': stream_name,
+            'owner': owner,
+            'spec': spec,
+            'start_at': start_at,
+            'stop_at': stop_at,
+            'repeat': repeat or 0,
+            'next': 'start' if start_at is not None else 'stop',
+            'lead': None,
+            'prewarmed': False,
+            'prewarm': None,
+            'last': None,
+            'created_at': time.time()
+        }
+        with self._cond:
+            self._entries[entry['id']] = entry
+            self._save(entry)
+            self._arm(entry)
+        self._changed(owner)
+        return self.view(entry)
+
+    def cancel(self, entry_id):
+        with self._cond:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                return None
+            self._generations.pop(entry_id, None)
+            self._delete(entry_id)
+        self._changed(entry['owner'])
+        return entry
+
+    def get(self, entry_id):
+        with self._cond:
+            entry = self._entries.get(entry_id)
+            return dict(entry) if entry else None
+
+    def entries(self, owner=None):
+        with self._cond:
+            entries = [self.view(e) for e in self._entries.values() if owner is None or e['owner'] == owner]
+        return sorted(entries, key=lambda e: e['due_at'] or '')
+
+    def prewarmed(self, entry_id, result):
+        """Store a pre-warm result and re-arm the start with the current lead estimate."""
+        with self._cond:
+            entry = self._entries.get(entry_id)
+            if entry is None or entry['next'] != 'start':
+                return
+            entry['prewarm'] = result
+            self._arm(entry)
+        self._changed(entry['owner'])
+
+    def record(self, entry_id, scheduled_at, offset=None, **result):
+        """Add the outcome of the start scheduled at scheduled_at to its entry's
+        last run. With the measured offset (seconds from the scheduled moment
+        to the first output) the entry's lead moves halfway towards what this
+        start needed, lead + offset."""
+        with self._cond:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return
+            last = entry['last'] if entry['last'] and entry['last'].get('scheduled_at') == _iso(scheduled_at) else {
+                'scheduled_at': _iso(scheduled_at)}
+            last.update(result)
+            if offset is not None:
+                last['offset_ms'] = round(offset * 1000)
+            # Starts that fired late (e.g. after downtime) say nothing about the lead
+            if offset is not None and abs(last.get('fire_lag_ms', 0)) < 1000:
+                used = last.get('lead_ms', 0) / 1000
+                # The first measurement replaces the estimate outright
+                step = offset / 2 if entry['lead'] is not None else offset
+                entry['lead'] = min(max(0.0, used + step), self.prewarm_lead)
+            entry['last'] = last
+            self._save(entry)
+        self._changed(entry['owner'])
+
+    def view(self, entry):
+        spec = entry['spec'] or {}
+        due_at = entry['start_at'] if entry['next'] == 'start' else entry['stop_at']
+        return {
+            'id': entry['id'],
+            'stream_name': entry['stream_name'],
+            'owner': entry['owner'],
+            'source_name': spec.get('source_name'),
+            'destination': spec.get('destination'),
+            'start_at': _iso(entry['start_at']) if entry['start_at'] is not None else None,
+            'stop_at': _iso(entry['stop_at']) if entry['stop_at'] is not None else None,
+            'repeat': entry['repeat'],
+            'next': entry['next'],
+            'due_at': _iso(due_at),
+            'lead_ms': round(self._lead(entry) * 1000),
+            'prewarm': entry['prewarm'],
+            'last': entry['last']
+        }
+
+    def _lead(self, entry):
+        lead = entry['lead'] if entry['lead'] is not None else self.estimate_lead()
+        return min(max(0.0, lead), self.prewarm_lead)
+
+    def _arm(self, entry):
+        generation = self._generations[entry['id']] = self._generations.get(entry['id'], 0) + 1
+        if entry['next'] == 'start':
+            if self.prewarm_lead and not entry['prewarmed']:
+                self._push(entry['start_at'] - self.prewarm_lead, entry['id'], 'prewarm', generation)
+            self._push(entry['start_at'] - self._lead(entry), entry['id'], 'start', generation)
+        else:
+            self._push(entry['stop_at'], entry['id'], 'stop', generation)
+        self._cond.notify()
+
+    def _push(self, due, entry_id, action, generation):
+        heapq.heappush(self._heap, (due, next(self._seq), entry_id, action, generation))
+
+    def _advance(self, entry, now):
+        """Move an entry past its current occurrence: to the next one that has
+        not ended yet if it repeats, otherwise drop it."""
+        if not entry['repeat']:
+            self._entries.pop(entry['id'], None)
+            self._generations.pop(entry['id'], None)
+            self._delete(entry['id'])
+            return
+        while (entry['stop_at'] if entry['stop_at'] is not None else entry['start_at']) <= now:
+            for field in ('start_at', 'stop_at'):
+                if entry[field] is not None:
+                    entry[field] += entry['repeat']
+        entry['next'] = 'start' if entry['start_at'] is not None else 'stop'
+        entry['prewarmed'] = False
+        entry['prewarm'] = None
+        self._save(entry)
+        self._arm(entry)
+
+    def _pop_due(self, now):
+        """Take every due action off the heap and move its entry on. Returns
+        {action: [entry copies]}; start copies carry scheduled_at and lead."""
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry_id, action, generation = heapq.heappop(self._heap)
+            entry = self._entries.get(entry_id)
+            if entry is None or self._generations.get(entry_id) != generation:
+                continue  # Cancelled, or re-armed since this item was pushed
+            if action == 'prewarm':
+                entry['prewarmed'] = True
+                due.setdefault(action, []).append(dict(entry))
+                continue
+            if action == 'start':
+                lead = self._lead(entry)
+                entry['last'] = {'scheduled_at': _iso(entry['start_at']), 'fired_at': _iso(now),
+                                 'fire_lag_ms': round((now - entry['start_at'] + lead) * 1000),
+                                 'lead_ms': round(lead * 1000)}
+                due.setdefault(action, []).append(dict(entry, scheduled_at=entry['start_at']))
+                if entry['stop_at'] is not None:
+                    entry['next'] = 'stop'
+                    self._save(entry)
+                    self._arm(entry)
+                else:
+                    self._advance(entry, now)
+            else:
+                due.setdefault(action, []).append(dict(entry))
+                self._advance(entry, now)
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timeout = 60.0 if not self._heap else self._heap[0][0] - time.time()
+                if timeout > 0:
+                    # Capped so that a wall-clock step is noticed within a minute
+                    self._cond.wait(min(timeout, 60.0))
+                due = self._pop_due(time.time())
+            # Starts first: they are the ones aimed at a precise moment
+            for action in ('start', 'stop', 'prewarm'):
+                if action not in due:
+                    continue
+                try:
+                    if self.on_due:
+                        self.on_due(action, due[action])
+                except Exception as e:
+                    print(f"Stream schedule error: {e}")
+                for owner in {entry['owner'] for entry in due[action]}:
+                    self._changed(owner)
+
+    def _changed(self, owner):
+        if self.on_change:
+            try:
+                self.on_change(owner)
+            except Exception as e:
+                print(f"Stream schedule error: {e}")
+
+    def _save(self, entry):
+        if self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO schedule (id, entry, updated_at) VALUES (?, ?, ?)',
+                               (entry['id'], json.dumps(entry), time.time()))
+
+    def _delete(self, entry_id):
+        if self._conn:
+            self._conn.execute('DELETE FROM schedule WHERE id = ?', (entry_id,))
+
+
+def _iso(at):
+    return datetime.fromtimestamp(at, timezone.utc).isoformat() if at is not None else None
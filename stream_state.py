@@ -0,0 +1,95 @@
+"""Versioned, copy-on-write store of the stream views sent to clients.
+
+The module doubles as the json module of the Socket.IO server
+(SocketIO(app, json=stream_state)): payloads built here carry their
+serialized form, so a snapshot or delta is encoded once per version no
+matter how many clients receive or request it.
+"""
+import json
+import threading
+from types import MappingProxyType
+
+loads = json.loads
+
+
+class Payload(dict):
+    """A status payload that carries its own JSON encoding.
+
+    It is a plain dict to everything else, so a server without this json
+    module still encodes it correctly, just without the cache. Treat it as
+    read-only once built.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.text = json.dumps(data, separators=(',', ':'))
+
+
+def dumps(obj, **kwargs):
+    """json.dumps that splices in the cached text of top-level Payloads, as in
+    Socket.IO event ([name, payload]) and ack ([payload]) packets."""
+    if isinstance(obj, Payload):
+        return obj.text
+    if isinstance(obj, (list, tuple)) and any(isinstance(item, Payload) for item in obj):
+        return '[' + ','.join(
+            item.text if isinstance(item, Payload) else json.dumps(item, **kwargs) for item in obj
+        ) + ']'
+    return json.dumps(obj, **kwargs)
+
+
+class StreamStateStore:
+    """Stream views (name -> dict) under a monotonically increasing version.
+
+    Every commit builds a new mapping instead of changing the current one, so
+    a snapshot is never modified after a reader got it and can be iterated
+    from any thread without locks. Views themselves must not be changed after
+    they are committed. Each view has an audience, the users (besides admins)
+    allowed to see it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = (0, MappingProxyType({}), MappingProxyType({}))
+        self._payloads = {}
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def snapshot(self):
+        """(version, read-only mapping of stream name to view)."""
+        return self._state[:2]
+
+    def audiences(self):
+        """Read-only mapping of stream name to the users who may see it."""
+        return self._state[2]
+
+    def commit(self, changed, removed=(), audiences=None):
+        """Apply changed views (with their audiences) and removed names as one
+        new version and return the delta payload for it. Its `since` is the
+        previous version: a client holding that version can apply it."""
+        with self._lock:
+            version, views, viewers = self._state
+            views, viewers = dict(views), dict(viewers)
+            views.update(changed)
+            viewers.update(audiences or {})
+            for name in removed:
+                views.pop(name, None)
+                viewers.pop(name, None)
+            version += 1
+            self._state = (version, MappingProxyType(views), MappingProxyType(viewers))
+            self._payloads = {}
+        return Payload({'version': version, 'since': version - 1, 'full': False,
+                        'streams': changed, 'removed': sorted(removed)})
+
+    def full_payload(self, user=None):
+        """Full snapshot payload, of every stream or only those user may see,
+        serialized once per version."""
+        version, views, viewers = self._state
+        cached = self._payloads.get(user)
+        if cached is None or cached['version'] != version:
+            if user is not None:
+                views = {name: view for name, view in views.items() if user in viewers.get(name, ())}
+            cached = Payload({'version': version, 'full': True, 'streams': dict(views)})
+            self._payloads[user] = cached  # A racing reader may build it too; both are equal
+        return cached
@@ -0,0 +1,769 @@
+import heapq
+import itertools
+import os
+import selectors
+import signal
+import threading
+import time
+from collections import deque
+from ffmpeg_progress import ProgressParser
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+
+class _Timer:
+    __slots__ = ('due', 'callback', 'args', 'cancelled')
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Egress:
+    """Output throughput of one process, from the total_size of its progress
+    blocks over a rolling window, and the bitrate it is expected to write."""
+
+    def __init__(self, expected_kbps=None):
+        self.expected_kbps = expected_kbps
+        self.learn = not expected_kbps  # Without a known bitrate the healthy rate is the baseline
+        self.samples = deque()  # (monotonic time, total bytes)
+        self.first_growth = None
+        self.last_growth = None  # When the byte count last went up
+        self.state = 'starting'
+        self.detect_ms = None  # Time from the last written byte to the last stall being flagged
+
+    def add(self, now, total, window):
+        if self.samples and total < self.samples[-1][1]:
+            self.samples.clear()  # Counter went back; the window starts over
+        if total > (self.samples[-1][1] if self.samples else 0):
+            self.first_growth = self.first_growth or now
+            self.last_growth = now
+        self.samples.append((now, total))
+        # One sample at or before the start of the window stays as the reference
+        while len(self.samples) > 2 and self.samples[1][0] <= now - window:
+            self.samples.popleft()
+
+    def full(self, window):
+        """Whether the samples span a whole window of output. Until then the
+        rate is skewed by startup: bytes before the first sample, or none."""
+        if self.first_growth is None or len(self.samples) < 2:
+            return False
+        (start, _), (end, _) = self.samples[0], self.samples[-1]
+        return start >= self.first_growth and end - start >= window
+
+    def kbps(self):
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        return round((last - first) * 8 / 1000 / (end - start), 1) if end > start else None
+
+
+class _Watch:
+    """Per-process bookkeeping for the supervisor loop."""
+
+    def __init__(self, key, process, on_line, on_exit, heartbeat_timeout, on_progress=None, progress_pipe=None, log_pipe=None, on_stats=None, stats_pipe=None, on_egress=None, expected_kbps=None):
+        self.key = key
+        self.process = process
+        self.log_pipe = log_pipe or process.stderr
+        self.on_line = on_line
+        self.on_exit = on_exit
+        self.on_progress = on_progress
+        self.heartbeat_timeout = heartbeat_timeout
+        self.progress = ProgressParser() if on_progress else None
+        self.progress_pipe = progress_pipe or (process.stdout if on_progress else None)
+        self.on_stats = on_stats
+        self.stats_pipe = stats_pipe if on_stats else None
+        self.stats_buffer = b''
+        self.on_egress = on_egress if on_progress else None
+        self.egress = _Egress(expected_kbps) if self.on_egress else None
+        self.buffer = b''
+        self.tail = deque(maxlen=20)  # last stderr lines, reported on exit
+        self.last_activity = time.monotonic()
+        self.eof = False
+        self.kill_at = None
+        self.stalled = False  # Terminated by the heartbeat check
+        self.on_reaped = []  # Callbacks of terminate() calls waiting for the exit
+
+    def pipes(self):
+        return [p for p in (self.log_pipe, self.progress_pipe, self.stats_pipe) if p is not None]
+
+
+class _Sink:
+    """One consumer of a relay, usually the stdin of an egress FFmpeg."""
+
+    def __init__(self, key, pipe):
+        self.key = key
+        self.pipe = pipe
+        self.fd = pipe.fileno()
+        self.backlog = deque()
+        self.backlog_bytes = 0
+        self.bytes_written = 0
+        self.bytes_dropped = 0
+        self.writing = False  # registered for EVENT_WRITE while backlog is pending
+
+
+class _RelaySource:
+    """One MPEG-TS input of a relay: the ingest ('primary') or its hot standby ('standby')."""
+
+    def __init__(self, role, pipe):
+        self.role = role
+        self.pipe = pipe
+        self.remainder = b''
+        self.attached_at = time.monotonic()
+        self.last_data = None
+        self.flowing_since = None  # Start of the current run of data without a stall
+
+
+class _Relay:
+    """Fans the MPEG-TS output of one ingest process out to many sinks."""
+
+    def __init__(self, key):
+        self.key = key
+        self.sources = {}
+        self.active = 'primary'
+        self.sinks = {}
+        self.bytes_in = 0
+        self.last_data = None
+        # Hot-standby failover, configured by relay_standby()
+        self.failover = None
+        self.switch_to = None  # Role that takes over at its next PAT packet
+        self.switch_started = None  # Gap start used for the failover latency
+        self.failovers = 0
+        self.failover_latency_ms = None
+
+
+class StreamSupervisor:
+    """One selector loop that watches every FFmpeg stderr pipe, reaps exited
+    children, enforces heartbeat timeouts, tracks output throughput, relays
+    shared ingest output to egress processes and runs timers (e.g. restart delays).
+
+    All callbacks run on the loop thread. Other threads talk to the loop through
+    call_soon/call_later, which wake it via a self-pipe.
+    """
+
+    def __init__(self, tick=1.0, terminate_grace=3.0, sink_backlog_limit=8 * 1024 * 1024, egress_window=3.0, degraded_ratio=0.5, stall_restart_after=10.0):
+        """Output throughput is measured over egress_window seconds. A process
+        writing less than degraded_ratio of its expected bitrate is degraded; one
+        that wrote nothing for a whole window is stalled, and is terminated as
+        dead once it has been stalled for stall_restart_after seconds (0 only
+        flags it). Stalls are flagged within egress_window plus one tick."""
+        self.tick = tick
+        self.terminate_grace = terminate_grace
+        self.sink_backlog_limit = sink_backlog_limit
+        self.egress_window = egress_window
+        self.degraded_ratio = degraded_ratio
+        self.stall_restart_after = stall_restart_after
+        self._selector = selectors.DefaultSelector()
+        self._watches = {}
+        self._relays = {}
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._pending = deque()
+        self._exiting = set()  # watches whose pipe hit EOF and await reaping
+        self._next_sweep = 0.0
+        # Timer lateness: how long callbacks wait behind other loop work
+        self._loop_lag = 0.0
+        self._loop_lag_max = 0.0
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, (self._drain_wakeup, None))
+        self._thread = threading.Thread(target=self._run, name='stream-supervisor', daemon=True)
+        self._thread.start()
+
+    # Thread-safe API
+
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+
+    def call_soon(self, callback, *args):
+        self._pending.append((callback, args))
+        self._wakeup()
+
+    def call_later(self, delay, callback, *args):
+        timer = _Timer(time.monotonic() + delay, callback, args)
+        self.call_soon(self._push_timer, timer)
+        return timer
+
+    def watch(self, key, process, on_line, on_exit, heartbeat_timeout=30, on_progress=None, progress_pipe=None, log_pipe=None, on_stats=None, stats_pipe=None, on_egress=None, expected_kbps=None):
+        """Start watching a process. on_line(key, line) gets every line of log_pipe
+        (stderr by default), on_exit(key, process, returncode, tail, stalled) fires once the
+        child is reaped. With on_progress, progress_pipe (stdout by default) is parsed
+        as FFmpeg -progress output and on_progress(key, block) gets every completed block.
+        With on_stats, on_stats(key, lines) gets the complete lines of each read
+        from stats_pipe (FFmpeg -stats_enc_post output), kept out of the log tail.
+        With on_progress and on_egress, on_egress(key, egress) gets the output
+        throughput once per tick: state ('starting', 'ok', 'degraded' or 'stalled'),
+        kbps, expected_kbps (expected_kbps, or the learnt healthy rate), window_s
+        and detect_ms."""
+        watch = _Watch(key, process, on_line, on_exit, heartbeat_timeout, on_progress, progress_pipe, log_pipe, on_stats, stats_pipe, on_egress, expected_kbps)
+        self._run_in_loop(self._add_watch, watch)
+
+    def terminate(self, key, reason=None, on_reaped=None):
+        """Ask a watched process to stop; it is killed if it ignores SIGTERM.
+        Returns at once. on_reaped(key, returncode) fires on the loop once the
+        process has been reaped, or right away (returncode None) if key has no
+        running process."""
+        self._run_in_loop(self._terminate, key, reason, on_reaped)
+
+    def relay(self, key, pipe):
+        """Read MPEG-TS from pipe and copy it to every sink of relay key.
+        Replaces the previous source of the relay, keeping its sinks."""
+        self._run_in_loop(self._set_relay_source, key, pipe)
+
+    def relay_standby(self, key, pipe, stall_timeout=0.5, switch_back_after=5.0, startup_grace=5.0, on_switch=None):
+        """Attach a hot-standby MPEG-TS source to relay key (pipe=None detaches it).
+
+        The standby is read continuously but only forwarded while the primary
+        is stalled: after stall_timeout seconds without primary data (or
+        startup_grace seconds without any) the relay switches to the standby at
+        its next PAT packet, and switches back once the primary has delivered
+        data for switch_back_after seconds. on_switch(key, role, latency_ms)
+        fires on every switch; latency is measured from the last primary data
+        to the first forwarded standby packet."""
+        self._run_in_loop(self._set_relay_standby, key, pipe, {
+            'stall_timeout': stall_timeout,
+            'switch_back_after': switch_back_after,
+            'startup_grace': startup_grace,
+            'on_switch': on_switch
+        })
+
+    def add_sink(self, key, sink_key, pipe):
+        self._run_in_loop(self._add_sink, key, sink_key, pipe)
+
+    def remove_sink(self, key, sink_key):
+        """Detach a sink and close its pipe, which ends the consumer's input."""
+        self._run_in_loop(self._remove_sink, key, sink_key)
+
+    def close_relay(self, key):
+        self._run_in_loop(self._close_relay, key)
+
+    def relay_stats(self, key):
+        relay = self._relays.get(key)
+        if relay is None:
+            return None
+        return {
+            'bytes_in': relay.bytes_in,
+            'active_input': relay.active,
+            'failovers': relay.failovers,
+            'failover_latency_ms': relay.failover_latency_ms,
+            'sinks': {
+                sink.key: {
+                    'bytes_written': sink.bytes_written,
+                    'bytes_dropped': sink.bytes_dropped,
+                    'backlog_bytes': sink.backlog_bytes
+                }
+                for sink in list(relay.sinks.values())
+            }
+        }
+
+    def stats(self, reset_max=True):
+        """Loop internals for monitoring. loop_lag_max_seconds covers the time
+        since the previous call with reset_max."""
+        stats = {
+            'children': len(self._watches),
+            'relays': len(self._relays),
+            'sinks': sum(len(relay.sinks) for relay in list(self._relays.values())),
+            'timers': len(self._timers),
+            'loop_lag_seconds': self._loop_lag,
+            'loop_lag_max_seconds': self._loop_lag_max
+        }
+        if reset_max:
+            self._loop_lag_max = self._loop_lag
+        return stats
+
+    # Loop internals
+
+    def _run_in_loop(self, callback, *args):
+        if self.in_loop():
+            callback(*args)
+        else:
+            self.call_soon(callback, *args)
+
+    def _wakeup(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Pipe full means a wakeup is already pending
+
+    def _push_timer(self, timer):
+        heapq.heappush(self._timers, (timer.due, next(self._timer_seq), timer))
+
+    def _register(self, pipe, events, handler, obj):
+        fd = pipe.fileno()
+        os.set_blocking(fd, False)
+        self._selector.register(fd, events, (handler, obj))
+
+    def _unregister_pipe(self, pipe):
+        try:
+            self._selector.unregister(pipe.fileno())
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _close_pipe(self, pipe):
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+    def _add_watch(self, watch):
+        # Keyed by pid: a stopped stream's old process is still reaped if the name is reused
+        self._watches[watch.process.pid] = watch
+        self._register(watch.log_pipe, selectors.EVENT_READ, self._read, watch)
+        if watch.progress is not None:
+            self._register(watch.progress_pipe, selectors.EVENT_READ, self._read_progress, watch)
+        if watch.stats_pipe is not None:
+            self._register(watch.stats_pipe, selectors.EVENT_READ, self._read_stats, watch)
+
+    def _unregister(self, watch):
+        for pipe in watch.pipes():
+            self._unregister_pipe(pipe)
+
+    def _terminate(self, key, reason, on_reaped=None):
+        found = False
+        for watch in list(self._watches.values()):
+            if watch.key != key:
+                continue
+            found = True
+            if on_reaped:
+                watch.on_reaped.append(on_reaped)
+            if watch.kill_at is not None:
+                continue  # Already being stopped
+            if reason:
+                print(f"Terminating stream '{key}': {reason}")
+            _signal_group(watch.process, signal.SIGTERM)
+            watch.kill_at = time.monotonic() + self.terminate_grace
+        if on_reaped and not found:
+            on_reaped(key, None)
+
+    def _timeout(self):
+        if self._pending:
+            return 0
+        timeout = max(0.0, self._next_sweep - time.monotonic())
+        if self._exiting:
+            timeout = min(timeout, 0.1)  # Reap promptly once a child has closed its pipe
+        if self._timers:
+            timeout = min(timeout, max(0.0, self._timers[0][0] - time.monotonic()))
+        return timeout
+
+    def _run(self):
+        while True:
+            try:
+                for key, events in self._selector.select(self._timeout()):
+                    handler, obj = key.data
+                    handler(obj, events)
+                self._run_pending()
+                self._run_timers()
+                self._sweep()
+            except Exception as e:
+                print(f"Stream supervisor error: {e}")
+
+    def _drain_wakeup(self, _obj, _events):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self):
+        while self._pending:
+            callback, args = self._pending.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Stream supervisor callback error: {e}")
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self._loop_lag = now - timer.due
+            self._loop_lag_max = max(self._loop_lag_max, self._loop_lag)
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"Stream supervisor timer error: {e}")
+
+    def _read(self, watch, _events=None):
+        try:
+            chunk = os.read(watch.log_pipe.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except (OSError, ValueError):
+            chunk = b''
+
+        if not chunk:
+            watch.eof = True
+            self._exiting.add(watch)
+            self._unregister(watch)
+            if watch.buffer.strip():
+                self._emit_line(watch, watch.buffer)
+            watch.buffer = b''
+            return
+
+        watch.last_activity = time.monotonic()
+        # FFmpeg ends stats lines with \r and log lines with \n
+        lines = chunk.replace(b'\r', b'\n').split(b'\n')
+        lines[0] = watch.buffer + lines[0]
+        watch.buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._emit_line(watch, line)
+
+    def _read_progress(self, watch, _events=None):
+        try:
+            chunk = os.read(watch.progress_pipe.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except (OSError, ValueError):
+            chunk = b''
+
+        if not chunk:
+            self._unregister_pipe(watch.progress_pipe)
+            return
+
+        watch.last_activity = time.monotonic()
+        for block in watch.progress.feed(chunk):
+            if watch.egress is not None and block.get('total_size') is not None:
+                watch.egress.add(watch.last_activity, block['total_size'], self.egress_window)
+            try:
+                watch.on_progress(watch.key, block)
+            except Exception as e:
+                print(f"Error handling progress of stream '{watch.key}': {e}")
+
+    def _read_stats(self, watch, _events=None):
+        try:
+            chunk = os.read(watch.stats_pipe.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except (OSError, ValueError):
+            chunk = b''
+
+        if not chunk:
+            self._unregister_pipe(watch.stats_pipe)
+            return
+
+        lines = (watch.stats_buffer + chunk).split(b'\n')
+        watch.stats_buffer = lines.pop()
+        try:
+            watch.on_stats(watch.key, [line.decode('ascii', errors='replace') for line in lines if line])
+        except Exception as e:
+            print(f"Error handling encoder stats of stream '{watch.key}': {e}")
+
+    def _emit_line(self, watch, raw):
+        line = raw.decode('utf-8', errors='replace').strip()
+        watch.tail.append(line)
+        try:
+            watch.on_line(watch.key, line)
+        except Exception as e:
+            print(f"Error handling output of stream '{watch.key}': {e}")
+
+    # Relay internals
+
+    def _set_relay_source(self, key, pipe, role='primary'):
+        relay = self._relays.setdefault(key, _Relay(key))
+        old = relay.sources.pop(role, None)
+        if old is not None:
+            self._unregister_pipe(old.pipe)
+            self._close_pipe(old.pipe)
+        if pipe is None:
+            return
+        source = _RelaySource(role, pipe)
+        relay.sources[role] = source
+        self._register(pipe, selectors.EVENT_READ, self._read_relay, (relay, source))
+
+    def _set_relay_standby(self, key, pipe, failover):
+        relay = self._relays.setdefault(key, _Relay(key))
+        self._set_relay_source(key, pipe, role='standby')
+        if pipe is None:
+            relay.failover = None
+            if relay.active == 'standby' or relay.switch_to == 'standby':
+                relay.active, relay.switch_to = 'primary', None
+            return
+        first = relay.failover is None
+        relay.failover = failover
+        if first:
+            self._check_failover(relay)
+
+    def _add_sink(self, key, sink_key, pipe):
+        relay = self._relays.setdefault(key, _Relay(key))
+        old = relay.sinks.get(sink_key)
+        if old is not None:
+            self._drop_sink(relay, old)
+        os.set_blocking(pipe.fileno(), False)
+        relay.sinks[sink_key] = _Sink(sink_key, pipe)
+
+    def _remove_sink(self, key, sink_key):
+        relay = self._relays.get(key)
+        if relay is not None and sink_key in relay.sinks:
+            self._drop_sink(relay, relay.sinks[sink_key])
+
+    def _drop_sink(self, relay, sink):
+        if relay.sinks.get(sink.key) is sink:
+            del relay.sinks[sink.key]
+        if sink.writing:
+            self._unregister_pipe(sink.pipe)
+        self._close_pipe(sink.pipe)
+
+    def _close_relay(self, key):
+        relay = self._relays.pop(key, None)
+        if relay is None:
+            return
+        for source in list(relay.sources.values()):
+            self._unregister_pipe(source.pipe)
+            self._close_pipe(source.pipe)
+        for sink in list(relay.sinks.values()):
+            self._drop_sink(relay, sink)
+
+    def _read_relay(self, relay_source, _events=None):
+        relay, source = relay_source
+        try:
+            chunk = os.read(source.pipe.fileno(), 262144)
+        except BlockingIOError:
+            return
+        except (OSError, ValueError):
+            chunk = b''
+
+        if not chunk:
+            # Ingest ended; sinks stay attached for the restarted process
+            self._unregister_pipe(source.pipe)
+            self._close_pipe(source.pipe)
+            if relay.sources.get(source.role) is source:
+                del relay.sources[source.role]
+            return
+
+        now = time.monotonic()
+        stall_timeout = relay.failover['stall_timeout'] if relay.failover else self.tick
+        if source.last_data is None or now - source.last_data > stall_timeout:
+            source.flowing_since = now
+        source.last_data = now
+
+        # Only forward whole TS packets so a dropped backlog never splits one
+        data = source.remainder + chunk
+        cut = len(data) - len(data) % TS_PACKET_SIZE
+        source.remainder = data[cut:]
+        if not cut:
+            return
+        start = 0
+        if relay.switch_to == source.role:
+            # Enter the new source at a PAT so downstream demuxers pick up its tables
+            start = _find_pat(data, cut)
+            if start is None:
+                return
+            self._complete_switch(relay, now)
+        elif source.role != relay.active:
+            return  # Hot standby output is discarded until it is needed
+
+        relay.last_data = now
+        relay.bytes_in += cut - start
+        self._fan_out(relay, data[start:cut])
+
+    def _check_failover(self, relay):
+        if self._relays.get(relay.key) is not relay or relay.failover is None:
+            return
+        now = time.monotonic()
+        failover = relay.failover
+        primary = relay.sources.get('primary')
+        standby = relay.sources.get('standby')
+
+        def fresh(source):
+            return source is not None and source.last_data is not None and now - source.last_data <= failover['stall_timeout']
+
+        if relay.switch_to is not None:
+            if not fresh(relay.sources.get(relay.switch_to)):
+                relay.switch_to = None  # The target went quiet as well; re-evaluate
+        elif relay.active == 'primary' and not fresh(primary) and fresh(standby):
+            if primary is not None and primary.last_data is not None:
+                relay.switch_to, relay.switch_started = 'standby', primary.last_data
+            elif primary is None or now - primary.attached_at > failover['startup_grace']:
+                relay.switch_to, relay.switch_started = 'standby', now
+        elif relay.active == 'standby' and fresh(primary) and now - primary.flowing_since >= failover['switch_back_after']:
+            relay.switch_to, relay.switch_started = 'primary', now
+
+        # Sub-second stall detection needs a finer cadence than the sweep tick
+        self._push_timer(_Timer(now + failover['stall_timeout'] / 4, self._check_failover, (relay,)))
+
+    def _complete_switch(self, relay, now):
+        role, relay.switch_to = relay.switch_to, None
+        relay.active = role
+        latency_ms = round((now - relay.switch_started) * 1000, 1)
+        if role == 'standby':
+            relay.failovers += 1
+            relay.failover_latency_ms = latency_ms
+        on_switch = relay.failover and relay.failover['on_switch']
+        if on_switch:
+            try:
+                on_switch(relay.key, role, latency_ms)
+            except Exception as e:
+                print(f"Error handling input switch of '{relay.key}': {e}")
+
+    def _fan_out(self, relay, data):
+        for sink in list(relay.sinks.values()):
+            if sink.backlog:
+                self._queue(relay, sink, data)
+                continue
+            try:
+                written = os.write(sink.fd, data)
+            except BlockingIOError:
+                written = 0
+            except OSError:
+                self._drop_sink(relay, sink)  # Consumer exited; its watch reports why
+                continue
+            sink.bytes_written += written
+            if written < len(data):
+                self._queue(relay, sink, memoryview(data)[written:])
+
+    def _queue(self, relay, sink, data):
+        sink.backlog.append(data)
+        sink.backlog_bytes += len(data)
+        if sink.backlog_bytes > self.sink_backlog_limit:
+            # A slow consumer loses its queued data instead of stalling the other sinks.
+            # The head chunk may be partially written, so it is kept.
+            head = sink.backlog.popleft()
+            dropped = sink.backlog_bytes - len(head)
+            sink.backlog.clear()
+            sink.backlog.append(head)
+            sink.backlog_bytes = len(head)
+            sink.bytes_dropped += dropped
+        if not sink.writing:
+            self._register(sink.pipe, selectors.EVENT_WRITE, self._flush_sink, (relay, sink))
+            sink.writing = True
+
+    def _flush_sink(self, relay_sink, _events=None):
+        relay, sink = relay_sink
+        while sink.backlog:
+            data = sink.backlog[0]
+            try:
+                written = os.write(sink.fd, data)
+            except BlockingIOError:
+                return
+            except OSError:
+                self._drop_sink(relay, sink)
+                return
+            sink.bytes_written += written
+            sink.backlog_bytes -= written
+            if written < len(data):
+                sink.backlog[0] = memoryview(data)[written:]
+                return
+            sink.backlog.popleft()
+        self._unregister_pipe(sink.pipe)
+        sink.writing = False
+
+    # Reaping
+
+    def _sweep(self):
+        now = time.monotonic()
+        for watch in list(self._exiting):
+            returncode = watch.process.poll()
+            if returncode is not None:
+                self._reap(watch, returncode)
+
+        # Liveness, heartbeat and kill escalation are checked once per tick
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.tick
+        for watch in list(self._watches.values()):
+            returncode = watch.process.poll()
+            if returncode is not None:
+                self._reap(watch, returncode)
+                continue
+
+            if watch.kill_at is not None:
+                if now >= watch.kill_at:
+                    _signal_group(watch.process, signal.SIGKILL)
+                continue
+
+            idle = now - watch.last_activity
+            if not watch.eof and watch.heartbeat_timeout and idle > watch.heartbeat_timeout:
+                print(f"Stream '{watch.key}' appears dead - no activity for {idle:.1f}s")
+                watch.stalled = True
+                _signal_group(watch.process, signal.SIGTERM)
+                watch.kill_at = now + self.terminate_grace
+            elif watch.egress is not None and not watch.eof:
+                self._check_egress(watch, now)
+
+    def _check_egress(self, watch, now):
+        """Judge a process by the bytes it actually wrote, not by its log: FFmpeg
+        keeps logging (and may keep reporting progress) while a destination
+        has stopped taking data."""
+        egress = watch.egress
+        if egress.last_growth is None:
+            return  # No output yet; startup is covered by the heartbeat
+        kbps = egress.kbps()
+        idle = now - egress.last_growth
+        state = egress.state
+        if idle > self.egress_window:
+            state = 'stalled'
+            kbps = 0.0
+        elif egress.full(self.egress_window) and kbps is not None:
+            expected = egress.expected_kbps
+            state = 'degraded' if expected and kbps < expected * self.degraded_ratio else 'ok'
+            if state == 'ok' and egress.learn:
+                # Slow average of the healthy rate, so a sudden drop stands out
+                egress.expected_kbps = kbps if not expected else round(expected + (kbps - expected) * 0.05, 1)
+        if state == 'stalled' and egress.state != 'stalled':
+            egress.detect_ms = round(idle * 1000)
+        egress.state = state
+        try:
+            watch.on_egress(watch.key, {
+                'state': state, 'kbps': kbps, 'expected_kbps': egress.expected_kbps,
+                'window_s': self.egress_window, 'detect_ms': egress.detect_ms
+            })
+        except Exception as e:
+            print(f"Error handling throughput of stream '{watch.key}': {e}")
+        if state == 'stalled' and self.stall_restart_after and idle > self.egress_window + self.stall_restart_after:
+            print(f"Stream '{watch.key}' appears dead - no output written for {idle:.1f}s")
+            watch.stalled = True
+            _signal_group(watch.process, signal.SIGTERM)
+            watch.kill_at = now + self.terminate_grace
+
+    def _reap(self, watch, returncode):
+        # Drain whatever the child wrote before exiting
+        for _ in range(16):
+            if watch.eof:
+                break
+            self._read(watch)
+        self._unregister(watch)
+        self._exiting.discard(watch)
+        self._watches.pop(watch.process.pid, None)
+        for pipe in watch.pipes():
+            self._close_pipe(pipe)
+        try:
+            watch.on_exit(watch.key, watch.process, returncode, list(watch.tail), watch.stalled)
+        except Exception as e:
+            print(f"Error handling exit of stream '{watch.key}': {e}")
+        for callback in watch.on_reaped:
+            try:
+                callback(watch.key, returncode)
+            except Exception as e:
+                print(f"Error reporting stop of stream '{watch.key}': {e}")
+
+
+def _signal_group(process, sig):
+    """Signal the process group of a child started with start_new_session, so
+    anything FFmpeg spawned goes down with it."""
+    if process.poll() is not None:
+        return  # Reaped; the pid may belong to someone else by now
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+    except OSError:
+        try:
+            process.send_signal(sig)  # Not a group leader we may signal
+        except OSError:
+            pass
+
+
+def _find_pat(data, end):
+    """Offset of the first TS packet carrying the start of a PAT (PID 0), or None."""
+    for offset in range(0, end, TS_PACKET_SIZE):
+        if data[offset] == TS_SYNC_BYTE and data[offset + 1] & 0x5f == 0x40 and data[offset + 2] == 0:
+            return offset
+    return None
@@ -0,0 +1,134 @@
+"""Worker agent: runs FFmpeg processes for a controller on another host.
+
+Each agent wraps its own StreamManager and exposes it over a small HTTP API.
+The controller (main.py with WORKER_NODES set) places streams on agents and
+polls /status for load and stream views.
+
+    python worker_agent.py --port 9101 --node-id worker-1 --registry worker-1.db --max-streams 40 --egress-mbps 900
+
+Every request must carry "Authorization: Bearer <WORKER_TOKEN>". The agent
+refuses to start without WORKER_TOKEN unless --insecure is given, and listens
+on 127.0.0.1 unless --host says otherwise.
+
+FFmpeg children outlive a crashed agent, and by then the controller has
+started their streams on other agents. The registry is therefore required: a
+restarted agent reattaches to its children or kills them, and the controller
+stops any stream that has been moved elsewhere in the meantime.
+"""
+import argparse
+import hmac
+import json
+import os
+
+from flask import Flask, Response, abort, jsonify, request
+from resource_monitor import HostBudget
+from stream_manager import StreamManager
+from stream_registry import StreamRegistry
+
+# Keyword arguments of StreamManager.start_stream a controller may send
+START_FIELDS = ('stream_name', 'input_source', 'destination', 'stream_key', 'owner', 'source_name',
+                'srt_passphrase', 'srt_latency', 'fan_out', 'backup_input', 'backup_source_name',
+                'profile', 'force', 'rendition', 'outputs')
+REQUIRED_START_FIELDS = ('stream_name', 'input_source', 'destination', 'stream_key', 'owner')
+
+
+class _NoSocketIO:
+    """Agents have no browser clients; the controller polls their status instead."""
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+def create_app(manager, node_id, limits):
+    app = Flask(__name__)
+    token = os.environ.get('WORKER_TOKEN')
+
+    @app.before_request
+    def authenticate():
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+
+    @app.route('/status')
+    def status():
+        streams = sum(1 for view in manager.get_active_streams().values() if view['kind'] in ('stream', 'leg'))
+        host = manager.resources.host()
+        capacity = dict(limits, node=node_id, streams=streams, processes=manager.supervisor.stats()['children'],
+                        cpu_percent=host.get('cpu_percent', 0.0), egress_kbps=host.get('egress_kbps', 0.0))
+        # The snapshot's cached encoding is reused as is
+        body = '{"capacity":' + json.dumps(capacity) + ',"snapshot":' + manager.get_status_snapshot().text + '}'
+        return Response(body, content_type='application/json')
+
+    @app.route('/streams', methods=['POST'])
+    def start_stream():
+        spec = request.get_json(force=True, silent=True)
+        if not isinstance(spec, dict):
+            return jsonify({'success': False, 'message': 'Expected a JSON object'}), 400
+        unknown = sorted(set(spec) - set(START_FIELDS))
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown fields: {', '.join(unknown)}"}), 400
+        missing = [field for field in REQUIRED_START_FIELDS if field not in spec]
+        if missing:
+            return jsonify({'success': False, 'message': f"Missing fields: {', '.join(missing)}"}), 400
+        success = manager.start_stream(**spec)
+        if not success:
+            name = spec['stream_name']
+            return jsonify({'success': False, 'queued': manager.is_queued(name),
+                            'message': manager.admission_message(name)}), 409
+        return jsonify({'success': True})
+
+    @app.route('/streams/<path:stream_name>', methods=['DELETE'])
+    def stop_stream(stream_name):
+        success, message = manager.stop_stream(stream_name, 'admin', 'controller')
+        return jsonify({'success': success, 'message': message}), 200 if success else 404
+
+    @app.route('/streams/<path:stream_name>/history')
+    def stream_history(stream_name):
+        history = manager.get_stream_history(
+            stream_name, window=request.args.get('window', 900, type=int),
+            resolution=request.args.get('resolution', type=int)
+        )
+        if history is None:
+            return jsonify({'error': 'No history for this stream'}), 404
+        return jsonify(history)
+
+    @app.route('/streams/<path:stream_name>/log')
+    def stream_log(stream_name):
+        log = manager.get_stream_log(stream_name, lines=max(0, min(request.args.get('lines', 200, type=int), 1000)))
+        if log is None:
+            return jsonify({'error': 'No log for this stream'}), 404
+        return jsonify(log)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9101)
+    parser.add_argument('--node-id', default=os.uname().nodename)
+    parser.add_argument('--max-streams', type=int, default=50, help='streams this node may run')
+    parser.add_argument('--egress-mbps', type=float, default=1000, help='usable upstream bandwidth')
+    parser.add_argument('--max-cpu', type=float, default=85, help='CPU percent above which the node takes no new streams')
+    parser.add_argument('--registry', required=True,
+                        help='SQLite file to reattach to (or kill) FFmpeg children after an agent restart')
+    parser.add_argument('--runtime-dir', help='directory for FFmpeg FIFOs')
+    parser.add_argument('--insecure', action='store_true', help='serve without WORKER_TOKEN (trusted networks only)')
+    args = parser.parse_args()
+    if not os.environ.get('WORKER_TOKEN') and not args.insecure:
+        parser.error('WORKER_TOKEN is not set; set it (and the same on the controller) or pass --insecure')
+
+    # The controller places streams by headroom; the agent refuses what would still overrun it
+    manager = StreamManager(
+        _NoSocketIO(),
+        registry=StreamRegistry(args.registry),
+        runtime_dir=args.runtime_dir,
+        budget=HostBudget(max_streams=args.max_streams, cpu_percent=args.max_cpu, egress_mbps=args.egress_mbps)
+    )
+    limits = {'max_streams': args.max_streams, 'egress_limit_kbps': args.egress_mbps * 1000, 'max_cpu_percent': args.max_cpu}
+    app = create_app(manager, args.node_id, limits)
+    print(f"Worker agent '{args.node_id}' listening on {args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()